@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+import argparse
+import os
+import tempfile
+import time
+
+from its_cdktf_base.network.address_allocator import AddressAllocator
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure prefix allocation and overlap checks at fleet scale."
+    )
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--pool", default="10.0.0.0/8")
+    parser.add_argument("--prefixlen", type=int, default=26)
+    args = parser.parse_args(argv)
+
+    allocator = AddressAllocator(args.pool)
+    start = time.perf_counter()
+    for i in range(args.count):
+        allocator.allocate(f"customer-{i}", args.prefixlen)
+    elapsed = time.perf_counter() - start
+    print(
+        f"allocate: {args.count} x /{args.prefixlen} in {elapsed:.2f}s "
+        f"({elapsed / args.count * 1e6:.1f} us each)"
+    )
+
+    cidrs = list(allocator.allocations())
+    start = time.perf_counter()
+    for cidr in cidrs:
+        allocator.overlaps(cidr)
+    elapsed = time.perf_counter() - start
+    print(
+        f"overlaps: {len(cidrs)} checks in {elapsed:.2f}s "
+        f"({elapsed / len(cidrs) * 1e6:.1f} us each)"
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        ledger = os.path.join(directory, "ledger.json")
+        start = time.perf_counter()
+        allocator.save(ledger)
+        saved = time.perf_counter() - start
+        start = time.perf_counter()
+        AddressAllocator(args.pool, ledger=ledger)
+        loaded = time.perf_counter() - start
+    print(f"ledger: saved in {saved:.2f}s, loaded in {loaded:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
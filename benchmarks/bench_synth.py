@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# Synth benchmarks for the construct library, run with pytest-benchmark:
+#
+#   python -m pytest benchmarks/bench_synth.py --benchmark-autosave
+#   python -m pytest benchmarks/bench_synth.py --benchmark-compare \
+#       --benchmark-compare-fail=mean:25%
+#
+# Results are saved as JSON under .benchmarks/. Nothing here talks to Azure;
+# the stacks are only built and synthesized.
+import ipaddress
+
+import pytest
+from cdktf import Testing
+
+from benchmarks.import_time import TARGETS, cold_import_time
+from its_cdktf_base.compute.its_avd_base import ItsVirtualDesktopStack
+from its_cdktf_base.compute.session_hosts import SessionHostPool
+from its_cdktf_base.network.its_networking_stack_base import ItsNetworkingStackBase
+from its_cdktf_base.network.nsg_rules import Policy
+from its_cdktf_base.network.topology import (
+    DEFAULT_TOPOLOGY,
+    VPN_CLIENT_POOL,
+    NetworkTopology,
+    SubnetTier,
+)
+
+SIZES = [1, 10, 100, 1000]
+
+# Room for 1024 /24 tiers, with the last one kept for the gateway subnet
+ADDRESS_SPACE = ipaddress.ip_network("10.0.0.0/14")
+SUBNET_ID = (
+    "/subscriptions/00000000-0000-0000-0000-000000000000/resourceGroups/"
+    "its-networking-stack/providers/Microsoft.Network/virtualNetworks/its-vnet/"
+    "subnets/its-client-subnet"
+)
+
+
+def scaled_topology(subnets: int = 3, rules: int = 0) -> NetworkTopology:
+    # A topology with the given number of tiers and policies. Every policy
+    # allows its own source address and port, so none of them merge.
+    blocks = ADDRESS_SPACE.subnets(new_prefix=24)
+    tiers = tuple(
+        SubnetTier(name=f"tier{i}", cidr=str(next(blocks)), nat=i % 2 == 0)
+        for i in range(subnets)
+    )
+    policies = tuple(
+        Policy(
+            name=f"AllowBenchmark{i}",
+            sources=(f"172.16.{i // 256}.{i % 256}/32",),
+            destinations=(tiers[i % subnets].name,),
+            services=(f"Tcp/{10000 + i}",),
+        )
+        for i in range(rules)
+    )
+    return NetworkTopology(
+        address_space=(str(ADDRESS_SPACE),),
+        gateway_subnet_cidr=str(list(ADDRESS_SPACE.subnets(new_prefix=24))[-1]),
+        vpn_client_address_space=VPN_CLIENT_POOL,
+        tiers=tiers,
+        policies=policies,
+    )
+
+
+# (stack class, keyword arguments) per benchmark case
+CASES = {
+    "network-default": (ItsNetworkingStackBase, {"topology": DEFAULT_TOPOLOGY}),
+    "avd-default": (ItsVirtualDesktopStack, {"subnet_id": SUBNET_ID}),
+}
+for size in SIZES:
+    CASES[f"network-subnets-{size}"] = (
+        ItsNetworkingStackBase,
+        {"topology": scaled_topology(subnets=size)},
+    )
+    CASES[f"network-rules-{size}"] = (
+        ItsNetworkingStackBase,
+        {"topology": scaled_topology(rules=size)},
+    )
+    CASES[f"avd-hosts-{size}"] = (
+        ItsVirtualDesktopStack,
+        {"subnet_id": SUBNET_ID, "session_hosts": SessionHostPool(count=size)},
+    )
+
+
+def build(case: str):
+    stack_class, kwargs = CASES[case]
+    return stack_class(Testing.app(), case, **kwargs)
+
+
+def rounds(case: str) -> int:
+    # The largest cases take seconds per round
+    return 3 if case.endswith("-1000") else 10
+
+
+@pytest.mark.parametrize("target", ["ItsNetworkingStackBase", "ItsVirtualDesktopStack"])
+def test_cold_import(benchmark, target):
+    benchmark.group = "cold import"
+    benchmark.pedantic(cold_import_time, args=(TARGETS[target],), rounds=5)
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_construct_tree(benchmark, case):
+    benchmark.group = "construct tree"
+    benchmark.pedantic(build, args=(case,), rounds=rounds(case))
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_synth(benchmark, case):
+    benchmark.group = "Testing.synth"
+    synthesized = benchmark.pedantic(
+        Testing.synth,
+        setup=lambda: ((build(case),), {}),
+        rounds=rounds(case),
+    )
+    benchmark.extra_info["json_bytes"] = len(synthesized)
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_full_synth(benchmark, case):
+    benchmark.group = "Testing.full_synth"
+    benchmark.pedantic(
+        Testing.full_synth,
+        setup=lambda: ((build(case),), {}),
+        rounds=rounds(case),
+    )
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Each target is timed in a fresh interpreter so nothing is already cached
+TARGETS = {
+    "its_cdktf_base.network": "import its_cdktf_base.network",
+    "its_cdktf_base.compute": "import its_cdktf_base.compute",
+    "ItsNetworkingStackBase": "from its_cdktf_base.network import ItsNetworkingStackBase",
+    "ItsVirtualDesktopStack": "from its_cdktf_base.compute import ItsVirtualDesktopStack",
+}
+
+# The same imports with every provider module the stack binds loaded up front,
+# as they were before lazy_import. Constructing the stack loads them anyway, so
+# the difference is what an import saves, not what a synth saves.
+EAGER = """
+{statement}
+import importlib
+from its_cdktf_base import lazy_imports
+for name in lazy_imports.declared:
+    importlib.import_module(name)
+"""
+EAGER_TARGETS = {
+    f"{target} (eager)": EAGER.format(statement=TARGETS[target])
+    for target in ("ItsNetworkingStackBase", "ItsVirtualDesktopStack")
+}
+
+TIMER = """
+import time
+start = time.perf_counter()
+{statement}
+print(time.perf_counter() - start)
+"""
+
+
+def cold_import_time(statement: str) -> float:
+    result = subprocess.run(
+        [sys.executable, "-c", TIMER.format(statement=statement)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure cold import time of the its_cdktf_base packages."
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--eager",
+        action="store_true",
+        help="Also time the stack imports with their provider modules loaded up front",
+    )
+    parser.add_argument("targets", nargs="*", default=list(TARGETS))
+    args = parser.parse_args(argv)
+
+    targets = dict(TARGETS, **EAGER_TARGETS)
+    if args.eager and args.targets == list(TARGETS):
+        args.targets = list(targets)
+    for target in args.targets:
+        timings = [cold_import_time(targets[target]) for _ in range(args.runs)]
+        print(
+            f"{target:<34} min {min(timings) * 1000:8.1f} ms  "
+            f"median {statistics.median(timings) * 1000:8.1f} ms  "
+            f"({args.runs} runs)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+from its_cdktf_base.lazy_imports import lazy_attributes
+
+# Constructs are resolved on first access so importing the package stays cheap
+__getattr__ = lazy_attributes(
+    __name__,
+    {
+        "ItsNetworkingStackBase": ".network.its_networking_stack_base",
+        "ItsNetworkingStacks": ".network.its_networking_stacks",
+        "ItsHubStack": ".network.its_hub_spoke_stacks",
+        "ItsSpokeStack": ".network.its_hub_spoke_stacks",
+        "HubConfig": ".network.hub",
+        "ItsVirtualDesktopStack": ".compute.its_avd_base",
+        "RegionConfig": ".region",
+        "RegionalStacks": ".region",
+    },
+)
@@ -0,0 +1,7 @@
+from its_cdktf_base.lazy_imports import lazy_attributes
+
+# Constructs are resolved on first access so importing the package stays cheap
+__getattr__ = lazy_attributes(
+    __name__,
+    {"ItsVirtualDesktopStack": ".its_avd_base"},
+)
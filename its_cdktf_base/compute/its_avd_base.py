@@ -1,72 +1,69 @@
 #!/usr/bin/env python
 from constructs import Construct
-from cdktf import App, TerraformStack, AzurermBackend
-from imports.azurerm import (
-    provider,
-    resource_group,
-    virtual_desktop_workspace,
-    virtual_desktop_host_pool,
-    virtual_desktop_application_group,
-    network_interface,
-    windows_virtual_machine,
-    virtual_machine_extension,
+from cdktf import App, TerraformStack, TerraformVariable, Fn
+from its_cdktf_base.compute.session_hosts import (
+    AVD_DSC_CONFIGURATION,
+    AVD_DSC_MODULES_URL,
+    DEFAULT_SESSION_HOSTS,
+    SessionHostPool,
 )
+from its_cdktf_base.deploy.backend import its_backend
+from its_cdktf_base.lazy_imports import lazy_import
+from its_cdktf_base.references import instance_reference, moved_to_first_instance
+from its_cdktf_base.registry import ProviderRegistry
+from its_cdktf_base.region import DEFAULT_REGION, RegionConfig, region_config
+
+# Provider bindings are loaded on first use to keep module import cheap
+resource_group = lazy_import("imports.azurerm.resource_group")
+virtual_desktop_workspace = lazy_import("imports.azurerm.virtual_desktop_workspace")
+virtual_desktop_host_pool = lazy_import("imports.azurerm.virtual_desktop_host_pool")
+virtual_desktop_host_pool_registration_info = lazy_import(
+    "imports.azurerm.virtual_desktop_host_pool_registration_info"
+)
+virtual_desktop_application_group = lazy_import(
+    "imports.azurerm.virtual_desktop_application_group"
+)
+network_interface = lazy_import("imports.azurerm.network_interface")
+windows_virtual_machine = lazy_import("imports.azurerm.windows_virtual_machine")
+virtual_machine_extension = lazy_import("imports.azurerm.virtual_machine_extension")
+time_provider = lazy_import("imports.time.provider")
+rotating = lazy_import("imports.time.rotating")
+
+# Days a host pool registration token is valid. A new token is issued on the
+# first apply after it expires.
+REGISTRATION_TOKEN_DAYS = 14
 
 
 class ItsVirtualDesktopStack(TerraformStack):
-    def __init__(self, scope: Construct, id: str):
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        subnet_id: str,
+        session_hosts: SessionHostPool = DEFAULT_SESSION_HOSTS,
+        region: RegionConfig = DEFAULT_REGION,
+        customer: str = None,
+    ):
         super().__init__(scope, id)
 
+        # Keep state in the customer's bootstrapped storage, local otherwise
+        if customer:
+            its_backend(self, customer)
+
+        # Accept plain data, e.g. from a customer inventory file
+        if isinstance(session_hosts, dict):
+            session_hosts = SessionHostPool.from_dict(session_hosts)
+        region = region_config(region)
+
         # Initialize the Azure provider
-        provider.AzurermProvider(self, "azure", features={})
+        ProviderRegistry.of(self).provider(self)
 
         # Create resource group for the Azure Virtual Desktop resources
         avd_resource_group = resource_group.ResourceGroup(
             self,
             "azure-virtual-desktop",
-            name="azure-virtual-desktop",
-            location="westus2",
-        )
-
-        # Create a virtual network interface for virtual machine
-        avd_vm_nic = network_interface.NetworkInterface(
-            self,
-            "avd-vm-nic-id",
-            name="avd-nic",
-            location="westus2",
-            resource_group_name=avd_resource_group.name,
-            ip_configuration=[
-                {
-                    "name": "avd-ip-config",
-                    "subnetId": avd_virtual_subnet.id,
-                    "privateIpAddressAllocation": "Dynamic",  # why no snake case here my guy?
-                }
-            ],
-        )
-
-        # Loop through vm_count and create a windows virtual machine
-        avd_windows_vm = windows_virtual_machine.WindowsVirtualMachine(
-            self,
-            "windows-vm",
-            name=f"azure-virtual-desktop-vm",
-            computer_name="mason-avd",
-            location="westus2",
-            resource_group_name=avd_resource_group.name,
-            size="Standard_D2s_v3",
-            os_disk={
-                "storage_account_type": "StandardSSD_LRS",
-                "disk_size_gb": 128,
-                "caching": "ReadWrite",
-            },
-            network_interface_ids=[avd_vm_nic.id],
-            source_image_reference={
-                "publisher": "MicrosoftWindowsDesktop",
-                "offer": "windows-11",
-                "sku": "win11-21h2-pro",
-                "version": "22000.2176.230707",
-            },
-            admin_username="Tom",
-            admin_password="Bombadil!",  # I know this is bad, this is a proof of concept
+            name=region.resource_group_name("azure-virtual-desktop"),
+            location=region.location,
         )
 
         # Create an Azure Virtual Desktop Workspace
@@ -74,7 +71,7 @@ class ItsVirtualDesktopStack(TerraformStack):
             self,
             "workspace",
             name="avd-workspace",
-            location="westus2",
+            location=region.location,
             resource_group_name=avd_resource_group.name,
         )
 
@@ -83,7 +80,7 @@ class ItsVirtualDesktopStack(TerraformStack):
             self,
             "avd-host-pool",
             name="avd-host-pool",
-            location="westus2",
+            location=region.location,
             resource_group_name=avd_resource_group.name,
             friendly_name="Virtual Desktop Host",
             type="Personal",
@@ -100,26 +97,117 @@ class ItsVirtualDesktopStack(TerraformStack):
                 name="avd-application-group",
                 type="Desktop",
                 default_desktop_display_name="azure-vd",
-                location="westus2",
+                location=region.location,
                 resource_group_name=avd_resource_group.name,
                 host_pool_id=avd_host_pool.id,
                 friendly_name="AVD Application Group",
             )
         )
 
+        # Create a registration token so new session hosts can join the host
+        # pool. Its expiry comes from a time_rotating resource, so plans show no
+        # diff until the token has expired.
+        time_provider.TimeProvider(self, "time")
+        avd_registration_rotation = rotating.Rotating(
+            self,
+            "avd-registration-rotation",
+            rotation_days=REGISTRATION_TOKEN_DAYS,
+        )
+        avd_registration_info = virtual_desktop_host_pool_registration_info.VirtualDesktopHostPoolRegistrationInfo(
+            self,
+            "avd-registration-info",
+            hostpool_id=avd_host_pool.id,
+            expiration_date=avd_registration_rotation.rotation_rfc3339,
+        )
+
+        # Create one network interface per session host
+        avd_vm_nic = network_interface.NetworkInterface(
+            self,
+            "avd-vm-nic-id",
+            count=session_hosts.count,
+            name=session_hosts.host_name("nic"),
+            location=region.location,
+            resource_group_name=avd_resource_group.name,
+            ip_configuration=[
+                network_interface.NetworkInterfaceIpConfiguration(
+                    name="avd-ip-config",
+                    subnet_id=subnet_id,
+                    private_ip_address_allocation="Dynamic",
+                )
+            ],
+        )
+
+        # The local admin password is supplied at plan time, e.g. from a key
+        # vault secret through TF_VAR_session_host_admin_password, and is
+        # never written to the synthesized JSON
+        admin_password = TerraformVariable(
+            self,
+            "session_host_admin_password",
+            type="string",
+            sensitive=True,
+            nullable=False,
+            description="Local administrator password of the AVD session hosts",
+        )
 
-app = App()
-stack = ItsVirtualDesktopStack(app, "its_azure_vd")
-AzurermBackend(
-    stack,
-    resource_group_name="",
-    storage_account_name="",
-    container_name="",
-    key="",
-)
+        # Create the session host virtual machines, one per count index
+        avd_windows_vm = windows_virtual_machine.WindowsVirtualMachine(
+            self,
+            "windows-vm",
+            count=session_hosts.count,
+            name=session_hosts.host_name("vm"),
+            computer_name=session_hosts.host_name("computer"),
+            location=region.location,
+            resource_group_name=avd_resource_group.name,
+            size=session_hosts.size,
+            os_disk=session_hosts.os_disk(),
+            network_interface_ids=[instance_reference(avd_vm_nic, "count.index", "id")],
+            source_image_reference=session_hosts.image.source_image_reference(),
+            admin_username="Tom",
+            admin_password=admin_password.string_value,
+        )
+
+        # Install the AVD agent with DSC and register each host to the host pool
+        avd_host_registration = virtual_machine_extension.VirtualMachineExtension(
+            self,
+            "avd-host-registration",
+            count=session_hosts.count,
+            name="avd-dsc-registration",
+            virtual_machine_id=instance_reference(avd_windows_vm, "count.index", "id"),
+            publisher="Microsoft.Powershell",
+            type="DSC",
+            type_handler_version="2.73",
+            auto_upgrade_minor_version=True,
+            settings=Fn.jsonencode(
+                {
+                    "modulesUrl": AVD_DSC_MODULES_URL,
+                    "configurationFunction": AVD_DSC_CONFIGURATION,
+                    "properties": {"HostPoolName": avd_host_pool.name},
+                }
+            ),
+            protected_settings=Fn.jsonencode(
+                {"properties": {"registrationInfoToken": avd_registration_info.token}}
+            ),
+            # The token rotates on every apply; only new hosts need the current one
+            lifecycle={"ignore_changes": ["protected_settings"]},
+        )
+
+        # Stacks deployed before the pool used count have a single NIC and VM
+        # at the unindexed addresses; they become session host 0. They are only
+        # kept, not replaced, with legacy_first_host and the old admin password.
+        moved_to_first_instance(self, avd_vm_nic, avd_windows_vm)
+
+
+if __name__ == "__main__":
+    import os
+
+    from its_cdktf_base.network.its_networking_stacks import ItsNetworkingStacks
 
-app.synth()
+    # ITS_CUSTOMER selects the customer's remote state, local state otherwise
+    customer = os.environ.get("ITS_CUSTOMER")
+    app = App()
+    network = ItsNetworkingStacks(app, "its_networking", customer=customer)
+    stack = ItsVirtualDesktopStack(
+        app, "its_azure_vd", subnet_id=network.subnet_id("client"), customer=customer
+    )
 
-# TODO
-# Need to completely refactor AVD referencing existing networking stack
-# Fix the AzurermBackend
+    app.synth()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+from dataclasses import dataclass
+
+from its_cdktf_base.interning import cached_struct, intern
+from its_cdktf_base.lazy_imports import lazy_import
+
+# Provider bindings are loaded on first use to keep module import cheap
+windows_virtual_machine = lazy_import("imports.azurerm.windows_virtual_machine")
+
+# DSC configuration that installs the AVD agent and registers the host
+AVD_DSC_MODULES_URL = (
+    "https://wvdportalstorageblob.blob.core.windows.net/galleryartifacts/"
+    "Configuration_09-08-2022.zip"
+)
+AVD_DSC_CONFIGURATION = "Configuration.ps1\\AddSessionHost"
+
+# Names of the single session host deployed before pools used count. All of
+# them force a new VM or NIC when they change, so a pool with
+# legacy_first_host keeps them for host 0.
+LEGACY_HOST_NAMES = {
+    "vm": "azure-virtual-desktop-vm",
+    "computer": "mason-avd",
+    "nic": "avd-nic",
+}
+
+
+@dataclass(frozen=True, slots=True)
+class SessionHostImage:
+    publisher: str = "MicrosoftWindowsDesktop"
+    offer: str = "windows-11"
+    sku: str = "win11-21h2-pro"
+    version: str = "22000.2176.230707"
+
+    @cached_struct
+    def source_image_reference(self):
+        return windows_virtual_machine.WindowsVirtualMachineSourceImageReference(
+            publisher=self.publisher,
+            offer=self.offer,
+            sku=self.sku,
+            version=self.version,
+        )
+
+
+DEFAULT_IMAGE = intern(SessionHostImage())
+
+
+@dataclass(frozen=True, slots=True)
+class SessionHostPool:
+    # Hosts are created with Terraform count, so the pool size only changes
+    # the count value and not the number of constructs
+    count: int = 1
+    size: str = "Standard_D2s_v3"
+    image: SessionHostImage = DEFAULT_IMAGE
+    name_prefix: str = "avd-host"
+    os_disk_type: str = "StandardSSD_LRS"
+    os_disk_size_gb: int = 128
+    legacy_first_host: bool = False
+
+    @classmethod
+    def from_dict(cls, spec: dict):
+        # Build a pool from plain data, e.g. a customer inventory entry
+        image = intern(SessionHostImage(**spec.get("image", {})))
+        return intern(cls(**dict(spec, image=image)))
+
+    def __post_init__(self):
+        # Windows computer names are limited to 15 characters
+        if len(f"{self.name_prefix}-{self.count - 1}") > 15:
+            raise ValueError(
+                f"Session host names from prefix {self.name_prefix!r} exceed "
+                f"15 characters at {self.count} hosts"
+            )
+
+    def host_name(self, kind: str) -> str:
+        # Name of the host at count.index: "vm", "computer" or "nic"
+        suffix = "-nic" if kind == "nic" else ""
+        if not self.legacy_first_host:
+            return f"{self.name_prefix}{suffix}-${{count.index}}"
+        return (
+            f'${{count.index == 0 ? "{LEGACY_HOST_NAMES[kind]}" : '
+            f'format("{self.name_prefix}{suffix}-%d", count.index)}}'
+        )
+
+    @cached_struct
+    def os_disk(self):
+        return windows_virtual_machine.WindowsVirtualMachineOsDisk(
+            storage_account_type=self.os_disk_type,
+            disk_size_gb=self.os_disk_size_gb,
+            caching="ReadWrite",
+        )
+
+
+DEFAULT_SESSION_HOSTS = intern(SessionHostPool())
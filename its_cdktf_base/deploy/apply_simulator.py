@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+import argparse
+import heapq
+import json
+import os
+
+from its_cdktf_base.synth.dependency_graph import (
+    DEFAULT_DURATIONS,
+    DependencyGraph,
+    duration,
+    resources,
+)
+
+# terraform apply -parallelism default
+DEFAULT_PARALLELISM = 10
+
+# Seconds of terraform init and refresh before a stack starts applying
+STACK_OVERHEAD = 30
+
+
+def instance_addresses(address: str, body: dict) -> list:
+    # One address per resource instance. Literal for_each maps and counts are
+    # expanded; an expression whose size is only known at plan time counts as
+    # a single instance.
+    for_each = body.get("for_each")
+    if isinstance(for_each, dict):
+        return [f'{address}["{key}"]' for key in for_each]
+    if isinstance(for_each, list):
+        return [f'{address}["{key}"]' for key in for_each]
+    count = body.get("count")
+    if isinstance(count, int):
+        return [f"{address}[{index}]" for index in range(count)]
+    return [address]
+
+
+class Simulation:
+    # Result of one simulated apply: start and finish time per instance, and
+    # for every instance what it was last waiting on, a dependency or a free
+    # parallelism slot
+    def __init__(self, parallelism: int, times: dict, causes: dict):
+        self.parallelism = parallelism
+        self.times = times
+        self.causes = causes
+
+    @property
+    def wall_time(self) -> float:
+        return max((finish for _, finish in self.times.values()), default=0)
+
+    def peak(self) -> int:
+        # Most instances running at once
+        events = sorted(
+            [(start, 1) for start, _ in self.times.values()]
+            + [(finish, -1) for _, finish in self.times.values()]
+        )
+        running = peak = 0
+        for _, change in events:
+            running += change
+            peak = max(peak, running)
+        return peak
+
+    def critical_path(self) -> list:
+        # (instance, cause) from the first instance to the last to finish
+        if not self.times:
+            return []
+        instance = max(self.times, key=lambda i: (self.times[i][1], i))
+        path = []
+        while instance is not None:
+            cause, previous = self.causes[instance]
+            path.append((instance, cause))
+            instance = previous
+        return list(reversed(path))
+
+    def report(
+        self, name: str, unit: str = "resource instances", limit: str = "-parallelism"
+    ) -> str:
+        lines = [
+            f"{name}: {len(self.times)} {unit}, {limit} {self.parallelism}: "
+            f"~{_minutes(self.wall_time)}, peak {self.peak()} running"
+        ]
+        for instance, cause in self.critical_path():
+            start, finish = self.times[instance]
+            waited = "" if cause != "slot" else " (waited for a parallelism slot)"
+            lines.append(f"  {start:>7.0f}s +{finish - start:<5.0f} {instance}{waited}")
+        return "\n".join(lines)
+
+
+def simulate(
+    config: dict, parallelism: int = DEFAULT_PARALLELISM, durations: dict = None
+) -> Simulation:
+    # Replay terraform apply over a synthesized config, creating every resource
+    durations = DEFAULT_DURATIONS if durations is None else durations
+    bodies = resources(config)
+    return walk(
+        DependencyGraph.from_config(config).edges(),
+        {
+            address: instance_addresses(address, body)
+            for address, body in bodies.items()
+        },
+        {address: duration(address, durations) for address in bodies},
+        parallelism,
+    )
+
+
+def walk(edges: dict, instances: dict, seconds: dict, parallelism: int) -> Simulation:
+    # Replay terraform's graph walk: an instance is ready once every instance
+    # of the nodes it depends on has finished, and at most `parallelism`
+    # instances run at a time. Ready instances take free slots in the order
+    # they became ready.
+    dependents = {node: [] for node in edges}
+    waiting = {}
+    for node, predecessors in edges.items():
+        waiting[node] = len(predecessors)
+        for predecessor in predecessors:
+            dependents[predecessor].append(node)
+    remaining = {node: len(instances[node]) for node in edges}
+
+    times = {}
+    causes = {}
+    ready = []
+    running = []
+    order = 0
+
+    def release(node, now, cause):
+        # Queue the instances of a node whose dependencies have all finished; a
+        # node without instances (count = 0) finishes on the spot
+        nonlocal order
+        for instance in instances[node]:
+            heapq.heappush(ready, (now, order, instance, node))
+            causes[instance] = cause
+            order += 1
+        if not instances[node]:
+            finished(node, now, cause[1])
+
+    def finished(node, now, instance):
+        for dependent in dependents[node]:
+            waiting[dependent] -= 1
+            if not waiting[dependent]:
+                release(dependent, now, ("dependency", instance))
+
+    for node in sorted(edges):
+        if not waiting[node]:
+            release(node, 0, ("start", None))
+
+    now = 0
+    freed_by = None
+    while ready or running:
+        while ready and len(running) < parallelism:
+            ready_at, _, instance, node = heapq.heappop(ready)
+            start = max(now, ready_at)
+            if start > ready_at:
+                causes[instance] = ("slot", freed_by)
+            times[instance] = (start, start + seconds[node])
+            heapq.heappush(running, (start + seconds[node], instance, node))
+        while running and not (ready and len(running) < parallelism):
+            now, freed_by, node = heapq.heappop(running)
+            remaining[node] -= 1
+            if not remaining[node]:
+                finished(node, now, freed_by)
+
+    blocked = sorted(node for node in edges if waiting[node])
+    if blocked:
+        raise ValueError(f"Dependency cycle through {blocked}")
+    return Simulation(parallelism, times, causes)
+
+
+def simulate_app(
+    outdir: str,
+    parallelism: int = DEFAULT_PARALLELISM,
+    max_parallel: int = 4,
+    durations: dict = None,
+) -> tuple:
+    # Simulate every stack of a cdktf.out, then schedule the stacks the way
+    # the deploy orchestrator does: after their dependencies, at most
+    # max_parallel at a time. Returns the simulation of every stack and the
+    # simulation of the stacks themselves.
+    with open(os.path.join(outdir, "manifest.json")) as f:
+        manifest = json.load(f)
+    simulations = {}
+    dependencies = {}
+    for name, stack in manifest["stacks"].items():
+        with open(os.path.join(outdir, stack["synthesizedStackPath"])) as f:
+            simulations[name] = simulate(json.load(f), parallelism, durations)
+        dependencies[name] = set(stack.get("dependencies", []))
+
+    stacks = walk(
+        dependencies,
+        {name: [name] for name in simulations},
+        {
+            name: STACK_OVERHEAD + simulation.wall_time
+            for name, simulation in simulations.items()
+        },
+        max_parallel,
+    )
+    return simulations, stacks
+
+
+def _minutes(seconds: float) -> str:
+    return f"{seconds / 60:.1f} min"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Estimate how long terraform apply takes from synthesized stacks."
+    )
+    parser.add_argument("path", help="A cdk.tf.json or a cdktf.out directory")
+    parser.add_argument(
+        "--parallelism",
+        type=int,
+        nargs="+",
+        default=[DEFAULT_PARALLELISM],
+        help="terraform -parallelism values to compare (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-parallel",
+        type=int,
+        default=4,
+        help="Stacks applied at once for a cdktf.out directory",
+    )
+    parser.add_argument(
+        "--durations", help="JSON file of seconds per resource type to override"
+    )
+    args = parser.parse_args(argv)
+
+    durations = dict(DEFAULT_DURATIONS)
+    if args.durations:
+        with open(args.durations) as f:
+            durations.update(json.load(f))
+
+    for parallelism in args.parallelism:
+        if os.path.isdir(args.path):
+            simulations, stacks = simulate_app(
+                args.path, parallelism, args.max_parallel, durations
+            )
+            for name, simulation in simulations.items():
+                print(simulation.report(name))
+            print(stacks.report(args.path, "stacks", "--max-parallel"))
+        else:
+            with open(args.path) as f:
+                config = json.load(f)
+            print(simulate(config, parallelism, durations).report(args.path))
+
+
+if __name__ == "__main__":
+    main()
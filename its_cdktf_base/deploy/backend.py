@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+import re
+from dataclasses import dataclass
+
+# Naming of the state storage created by bin/bootstrap_customer_account.sh
+RESOURCE_GROUP_NAME = "tfstate-{customer}"
+STORAGE_ACCOUNT_NAME = "tfstate{customer}"
+CONTAINER_NAME = "tfstate-{customer}"
+
+# Storage account names are 3-24 lowercase letters and digits
+CUSTOMER = re.compile(r"^[a-z0-9]{1,17}$")
+
+
+@dataclass(frozen=True)
+class StateLocation:
+    # Where a customer's Terraform state lives. Every stack gets its own key
+    # in the customer's container, so stacks lock and apply independently.
+    resource_group_name: str
+    storage_account_name: str
+    container_name: str
+
+    @classmethod
+    def for_customer(cls, customer: str):
+        if not CUSTOMER.match(customer):
+            raise ValueError(
+                f"Customer {customer!r} must be 1-17 lowercase letters or digits "
+                f"to form the storage account name {STORAGE_ACCOUNT_NAME!r}"
+            )
+        return cls(
+            resource_group_name=RESOURCE_GROUP_NAME.format(customer=customer),
+            storage_account_name=STORAGE_ACCOUNT_NAME.format(customer=customer),
+            container_name=CONTAINER_NAME.format(customer=customer),
+        )
+
+    def key(self, stack_id: str) -> str:
+        return f"{stack_id}.tfstate"
+
+
+def its_backend(stack, customer: str):
+    # Configure the azurerm backend of a stack from the customer's bootstrap
+    # naming, keyed by the stack id
+    from cdktf import AzurermBackend
+
+    location = StateLocation.for_customer(customer)
+    return AzurermBackend(
+        stack,
+        resource_group_name=location.resource_group_name,
+        storage_account_name=location.storage_account_name,
+        container_name=location.container_name,
+        key=location.key(stack.node.id),
+    )
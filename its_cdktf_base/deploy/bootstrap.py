@@ -0,0 +1,693 @@
+#!/usr/bin/env python
+import argparse
+import asyncio
+import base64
+import json
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+
+from its_cdktf_base.deploy.backend import StateLocation
+
+SERVICE_PRINCIPAL_NAME = "its-cdktf-sp"
+CONTRIBUTOR_ROLE = "b24988ac-6180-42a0-ab88-20f7382dd24c"
+
+# Lets whoever runs the bootstrap write the principal's secret into an RBAC
+# vault
+SECRETS_OFFICER_ROLE = "b86a8fe4-44ce-4948-aee5-eccb2c155cd7"
+
+# Seconds to wait for a new role assignment to reach the vault's data plane
+RBAC_PROPAGATION_TIMEOUT = 300
+
+# Key vault names are global and at most 24 characters, so unlike the shell
+# script every customer gets its own vault
+KEY_VAULT_NAME = "its-sp-{customer}"
+
+
+@dataclass(frozen=True)
+class Customer:
+    name: str
+    subscription_id: str
+    location: str = "westus2"
+
+    @property
+    def state(self) -> StateLocation:
+        return StateLocation.for_customer(self.name)
+
+    @property
+    def key_vault_name(self) -> str:
+        return KEY_VAULT_NAME.format(customer=self.name)
+
+
+def key_vault_scope(subscription: str, group: str, name: str) -> str:
+    return (
+        f"/subscriptions/{subscription}/resourceGroups/{group}"
+        f"/providers/Microsoft.KeyVault/vaults/{name}"
+    )
+
+
+def load_customers(path: str) -> list:
+    # The customer inventory used by the synth driver, where each entry also
+    # names its subscription: [{"customer": "abc", "subscription_id": "..."}]
+    with open(path) as f:
+        inventory = json.load(f)
+    return [
+        Customer(
+            name=entry["customer"],
+            subscription_id=entry["subscription_id"],
+            location=entry.get("location", "westus2"),
+        )
+        for entry in inventory
+    ]
+
+
+class InMemoryClient:
+    # Stand-in for Azure that keeps resources in dictionaries, for tests and
+    # dry runs. latency simulates the round-trip of every call. Vaults use
+    # RBAC like the real ones: secrets can only be read or written once the
+    # caller holds Key Vault Secrets Officer on the vault, and a new
+    # assignment takes propagation_checks access checks to show up.
+    def __init__(self, latency: float = 0.0, propagation_checks: int = 0):
+        self.latency = latency
+        self.propagation_checks = propagation_checks
+        self.resources = {}
+        self.deleted_vaults = {}
+        self.calls = []
+        self._pending = {}
+
+    async def _call(self, operation: str, key: tuple, value=None):
+        self.calls.append((operation, key))
+        await asyncio.sleep(self.latency)
+        if operation in ("get", "check"):
+            return self.resources.get(key)
+        self.resources[key] = value
+        return value
+
+    async def get_resource_group(self, subscription, name):
+        return await self._call("get", ("group", subscription, name))
+
+    async def create_resource_group(self, subscription, name, location):
+        return await self._call(
+            "create", ("group", subscription, name), {"location": location}
+        )
+
+    async def get_storage_account(self, subscription, group, name):
+        return await self._call("get", ("account", subscription, name))
+
+    async def create_storage_account(self, subscription, group, name, location):
+        return await self._call(
+            "create", ("account", subscription, name), {"group": group}
+        )
+
+    async def get_container(self, subscription, group, account, name):
+        return await self._call("get", ("container", subscription, account, name))
+
+    async def create_container(self, subscription, group, account, name):
+        return await self._call(
+            "create", ("container", subscription, account, name), {}
+        )
+
+    async def get_service_principal(self, name):
+        return await self._call("get", ("principal", name))
+
+    async def create_service_principal(self, name):
+        principal = {"app_id": str(uuid.uuid4()), "object_id": str(uuid.uuid4())}
+        return await self._call("create", ("principal", name), principal)
+
+    async def get_caller(self):
+        return {"object_id": "caller", "principal_type": "User"}
+
+    async def get_role_assignment(self, subscription, principal, role, scope=None):
+        return await self._call(
+            "get", ("role", scope or subscription, principal["object_id"], role)
+        )
+
+    async def create_role_assignment(self, subscription, principal, role, scope=None):
+        key = ("role", scope or subscription, principal["object_id"], role)
+        self._pending[key] = self.propagation_checks
+        return await self._call("create", key, {})
+
+    async def add_password(self, principal):
+        return await self._call(
+            "create", ("password", principal["app_id"], uuid.uuid4().hex), "secret"
+        )
+
+    async def get_key_vault(self, subscription, group, name):
+        return await self._call("get", ("vault", name))
+
+    async def create_key_vault(self, subscription, group, name, location):
+        return await self._call(
+            "create", ("vault", name), {"subscription": subscription, "group": group}
+        )
+
+    async def get_deleted_key_vault(self, subscription, name, location):
+        await self._call("get", ("deleted-vault", name))
+        return self.deleted_vaults.get(name)
+
+    async def recover_key_vault(self, subscription, group, name, location):
+        deleted = self.deleted_vaults.pop(name)
+        for secret, value in deleted.get("secrets", {}).items():
+            self.resources[("secret", name, secret)] = value
+        return await self._call(
+            "recover", ("vault", name), {"subscription": subscription, "group": group}
+        )
+
+    def _officer(self, vault) -> tuple:
+        record = self.resources[("vault", vault)]
+        scope = key_vault_scope(record["subscription"], record["group"], vault)
+        return ("role", scope, "caller", SECRETS_OFFICER_ROLE)
+
+    def _authorized(self, vault) -> bool:
+        key = self._officer(vault)
+        return key in self.resources and not self._pending.get(key)
+
+    async def wait_for_secret_access(self, vault, timeout=RBAC_PROPAGATION_TIMEOUT):
+        while not self._authorized(vault):
+            key = self._officer(vault)
+            if key not in self.resources:
+                raise PermissionError(f"403 Forbidden on {vault}")
+            self._pending[key] -= 1
+            await self._call("check", ("vault-access", vault))
+
+    async def get_secret(self, vault, name):
+        if not self._authorized(vault):
+            raise PermissionError(f"403 Forbidden on {vault}")
+        return await self._call("get", ("secret", vault, name))
+
+    async def set_secret(self, vault, name, value):
+        if not self._authorized(vault):
+            raise PermissionError(f"403 Forbidden on {vault}")
+        return await self._call("create", ("secret", vault, name), value)
+
+    async def close(self):
+        pass
+
+
+class AzureClient:
+    # The client layer against Azure itself: the async management SDKs for
+    # resource groups, storage and key vaults, and Microsoft Graph for the
+    # service principal. One credential and one client per subscription are
+    # shared by every customer.
+    def __init__(self, credential=None):
+        if credential is None:
+            from azure.identity.aio import DefaultAzureCredential
+
+            credential = DefaultAzureCredential()
+        self.credential = credential
+        self._clients = {}
+
+    def _client(self, kind: str, scope: str):
+        # scope is the subscription id, or the vault name for secrets
+        if (kind, scope) not in self._clients:
+            if kind == "resource":
+                from azure.mgmt.resource.resources.aio import ResourceManagementClient
+
+                client = ResourceManagementClient(self.credential, scope)
+            elif kind == "storage":
+                from azure.mgmt.storage.aio import StorageManagementClient
+
+                client = StorageManagementClient(self.credential, scope)
+            elif kind == "keyvault":
+                from azure.mgmt.keyvault.aio import KeyVaultManagementClient
+
+                client = KeyVaultManagementClient(self.credential, scope)
+            elif kind == "authorization":
+                from azure.mgmt.authorization.aio import AuthorizationManagementClient
+
+                client = AuthorizationManagementClient(self.credential, scope)
+            elif kind == "subscription":
+                from azure.mgmt.resource.subscriptions.aio import SubscriptionClient
+
+                client = SubscriptionClient(self.credential)
+            elif kind == "secrets":
+                from azure.keyvault.secrets.aio import SecretClient
+
+                client = SecretClient(
+                    f"https://{scope}.vault.azure.net", self.credential
+                )
+            self._clients[(kind, scope)] = client
+        return self._clients[(kind, scope)]
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.close()
+        await self.credential.close()
+
+    async def _get(self, call):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            return await call
+        except ResourceNotFoundError:
+            return None
+
+    async def _graph(self, method: str, path: str, body: dict = None) -> dict:
+        from azure.core import AsyncPipelineClient
+        from azure.core.pipeline.policies import AsyncBearerTokenCredentialPolicy
+        from azure.core.rest import HttpRequest
+
+        if "graph" not in self._clients:
+            self._clients["graph"] = AsyncPipelineClient(
+                "https://graph.microsoft.com",
+                policies=[
+                    AsyncBearerTokenCredentialPolicy(
+                        self.credential, "https://graph.microsoft.com/.default"
+                    )
+                ],
+            )
+        request = HttpRequest(
+            method, f"https://graph.microsoft.com/v1.0{path}", json=body
+        )
+        response = await self._clients["graph"].send_request(request)
+        response.raise_for_status()
+        await response.read()
+        return response.json()
+
+    async def get_resource_group(self, subscription, name):
+        return await self._get(
+            self._client("resource", subscription).resource_groups.get(name)
+        )
+
+    async def create_resource_group(self, subscription, name, location):
+        return await self._client(
+            "resource", subscription
+        ).resource_groups.create_or_update(name, {"location": location})
+
+    async def get_storage_account(self, subscription, group, name):
+        return await self._get(
+            self._client("storage", subscription).storage_accounts.get_properties(
+                group, name
+            )
+        )
+
+    async def create_storage_account(self, subscription, group, name, location):
+        poller = await self._client(
+            "storage", subscription
+        ).storage_accounts.begin_create(
+            group,
+            name,
+            {
+                "location": location,
+                "kind": "StorageV2",
+                "sku": {"name": "Standard_LRS"},
+                "allow_blob_public_access": False,
+            },
+        )
+        return await poller.result()
+
+    async def get_container(self, subscription, group, account, name):
+        return await self._get(
+            self._client("storage", subscription).blob_containers.get(
+                group, account, name
+            )
+        )
+
+    async def create_container(self, subscription, group, account, name):
+        return await self._client("storage", subscription).blob_containers.create(
+            group, account, name, {"public_access": "None"}
+        )
+
+    async def get_service_principal(self, name):
+        found = await self._graph(
+            "GET", f"/servicePrincipals?$filter=displayName eq '{name}'"
+        )
+        if not found["value"]:
+            return None
+        principal = found["value"][0]
+        return {"app_id": principal["appId"], "object_id": principal["id"]}
+
+    async def create_service_principal(self, name):
+        application = await self._graph("POST", "/applications", {"displayName": name})
+        principal = await self._graph(
+            "POST", "/servicePrincipals", {"appId": application["appId"]}
+        )
+        return {"app_id": application["appId"], "object_id": principal["id"]}
+
+    async def get_caller(self):
+        # Object id of the identity the credential signs in as, from the oid
+        # claim of its ARM token; works for users and service principals alike
+        token = await self.credential.get_token("https://management.azure.com/.default")
+        payload = token.token.split(".")[1]
+        claims = json.loads(
+            base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+        )
+        return {
+            "object_id": claims["oid"],
+            "principal_type": (
+                "ServicePrincipal" if claims.get("idtyp") == "app" else "User"
+            ),
+        }
+
+    async def get_role_assignment(self, subscription, principal, role, scope=None):
+        # Assignments at scope or inherited from above it
+        assignments = self._client(
+            "authorization", subscription
+        ).role_assignments.list_for_scope(
+            scope or f"/subscriptions/{subscription}",
+            filter=f"principalId eq '{principal['object_id']}'",
+        )
+        async for assignment in assignments:
+            if assignment.role_definition_id.endswith(role):
+                return assignment
+        return None
+
+    async def create_role_assignment(self, subscription, principal, role, scope=None):
+        scope = scope or f"/subscriptions/{subscription}"
+        return await self._client(
+            "authorization", subscription
+        ).role_assignments.create(
+            scope,
+            str(uuid.uuid4()),
+            {
+                "role_definition_id": (
+                    f"/subscriptions/{subscription}/providers/"
+                    f"Microsoft.Authorization/roleDefinitions/{role}"
+                ),
+                "principal_id": principal["object_id"],
+                "principal_type": principal.get("principal_type", "ServicePrincipal"),
+            },
+        )
+
+    async def add_password(self, principal):
+        application = await self._graph(
+            "GET", f"/applications(appId='{principal['app_id']}')"
+        )
+        credential = await self._graph(
+            "POST",
+            f"/applications/{application['id']}/addPassword",
+            {"passwordCredential": {"displayName": "its-cdktf-bootstrap"}},
+        )
+        return credential["secretText"]
+
+    async def get_key_vault(self, subscription, group, name):
+        return await self._get(
+            self._client("keyvault", subscription).vaults.get(group, name)
+        )
+
+    async def create_key_vault(self, subscription, group, name, location):
+        subscription_info = await self._client(
+            "subscription", subscription
+        ).subscriptions.get(subscription)
+        poller = await self._client(
+            "keyvault", subscription
+        ).vaults.begin_create_or_update(
+            group,
+            name,
+            {
+                "location": location,
+                "properties": {
+                    "tenant_id": subscription_info.tenant_id,
+                    "sku": {"family": "A", "name": "standard"},
+                    # Access is granted with Azure RBAC (Key Vault Secrets Officer)
+                    "enable_rbac_authorization": True,
+                },
+            },
+        )
+        return await poller.result()
+
+    async def get_deleted_key_vault(self, subscription, name, location):
+        # Deleted vaults keep their name for the soft-delete retention period
+        return await self._get(
+            self._client("keyvault", subscription).vaults.get_deleted(name, location)
+        )
+
+    async def recover_key_vault(self, subscription, group, name, location):
+        # Recovery restores the vault with its secrets and old settings, then
+        # access is switched to RBAC like a new vault
+        subscription_info = await self._client(
+            "subscription", subscription
+        ).subscriptions.get(subscription)
+        vaults = self._client("keyvault", subscription).vaults
+        poller = await vaults.begin_create_or_update(
+            group,
+            name,
+            {
+                "location": location,
+                "properties": {
+                    "tenant_id": subscription_info.tenant_id,
+                    "sku": {"family": "A", "name": "standard"},
+                    "create_mode": "recover",
+                },
+            },
+        )
+        await poller.result()
+        return await vaults.update(
+            group, name, {"properties": {"enable_rbac_authorization": True}}
+        )
+
+    async def wait_for_secret_access(self, vault, timeout=RBAC_PROPAGATION_TIMEOUT):
+        # New role assignments take a few minutes to reach the vault's data
+        # plane; until then every secret call is a 403
+        from azure.core.exceptions import HttpResponseError
+
+        deadline = time.monotonic() + timeout
+        delay = 2.0
+        while True:
+            try:
+                async for _ in self._client(
+                    "secrets", vault
+                ).list_properties_of_secrets():
+                    break
+                return
+            except HttpResponseError as e:
+                if e.status_code != 403 or time.monotonic() > deadline:
+                    raise
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    async def get_secret(self, vault, name):
+        return await self._get(self._client("secrets", vault).get_secret(name))
+
+    async def set_secret(self, vault, name, value):
+        return await self._client("secrets", vault).set_secret(name, value)
+
+
+class Bootstrapper:
+    # Onboards customers concurrently. Every step looks for the resource first
+    # and only creates what is missing, so a rerun after a failure picks up
+    # where it stopped. Within a customer, steps that do not depend on each
+    # other run at the same time.
+    def __init__(self, client, max_concurrency: int = 10, report=print):
+        self.client = client
+        self.report = report
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._principal_record = None
+        self._assigned = set()
+        self._principal_lock = asyncio.Lock()
+        self._caller = None
+        self._caller_lock = asyncio.Lock()
+        self._done = 0
+        self._total = 0
+
+    async def _ensure(self, customer: Customer, description: str, get, create):
+        existing = await get()
+        if existing is not None:
+            self.report(f"{customer.name}: {description} exists")
+            return existing, False
+        created = await create()
+        self.report(f"{customer.name}: {description} created")
+        return created, True
+
+    async def _principal(self, customer: Customer) -> dict:
+        # One service principal for all customers, with a Contributor role
+        # assignment per subscription
+        async with self._principal_lock:
+            if self._principal_record is None:
+                self._principal_record, _ = await self._ensure(
+                    customer,
+                    f"service principal {SERVICE_PRINCIPAL_NAME}",
+                    lambda: self.client.get_service_principal(SERVICE_PRINCIPAL_NAME),
+                    lambda: self.client.create_service_principal(
+                        SERVICE_PRINCIPAL_NAME
+                    ),
+                )
+            principal = self._principal_record
+            subscription = customer.subscription_id
+            if subscription not in self._assigned:
+                await self._ensure(
+                    customer,
+                    f"Contributor on subscription {subscription}",
+                    lambda: self.client.get_role_assignment(
+                        subscription, principal, CONTRIBUTOR_ROLE
+                    ),
+                    lambda: self.client.create_role_assignment(
+                        subscription, principal, CONTRIBUTOR_ROLE
+                    ),
+                )
+                self._assigned.add(subscription)
+        return principal
+
+    async def _vault(self, customer: Customer):
+        # A vault deleted earlier still holds its name, so it is recovered
+        # (with the secret it held) rather than created again
+        subscription = customer.subscription_id
+        group = customer.state.resource_group_name
+        vault = customer.key_vault_name
+        deleted = await self.client.get_deleted_key_vault(
+            subscription, vault, customer.location
+        )
+        if deleted is not None:
+            self.report(f"{customer.name}: key vault {vault} recovered")
+            return await self.client.recover_key_vault(
+                subscription, group, vault, customer.location
+            )
+        return await self.client.create_key_vault(
+            subscription, group, vault, customer.location
+        )
+
+    async def _vault_access(self, customer: Customer):
+        # The vault uses RBAC, so whoever runs the bootstrap needs Key Vault
+        # Secrets Officer on it before the secret can be read or written
+        async with self._caller_lock:
+            if self._caller is None:
+                self._caller = await self.client.get_caller()
+        caller = self._caller
+        subscription = customer.subscription_id
+        scope = key_vault_scope(
+            subscription, customer.state.resource_group_name, customer.key_vault_name
+        )
+        await self._ensure(
+            customer,
+            f"Key Vault Secrets Officer on {customer.key_vault_name}",
+            lambda: self.client.get_role_assignment(
+                subscription, caller, SECRETS_OFFICER_ROLE, scope
+            ),
+            lambda: self.client.create_role_assignment(
+                subscription, caller, SECRETS_OFFICER_ROLE, scope
+            ),
+        )
+        await self.client.wait_for_secret_access(customer.key_vault_name)
+
+    async def _storage(self, customer: Customer):
+        state = customer.state
+        subscription = customer.subscription_id
+        await self._ensure(
+            customer,
+            f"storage account {state.storage_account_name}",
+            lambda: self.client.get_storage_account(
+                subscription, state.resource_group_name, state.storage_account_name
+            ),
+            lambda: self.client.create_storage_account(
+                subscription,
+                state.resource_group_name,
+                state.storage_account_name,
+                customer.location,
+            ),
+        )
+        await self._ensure(
+            customer,
+            f"container {state.container_name}",
+            lambda: self.client.get_container(
+                subscription,
+                state.resource_group_name,
+                state.storage_account_name,
+                state.container_name,
+            ),
+            lambda: self.client.create_container(
+                subscription,
+                state.resource_group_name,
+                state.storage_account_name,
+                state.container_name,
+            ),
+        )
+
+    async def _secret(self, customer: Customer):
+        state = customer.state
+        vault = customer.key_vault_name
+        _, principal = await asyncio.gather(
+            self._ensure(
+                customer,
+                f"key vault {vault}",
+                lambda: self.client.get_key_vault(
+                    customer.subscription_id, state.resource_group_name, vault
+                ),
+                lambda: self._vault(customer),
+            ),
+            self._principal(customer),
+        )
+        await self._vault_access(customer)
+
+        async def create_secret():
+            # Only mint a new password when the vault does not hold one yet
+            password = await self.client.add_password(principal)
+            return await self.client.set_secret(vault, SERVICE_PRINCIPAL_NAME, password)
+
+        await self._ensure(
+            customer,
+            f"secret {SERVICE_PRINCIPAL_NAME} in {vault}",
+            lambda: self.client.get_secret(vault, SERVICE_PRINCIPAL_NAME),
+            create_secret,
+        )
+
+    async def onboard(self, customer: Customer) -> dict:
+        async with self._slots:
+            start = time.perf_counter()
+            result = {"customer": customer.name}
+            try:
+                state = customer.state
+                await self._ensure(
+                    customer,
+                    f"resource group {state.resource_group_name}",
+                    lambda: self.client.get_resource_group(
+                        customer.subscription_id, state.resource_group_name
+                    ),
+                    lambda: self.client.create_resource_group(
+                        customer.subscription_id,
+                        state.resource_group_name,
+                        customer.location,
+                    ),
+                )
+                await asyncio.gather(self._storage(customer), self._secret(customer))
+                result["status"] = "ok"
+            except Exception as e:
+                result["status"] = "failed"
+                result["error"] = f"{type(e).__name__}: {e}"
+            result["seconds"] = time.perf_counter() - start
+            self._done += 1
+            self.report(
+                f"[{self._done}/{self._total}] {customer.name}: {result['status']} "
+                f"in {result['seconds']:.1f}s"
+                + (f" ({result['error']})" if "error" in result else "")
+            )
+            return result
+
+    async def run(self, customers: list) -> list:
+        names = [customer.name for customer in customers]
+        duplicates = {name for name in names if names.count(name) > 1}
+        if duplicates:
+            raise ValueError(f"Customers listed more than once: {sorted(duplicates)}")
+        self._total = len(customers)
+        return await asyncio.gather(*(self.onboard(c) for c in customers))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Create the Terraform state storage and service principal "
+        "for every customer in an inventory file."
+    )
+    parser.add_argument("inventory", help="Customer inventory JSON")
+    parser.add_argument("--max-concurrency", type=int, default=10)
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Run against an in-memory stand-in instead of Azure",
+    )
+    args = parser.parse_args(argv)
+
+    customers = load_customers(args.inventory)
+
+    async def run():
+        client = InMemoryClient() if args.dry_run else AzureClient()
+        try:
+            return await Bootstrapper(client, args.max_concurrency).run(customers)
+        finally:
+            await client.close()
+
+    results = asyncio.run(run())
+    if any(result["status"] != "ok" for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
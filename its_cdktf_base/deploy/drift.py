@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+import abc
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from its_cdktf_base.deploy.backend import StateLocation
+from its_cdktf_base.deploy.orchestrator import StateBlobs
+
+# ARM api-version used to read network resources
+NETWORK_API_VERSION = "2023-09-01"
+
+ARM_ENDPOINT = "https://management.azure.com"
+
+
+@dataclass(frozen=True)
+class StateEntry:
+    # One resource instance of a tfstate
+    address: str
+    type: str
+    id: str
+    attributes: dict
+
+
+@dataclass(frozen=True)
+class Drift:
+    # A resource instance whose live settings differ from state. status is
+    # "drifted", "deleted" (gone from Azure) or "error" (could not be read);
+    # differences holds (attribute, in state, live) for drifted instances.
+    address: str
+    id: str
+    status: str
+    differences: tuple = ()
+    error: str = None
+
+    def __str__(self) -> str:
+        if self.status == "deleted":
+            return f"{self.address}: deleted outside terraform"
+        if self.status == "error":
+            return f"{self.address}: could not be read: {self.error}"
+        lines = [f"{self.address}: drifted"]
+        for attribute, state, live in self.differences:
+            lines.append(f"  {attribute}: {state!r} in state, {live!r} in Azure")
+        return "\n".join(lines)
+
+
+def instance_address(resource: dict, instance: dict) -> str:
+    address = f"{resource['type']}.{resource['name']}"
+    if resource.get("module"):
+        address = f"{resource['module']}.{address}"
+    key = instance.get("index_key")
+    if isinstance(key, int):
+        return f"{address}[{key}]"
+    if key is not None:
+        return f'{address}["{key}"]'
+    return address
+
+
+def state_index(state: dict) -> dict:
+    # Address -> StateEntry for every managed resource instance of a tfstate
+    # (format version 4)
+    index = {}
+    for resource in state.get("resources", []):
+        if resource.get("mode") != "managed":
+            continue
+        for instance in resource.get("instances", []):
+            attributes = instance.get("attributes") or {}
+            address = instance_address(resource, instance)
+            index[address] = StateEntry(
+                address, resource["type"], attributes.get("id"), attributes
+            )
+    return index
+
+
+def load_state(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def stack_states(outdir: str, blobs=None) -> dict:
+    # Stack name -> tfstate for every stack of a cdktf.out, from the stack's
+    # azurerm backend (the layout of bin/bootstrap_customer_account.sh) or its
+    # local state file. Stacks that were never applied are left out.
+    with open(os.path.join(outdir, "manifest.json")) as f:
+        manifest = json.load(f)
+    states = {}
+    for name, stack in manifest["stacks"].items():
+        with open(os.path.join(outdir, stack["synthesizedStackPath"])) as f:
+            backend = json.load(f).get("terraform", {}).get("backend", {})
+        if "azurerm" in backend:
+            blobs = blobs or StateBlobs(
+                os.environ.get("AZURE_STORAGE_CONNECTION_STRING")
+            )
+            content = blobs.download(backend["azurerm"])
+            if content:
+                states[name] = json.loads(content)
+            continue
+        path = backend.get("local", {}).get("path", f"terraform.{name}.tfstate")
+        path = os.path.join(outdir, stack["workingDirectory"], path)
+        if os.path.exists(path):
+            states[name] = load_state(path)
+    return states
+
+
+def customer_state(customer: str, stack: str, blobs=None) -> dict:
+    # tfstate of one stack straight from the customer's backend container
+    location = StateLocation.for_customer(customer)
+    blobs = blobs or StateBlobs(os.environ.get("AZURE_STORAGE_CONNECTION_STRING"))
+    content = blobs.download(
+        {
+            "storage_account_name": location.storage_account_name,
+            "container_name": location.container_name,
+            "key": location.key(stack),
+        }
+    )
+    return json.loads(content) if content else None
+
+
+class ResourceReader(abc.ABC):
+    # Reads the live ARM representation of a resource by id ({"name",
+    # "properties", ...}), or None if it no longer exists. Called from several
+    # threads at once.
+    @abc.abstractmethod
+    def read(self, resource_id: str) -> dict: ...
+
+
+class ArmResourceReader(ResourceReader):
+    # Plain ARM GETs, one per resource; no refresh of anything else
+    def __init__(
+        self,
+        credential=None,
+        endpoint: str = ARM_ENDPOINT,
+        api_version: str = NETWORK_API_VERSION,
+    ):
+        self.credential = credential
+        self.endpoint = endpoint
+        self.api_version = api_version
+        self._client = None
+
+    def _pipeline(self):
+        from azure.core import PipelineClient
+        from azure.core.pipeline.policies import (
+            BearerTokenCredentialPolicy,
+            RetryPolicy,
+        )
+
+        if self._client is None:
+            credential = self.credential
+            if credential is None:
+                from azure.identity import DefaultAzureCredential
+
+                credential = DefaultAzureCredential()
+            self._client = PipelineClient(
+                self.endpoint,
+                policies=[
+                    RetryPolicy(),
+                    BearerTokenCredentialPolicy(
+                        credential, f"{self.endpoint}/.default"
+                    ),
+                ],
+            )
+        return self._client
+
+    def read(self, resource_id: str) -> dict:
+        from azure.core.rest import HttpRequest
+
+        response = self._pipeline().send_request(
+            HttpRequest(
+                "GET",
+                f"{self.endpoint}{resource_id}",
+                params={"api-version": self.api_version},
+            )
+        )
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+
+def _prefixes(single, plural) -> list:
+    # Terraform and ARM both split address and port settings into a single
+    # value and a list; only their union matters
+    values = set(plural or [])
+    if single:
+        values.add(single)
+    return sorted(values)
+
+
+def _rule(name: str, rule: dict, arm: bool) -> dict:
+    # A security rule in one shape whether it comes from state or from ARM
+    def get(attribute):
+        if arm:
+            head, *rest = attribute.split("_")
+            attribute = head + "".join(part.title() for part in rest)
+        return rule.get(attribute)
+
+    return {
+        "name": name,
+        "priority": get("priority"),
+        "direction": get("direction"),
+        "access": get("access"),
+        "protocol": get("protocol"),
+        "source_port_ranges": _prefixes(
+            get("source_port_range"), get("source_port_ranges")
+        ),
+        "destination_port_ranges": _prefixes(
+            get("destination_port_range"), get("destination_port_ranges")
+        ),
+        "source_address_prefixes": _prefixes(
+            get("source_address_prefix"), get("source_address_prefixes")
+        ),
+        "destination_address_prefixes": _prefixes(
+            get("destination_address_prefix"), get("destination_address_prefixes")
+        ),
+    }
+
+
+def _rules(rules: list) -> list:
+    return sorted(rules, key=lambda rule: rule["name"])
+
+
+def _id(value) -> str:
+    # ARM ids are case-insensitive and come back in either case
+    return value.lower() if value else value
+
+
+@dataclass(frozen=True)
+class DriftCheck:
+    # How to compare one resource type: the settings that matter, taken from
+    # the state attributes and from the live ARM resource
+    state: object
+    live: object
+
+
+DRIFT_CHECKS = {
+    "azurerm_network_security_group": DriftCheck(
+        state=lambda attributes: {
+            "security_rule": _rules(
+                _rule(rule["name"], rule, arm=False)
+                for rule in attributes.get("security_rule") or []
+            )
+        },
+        live=lambda resource: {
+            "security_rule": _rules(
+                _rule(rule["name"], rule["properties"], arm=True)
+                for rule in resource["properties"].get("securityRules", [])
+            )
+        },
+    ),
+    "azurerm_network_security_rule": DriftCheck(
+        state=lambda attributes: _rule(attributes["name"], attributes, arm=False),
+        live=lambda resource: _rule(resource["name"], resource["properties"], arm=True),
+    ),
+    "azurerm_subnet": DriftCheck(
+        state=lambda attributes: {
+            "address_prefixes": sorted(attributes.get("address_prefixes") or []),
+            "service_endpoints": sorted(attributes.get("service_endpoints") or []),
+        },
+        live=lambda resource: {
+            "address_prefixes": _prefixes(
+                resource["properties"].get("addressPrefix"),
+                resource["properties"].get("addressPrefixes"),
+            ),
+            "service_endpoints": sorted(
+                endpoint["service"]
+                for endpoint in resource["properties"].get("serviceEndpoints", [])
+            ),
+        },
+    ),
+    # The association's id is the subnet's id
+    "azurerm_subnet_network_security_group_association": DriftCheck(
+        state=lambda attributes: {
+            "network_security_group_id": _id(
+                attributes.get("network_security_group_id")
+            )
+        },
+        live=lambda resource: {
+            "network_security_group_id": _id(
+                (resource["properties"].get("networkSecurityGroup") or {}).get("id")
+            )
+        },
+    ),
+}
+
+
+def check_drift(
+    index: dict,
+    reader: ResourceReader,
+    checks: dict = None,
+    types: list = None,
+    max_workers: int = 16,
+) -> list:
+    # Compare the state entries of the checked types with their live
+    # resources, reading concurrently and each resource id once. Everything
+    # else in state, e.g. the VNGW, is never read. Returns a Drift per
+    # instance that differs, sorted by address.
+    checks = DRIFT_CHECKS if checks is None else checks
+    types = set(checks if types is None else types)
+    unknown = types - set(checks)
+    if unknown:
+        raise ValueError(f"No drift check for {sorted(unknown)}")
+    entries = [entry for entry in index.values() if entry.type in types and entry.id]
+
+    def read(resource_id):
+        try:
+            return resource_id, reader.read(resource_id), None
+        except Exception as e:
+            return resource_id, None, f"{type(e).__name__}: {e}"
+
+    ids = sorted({entry.id for entry in entries})
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        live = {
+            resource_id: (resource, error)
+            for resource_id, resource, error in pool.map(read, ids)
+        }
+
+    drifts = []
+    for entry in sorted(entries, key=lambda entry: entry.address):
+        resource, error = live[entry.id]
+        if error:
+            drifts.append(Drift(entry.address, entry.id, "error", error=error))
+            continue
+        if resource is None:
+            drifts.append(Drift(entry.address, entry.id, "deleted"))
+            continue
+        check = checks[entry.type]
+        expected = check.state(entry.attributes)
+        actual = check.live(resource)
+        differences = tuple(
+            (attribute, expected[attribute], actual.get(attribute))
+            for attribute in sorted(expected)
+            if expected[attribute] != actual.get(attribute)
+        )
+        if differences:
+            drifts.append(Drift(entry.address, entry.id, "drifted", differences))
+    return drifts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check selected resources of terraform state for changes made outside terraform."
+    )
+    parser.add_argument(
+        "path", nargs="?", help="A cdktf.out directory, or a .tfstate file"
+    )
+    parser.add_argument(
+        "--customer", help="Read state from this customer's backend container"
+    )
+    parser.add_argument(
+        "--stack",
+        action="append",
+        help="Stack to check (with --customer, required; may be repeated)",
+    )
+    parser.add_argument(
+        "--type",
+        action="append",
+        choices=sorted(DRIFT_CHECKS),
+        help="Resource type to check (default: all of them)",
+    )
+    parser.add_argument("--max-workers", type=int, default=16)
+    args = parser.parse_args(argv)
+
+    if args.customer:
+        if not args.stack:
+            parser.error("--customer needs at least one --stack")
+        states = {stack: customer_state(args.customer, stack) for stack in args.stack}
+    elif args.path and os.path.isdir(args.path):
+        states = stack_states(args.path)
+        if args.stack:
+            states = {name: states.get(name) for name in args.stack}
+    elif args.path:
+        states = {args.path: load_state(args.path)}
+    else:
+        parser.error("pass a cdktf.out directory, a .tfstate file or --customer")
+
+    reader = ArmResourceReader()
+    drifted = False
+    for name, state in states.items():
+        if state is None:
+            print(f"{name}: no state")
+            continue
+        drifts = check_drift(
+            state_index(state), reader, types=args.type, max_workers=args.max_workers
+        )
+        print(f"{name}: {len(drifts) or 'no'} drifted resources")
+        for drift in drifts:
+            print(drift)
+        drifted = drifted or bool(drifts)
+    if drifted:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
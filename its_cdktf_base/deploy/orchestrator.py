@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from its_cdktf_base.synth.incremental import (
+    fingerprint,
+    stack_files,
+    write_bytes_if_changed,
+)
+
+# Terraform output when another process holds the state blob lease
+LOCK_ERRORS = ("Error acquiring the state lock", "state blob is already locked")
+
+# Results that let dependent stacks go ahead
+APPLIED = ("ok", "unchanged")
+
+# Suffix of the record kept next to a stack's state; synth leaves files that
+# start with terraform.tfstate alone
+RECORD_SUFFIX = ".applied"
+LOCAL_RECORD = "terraform.tfstate" + RECORD_SUFFIX
+
+
+class Backoff:
+    # Exponential backoff with jitter, so runs that collided on a lock do not
+    # retry in step
+    def __init__(self, base: float = 2.0, cap: float = 60.0, attempts: int = 8):
+        self.base = base
+        self.cap = cap
+        self.attempts = attempts
+
+    def delay(self, attempt: int) -> float:
+        return min(self.cap, self.base * 2**attempt) * random.uniform(0.5, 1.0)
+
+
+class TerraformRunner:
+    # Runs terraform in a synthesized stack directory
+    def __init__(self, terraform: str = "terraform"):
+        self.terraform = terraform
+
+    def __call__(self, directory: str, args: list) -> tuple:
+        result = subprocess.run(
+            [self.terraform, *args, "-input=false", "-no-color"],
+            cwd=directory,
+            capture_output=True,
+            text=True,
+        )
+        return result.returncode, result.stdout + result.stderr
+
+
+class StateBlobs:
+    # Access to the state blobs of azurerm backends, one client per storage
+    # account. Needs azure-storage-blob; a connection string also points it at
+    # Azurite.
+    def __init__(self, connection_string: str = None, credential=None):
+        self.connection_string = connection_string
+        self.credential = credential
+        self._clients = {}
+
+    def _service(self, account: str):
+        from azure.storage.blob import BlobServiceClient
+
+        if account not in self._clients:
+            if self.connection_string:
+                client = BlobServiceClient.from_connection_string(
+                    self.connection_string
+                )
+            else:
+                credential = self.credential
+                if credential is None:
+                    from azure.identity import DefaultAzureCredential
+
+                    credential = DefaultAzureCredential()
+                client = BlobServiceClient(
+                    f"https://{account}.blob.core.windows.net", credential=credential
+                )
+            self._clients[account] = client
+        return self._clients[account]
+
+    def blob(self, backend: dict):
+        return (
+            self._service(backend["storage_account_name"])
+            .get_container_client(backend["container_name"])
+            .get_blob_client(backend["key"])
+        )
+
+    def download(self, backend: dict) -> bytes:
+        # Contents of a state blob, None if the stack was never applied
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            return self.blob(backend).download_blob().readall()
+        except ResourceNotFoundError:
+            return None
+
+    def upload(self, backend: dict, content: bytes):
+        self.blob(backend).upload_blob(content, overwrite=True)
+
+
+class BlobLeaseProbe(StateBlobs):
+    # Reports whether a stack's state blob is leased, which is how the azurerm
+    # backend locks state
+    def is_locked(self, backend: dict) -> bool:
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            return self.blob(backend).get_blob_properties().lease.state == "leased"
+        except ResourceNotFoundError:
+            # No state yet, so nothing can hold it
+            return False
+
+
+class ApplyRecords:
+    # The fingerprint of the synthesized stack each stack last applied, kept
+    # next to its state: a <key>.applied blob beside an azurerm state blob, a
+    # terraform.tfstate.applied file in the stack directory otherwise. Without
+    # blobs, stacks with an azurerm backend have no record and always apply.
+    def __init__(self, blobs: StateBlobs = None):
+        self.blobs = blobs
+
+    def _backend(self, stack: dict) -> dict:
+        backend = stack["backend"]
+        return dict(backend, key=backend["key"] + RECORD_SUFFIX)
+
+    def get(self, stack: dict) -> str:
+        if stack["backend"] is None:
+            try:
+                with open(os.path.join(stack["directory"], LOCAL_RECORD)) as f:
+                    return f.read().strip()
+            except FileNotFoundError:
+                return None
+        if self.blobs is None:
+            return None
+        content = self.blobs.download(self._backend(stack))
+        return content.decode().strip() if content is not None else None
+
+    def put(self, stack: dict, fingerprint: str):
+        if stack["backend"] is None:
+            write_bytes_if_changed(
+                os.path.join(stack["directory"], LOCAL_RECORD), fingerprint.encode()
+            )
+        elif self.blobs is not None:
+            self.blobs.upload(self._backend(stack), fingerprint.encode())
+
+
+def load_stacks(outdir: str) -> dict:
+    # Stack name -> working directory, dependencies, backend configuration and
+    # the fingerprint of the synthesized stack, from the manifests written
+    # next to the synthesized stacks
+    with open(os.path.join(outdir, "manifest.json")) as f:
+        manifest = json.load(f)
+    stacks = {}
+    for name, stack in manifest["stacks"].items():
+        with open(os.path.join(outdir, stack["synthesizedStackPath"])) as f:
+            config = json.load(f)
+        backend = config.get("terraform", {}).get("backend", {}).get("azurerm")
+        directory = os.path.join(outdir, stack["workingDirectory"])
+        stacks[name] = {
+            "directory": directory,
+            "dependencies": list(stack.get("dependencies", [])),
+            "backend": backend,
+            "fingerprint": fingerprint(directory, stack_files(directory), stack),
+        }
+    return stacks
+
+
+class DeployOrchestrator:
+    # Applies the stacks of one or more synthesized apps. A stack starts as soon
+    # as the stacks it depends on have applied, up to max_parallel at a time.
+    # Each stack has its own state key, so the only contention is with other
+    # runs on the same stack; those are waited out with backoff. Every
+    # successful apply records the stack's fingerprint in records. With
+    # changed_only, stacks whose fingerprint matches their record, i.e. that
+    # have not changed since they last applied, are not run at all and count
+    # as applied for their dependents.
+    def __init__(
+        self,
+        stacks: dict,
+        max_parallel: int = 4,
+        runner=None,
+        probe=None,
+        backoff: Backoff = None,
+        command: tuple = ("apply", "-auto-approve"),
+        report=print,
+        sleep=time.sleep,
+        changed_only: bool = False,
+        records: ApplyRecords = None,
+    ):
+        unknown = {
+            dependency
+            for stack in stacks.values()
+            for dependency in stack["dependencies"]
+            if dependency not in stacks
+        }
+        if unknown:
+            raise ValueError(f"Stacks depend on unknown stacks: {sorted(unknown)}")
+        self.stacks = stacks
+        self.max_parallel = max_parallel
+        self.runner = runner or TerraformRunner()
+        self.probe = probe
+        self.backoff = backoff or Backoff()
+        self.command = list(command)
+        self.report = report
+        self.sleep = sleep
+        self.changed_only = changed_only
+        self.records = records or ApplyRecords()
+        self._lock = threading.Lock()
+
+    def _log(self, message: str):
+        with self._lock:
+            self.report(message)
+
+    def _wait_for_lease(self, name: str) -> bool:
+        backend = self.stacks[name]["backend"]
+        if self.probe is None or backend is None:
+            return True
+        for attempt in range(self.backoff.attempts):
+            if not self.probe.is_locked(backend):
+                return True
+            delay = self.backoff.delay(attempt)
+            self._log(f"{name}: state is locked, retrying in {delay:.1f}s")
+            self.sleep(delay)
+        return False
+
+    def deploy(self, name: str) -> dict:
+        start = time.perf_counter()
+        result = {"stack": name, "attempts": 0}
+        result.update(self._apply(name, result))
+        if result["status"] == "ok" and self.command[0] == "apply":
+            self._record(name)
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    def _apply(self, name: str, result: dict) -> dict:
+        directory = self.stacks[name]["directory"]
+        code, output = self.runner(directory, ["init"])
+        if code != 0:
+            return {"status": "failed", "output": output}
+        for attempt in range(self.backoff.attempts):
+            if not self._wait_for_lease(name):
+                return {"status": "locked", "output": "state lease was never released"}
+            result["attempts"] += 1
+            code, output = self.runner(directory, self.command)
+            if code == 0:
+                return {"status": "ok", "output": output}
+            if not any(error in output for error in LOCK_ERRORS):
+                return {"status": "failed", "output": output}
+            # Another run took the lease between the probe and terraform
+            delay = self.backoff.delay(attempt)
+            self._log(f"{name}: lost the state lock, retrying in {delay:.1f}s")
+            self.sleep(delay)
+        return {"status": "locked", "output": output}
+
+    def _record(self, name: str):
+        stack = self.stacks[name]
+        try:
+            self.records.put(stack, stack["fingerprint"])
+        except Exception as e:
+            # The stack applied; without a record it is only applied again
+            self._log(f"{name}: applied, but the apply record was not written: {e}")
+
+    def _unchanged(self) -> set:
+        # Stacks whose recorded fingerprint matches the synthesized one; the
+        # records are read concurrently
+        if not self.changed_only:
+            return set()
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as pool:
+            records = dict(
+                zip(self.stacks, pool.map(self.records.get, self.stacks.values()))
+            )
+        return {
+            name
+            for name, stack in self.stacks.items()
+            if stack.get("fingerprint") is not None
+            and records[name] == stack["fingerprint"]
+        }
+
+    def run(self) -> dict:
+        unchanged = self._unchanged()
+        results = {}
+        pending = dict(self.stacks)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as pool:
+            while pending or running:
+                waiting = len(pending)
+                for name, stack in list(pending.items()):
+                    if len(running) >= self.max_parallel:
+                        break
+                    statuses = [
+                        results.get(d, {}).get("status") for d in stack["dependencies"]
+                    ]
+                    if any(status not in APPLIED + (None,) for status in statuses):
+                        del pending[name]
+                        results[name] = {"stack": name, "status": "skipped"}
+                        self._log(f"{name}: skipped, a dependency did not apply")
+                    elif not all(status in APPLIED for status in statuses):
+                        continue
+                    elif name in unchanged:
+                        del pending[name]
+                        results[name] = {"stack": name, "status": "unchanged"}
+                        self._log(f"{name}: unchanged since its last apply")
+                    else:
+                        del pending[name]
+                        running[pool.submit(self.deploy, name)] = name
+                        self._log(f"{name}: started")
+                if not running:
+                    if pending and len(pending) == waiting:
+                        raise ValueError(
+                            f"Stacks depend on each other in a cycle: {sorted(pending)}"
+                        )
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result()
+                    self._log(
+                        f"{name}: {results[name]['status']} after "
+                        f"{results[name]['attempts']} attempts"
+                    )
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Apply synthesized stacks concurrently, waiting out state locks."
+    )
+    parser.add_argument(
+        "outdirs", nargs="+", help="cdktf.out directories, e.g. one per customer"
+    )
+    parser.add_argument("--max-parallel", type=int, default=4)
+    parser.add_argument(
+        "--plan", action="store_true", help="Run terraform plan instead of apply"
+    )
+    parser.add_argument(
+        "--no-lease-probe",
+        action="store_true",
+        help="Rely on terraform's own lock errors instead of checking blob leases",
+    )
+    parser.add_argument(
+        "--changed-only",
+        action="store_true",
+        help="Skip stacks that have not changed since they last applied",
+    )
+    args = parser.parse_args(argv)
+
+    stacks = {}
+    for outdir in args.outdirs:
+        for name, stack in load_stacks(outdir).items():
+            if name in stacks:
+                raise ValueError(f"Stack {name} is in more than one outdir")
+            stacks[name] = stack
+    blobs = BlobLeaseProbe(os.environ.get("AZURE_STORAGE_CONNECTION_STRING"))
+    probe = None if args.no_lease_probe else blobs
+    orchestrator = DeployOrchestrator(
+        stacks,
+        max_parallel=args.max_parallel,
+        probe=probe,
+        command=("plan",) if args.plan else ("apply", "-auto-approve"),
+        changed_only=args.changed_only,
+        records=ApplyRecords(blobs),
+    )
+    results = orchestrator.run()
+    if any(result["status"] not in APPLIED for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+import argparse
+import json
+import os
+import re
+import sys
+
+# Resources that are slow or disruptive to recreate. Deleting or replacing one
+# of these is flagged whatever else the plan does.
+EXPENSIVE_TYPES = {
+    "azurerm_virtual_network_gateway": "about 45 minutes to rebuild, VPN clients disconnect",
+    "azurerm_nat_gateway": "outbound traffic from associated subnets stops",
+    "azurerm_public_ip": "static addresses change",
+    "azurerm_virtual_network": "every subnet and attached NIC is removed",
+    "azurerm_windows_virtual_machine": "session host disks and profiles are lost",
+}
+
+ACTIONS = {
+    ("create",): "create",
+    ("update",): "update",
+    ("delete",): "delete",
+    ("delete", "create"): "replace",
+    ("create", "delete"): "replace",
+    ("read",): "read",
+    ("no-op",): "no-op",
+}
+
+CHUNK_SIZE = 1 << 20
+
+# Values up to this size are decoded whole when skipped; larger containers are
+# walked element by element so memory stays bounded
+MAX_SKIP_BUFFER = 4 << 20
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class PlanStream:
+    # Incremental reader over the text of one JSON document. Only as much of
+    # the file as the current value needs is held in memory.
+    def __init__(self, f, chunk_size: int = CHUNK_SIZE):
+        self._file = f
+        self._chunk_size = chunk_size
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        # Next non-whitespace character, without consuming it
+        while True:
+            self._pos = WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} in plan JSON, found {self.peek()!r}")
+        self._pos += 1
+
+    def value(self, limit: int = None):
+        # Decode the next value, reading more of the file while it is truncated.
+        # Returns (True, value), or (False, None) if it is larger than limit.
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                end = None
+            # A number at the end of the buffer may continue in the next chunk
+            if end is not None and (end < len(self._buffer) or self._eof):
+                self._pos = end
+                return True, value
+            if limit is not None and len(self._buffer) - self._pos >= limit:
+                return False, None
+            if not self._fill():
+                if end is not None:
+                    self._pos = end
+                    return True, value
+                raise ValueError("Plan JSON ends in the middle of a value")
+
+    def skip(self):
+        # Skip the next value without holding all of it in memory
+        found, _ = self.value(limit=MAX_SKIP_BUFFER)
+        if found:
+            return
+        if self.peek() == "{":
+            for _ in self.members():
+                self.skip()
+        elif self.peek() == "[":
+            for _ in self.items():
+                self.skip()
+        else:
+            raise ValueError("Scalar value in plan JSON exceeds the read buffer")
+
+    def members(self):
+        # Yield each key of the next object, leaving its value to the caller
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            _, key = self.value()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self._pos += 1
+                continue
+            self.expect("}")
+            return
+
+    def items(self):
+        # Yield once per element of the next array, leaving the element to the caller
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield
+            if self.peek() == ",":
+                self._pos += 1
+                continue
+            self.expect("]")
+            return
+
+
+def resource_changes(f):
+    # Yield each entry of resource_changes from a `terraform show -json` plan
+    stream = PlanStream(f)
+    for key in stream.members():
+        if key != "resource_changes":
+            stream.skip()
+            continue
+        for _ in stream.items():
+            yield stream.value()[1]
+
+
+def classify(actions) -> str:
+    return ACTIONS.get(tuple(actions), "+".join(actions))
+
+
+def construct_id(change: dict) -> str:
+    # cdktf names resources after their construct ids, so the resource name
+    # without its instance key identifies the construct
+    if change.get("module_address"):
+        return f"{change['module_address']}.{change['name']}"
+    return change["name"]
+
+
+class PlanSummary:
+    # Per stack and construct counts of each kind of change. Memory grows with
+    # the number of constructs, never with the size of the plan.
+    def __init__(self, samples: int = 5):
+        self.changes = {}
+        self.destructive = {}
+        self.resources = 0
+        self.samples = samples
+
+    def add(self, stack: str, change: dict):
+        self.resources += 1
+        action = classify(change["change"]["actions"])
+        if action in ("no-op", "read"):
+            return
+        key = (stack, change["type"], construct_id(change))
+        counts = self.changes.setdefault(key, {})
+        counts[action] = counts.get(action, 0) + 1
+        if action in ("delete", "replace") and change["type"] in EXPENSIVE_TYPES:
+            # A few example addresses per construct keep the report bounded
+            flagged = self.destructive.setdefault(
+                key + (action,),
+                {"count": 0, "addresses": [], "replace_paths": []},
+            )
+            flagged["count"] += 1
+            if len(flagged["addresses"]) < self.samples:
+                flagged["addresses"].append(change["address"])
+            for path in change["change"].get("replace_paths") or []:
+                if path not in flagged["replace_paths"]:
+                    flagged["replace_paths"].append(path)
+
+    def add_plan(self, stack: str, path: str):
+        with open(path) as f:
+            for change in resource_changes(f):
+                self.add(stack, change)
+
+    def totals(self) -> dict:
+        totals = {}
+        for counts in self.changes.values():
+            for action, count in counts.items():
+                totals[action] = totals.get(action, 0) + count
+        return totals
+
+    def report(self) -> str:
+        lines = []
+        for (stack, type, construct), counts in sorted(self.changes.items()):
+            actions = ", ".join(f"{n} {a}" for a, n in sorted(counts.items()))
+            lines.append(f"{stack:<24} {type + '.' + construct:<60} {actions}")
+        totals = ", ".join(f"{n} {a}" for a, n in sorted(self.totals().items()))
+        lines.append(f"{self.resources} resources planned: {totals or 'no changes'}")
+        for (stack, type, construct, action), flagged in sorted(
+            self.destructive.items()
+        ):
+            lines.append(
+                f"DESTRUCTIVE {action} of {type}.{construct} in {stack} "
+                f"({flagged['count']} instances): {EXPENSIVE_TYPES[type]}"
+            )
+            for address in flagged["addresses"]:
+                lines.append(f"    {address}")
+        return "\n".join(lines)
+
+
+def stack_name(path: str) -> str:
+    # cdktf.out/stacks/<stack>/plan.json is named after its directory
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if stem in ("plan", "tfplan"):
+        return os.path.basename(os.path.dirname(os.path.abspath(path)))
+    return stem
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Summarize `terraform show -json` plans of many stacks."
+    )
+    parser.add_argument("plans", nargs="+", help="Plan JSON files, one per stack")
+    parser.add_argument(
+        "--fail-on-destructive",
+        action="store_true",
+        help="Exit with status 2 if an expensive resource would be deleted or replaced",
+    )
+    args = parser.parse_args(argv)
+
+    summary = PlanSummary()
+    for path in args.plans:
+        summary.add_plan(stack_name(path), path)
+    print(summary.report())
+    if args.fail_on_destructive and summary.destructive:
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
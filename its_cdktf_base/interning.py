@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+import functools
+
+# Every distinct config value seen so far, keyed by itself
+_interned = {}
+
+
+def intern(value):
+    # Return the shared instance equal to a frozen config value, so configs
+    # built from identical inventory entries are one object
+    return _interned.setdefault(value, value)
+
+
+def cached_struct(method):
+    # Build the JSII struct of a config once per distinct config value. Equal
+    # configs hash alike, so every construct made from them reuses one struct
+    # instead of converting and type checking a dict literal again.
+    return functools.lru_cache(maxsize=None)(method)
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+import importlib
+
+# Names of every lazy module that has been declared, and of those that have
+# actually been imported, in load order
+declared = []
+loaded = []
+
+
+class LazyModule:
+    # Stands in for a module and imports it on first attribute access, so a
+    # provider submodule is only loaded when a construct from it is created
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+            loaded.append(self._name)
+
+            # Imported here so the profiler costs nothing until a module loads
+            from its_cdktf_base.synth import profiling
+
+            if profiling.enabled():
+                profiling.profiler().instrument(self._module)
+        return getattr(self._module, attribute)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    if name not in declared:
+        declared.append(name)
+    return LazyModule(name)
+
+
+def lazy_attributes(package: str, attributes: dict):
+    # Build a module level __getattr__ that resolves exported names on first use
+    def __getattr__(name):
+        if name not in attributes:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        module = importlib.import_module(attributes[name], package)
+        return getattr(module, name)
+
+    return __getattr__
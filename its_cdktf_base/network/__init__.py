@@ -0,0 +1,17 @@
+from its_cdktf_base.lazy_imports import lazy_attributes
+
+# Constructs are resolved on first access so importing the package stays cheap
+__getattr__ = lazy_attributes(
+    __name__,
+    {
+        "ItsNetworkingStackBase": ".its_networking_stack_base",
+        "ItsNetworkingStacks": ".its_networking_stacks",
+        "ItsNetworkCoreStack": ".its_networking_stacks",
+        "ItsNetworkSecurityStack": ".its_networking_stacks",
+        "ItsNetworkEgressStack": ".its_networking_stacks",
+        "ItsNetworkGatewayStack": ".its_networking_stacks",
+        "ItsHubStack": ".its_hub_spoke_stacks",
+        "ItsSpokeStack": ".its_hub_spoke_stacks",
+        "HubConfig": ".hub",
+    },
+)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+import bisect
+import contextlib
+import fcntl
+import ipaddress
+import json
+import os
+import tempfile
+from dataclasses import replace
+
+from its_cdktf_base.network.topology import NetworkTopology
+
+# Private range customer networks are allocated from
+DEFAULT_POOL = "10.0.0.0/8"
+
+
+class AddressOverlapError(ValueError):
+    pass
+
+
+class AddressAllocator:
+    # Hands out non-overlapping prefixes from a pool. Allocations are kept in a
+    # list sorted by first address, so overlap checks are two bisects and
+    # sequential allocations resume from where the last one ended.
+    def __init__(self, pool: str = DEFAULT_POOL, ledger: str = None):
+        self.pool = ipaddress.ip_network(pool)
+        self.ledger = ledger
+        self._starts = []
+        self._blocks = []
+        self._next = int(self.pool.network_address)
+        if ledger and os.path.exists(ledger):
+            with open(ledger) as f:
+                data = json.load(f)
+            if data["pool"] != str(self.pool):
+                raise ValueError(f"Ledger {ledger} is for pool {data['pool']}")
+            for cidr, owner in data["allocations"].items():
+                self.reserve(owner, cidr)
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def allocations(self) -> dict:
+        return {str(_network(start, end)): owner for start, end, owner in self._blocks}
+
+    def owned(self, owner: str) -> list:
+        return [
+            str(_network(start, end)) for start, end, o in self._blocks if o == owner
+        ]
+
+    def overlaps(self, cidr: str) -> list:
+        # Every existing allocation that shares an address with cidr
+        network = ipaddress.ip_network(cidr)
+        start, end = int(network.network_address), int(network.broadcast_address)
+        return [
+            (str(_network(s, e)), owner)
+            for s, e, owner in self._overlapping(start, end)
+        ]
+
+    def reserve(self, owner: str, cidr: str) -> str:
+        # Record a specific prefix, e.g. one that already exists in Azure
+        network = ipaddress.ip_network(cidr)
+        if not network.subnet_of(self.pool):
+            raise ValueError(f"{cidr} is outside the pool {self.pool}")
+        start, end = int(network.network_address), int(network.broadcast_address)
+        conflicts = self._overlapping(start, end)
+        if conflicts:
+            raise AddressOverlapError(
+                f"{cidr} for {owner} overlaps {self.overlaps(cidr)}"
+            )
+        self._insert(start, end, owner)
+        return str(network)
+
+    def claim(self, owner: str, cidr: str) -> str:
+        # reserve() that accepts a prefix owner already holds
+        if str(ipaddress.ip_network(cidr)) in self.owned(owner):
+            return str(ipaddress.ip_network(cidr))
+        return self.reserve(owner, cidr)
+
+    def allocate(self, owner: str, prefixlen: int) -> str:
+        # First fit from the end of the previous allocation, wrapping once
+        size = 1 << (self.pool.max_prefixlen - prefixlen)
+        pool_start = int(self.pool.network_address)
+        pool_end = int(self.pool.broadcast_address)
+        candidate = _align(max(self._next, pool_start), size)
+        wrapped = False
+        while True:
+            end = candidate + size - 1
+            if end > pool_end:
+                if wrapped:
+                    raise ValueError(f"No free /{prefixlen} left in {self.pool}")
+                wrapped = True
+                candidate = pool_start
+                continue
+            conflicts = self._overlapping(candidate, end)
+            if not conflicts:
+                self._insert(candidate, end, owner)
+                self._next = end + 1
+                return str(_network(candidate, end))
+            candidate = _align(conflicts[-1][1] + 1, size)
+
+    def release(self, owner: str) -> list:
+        released = [b for b in self._blocks if b[2] == owner]
+        self._blocks = [b for b in self._blocks if b[2] != owner]
+        self._starts = [b[0] for b in self._blocks]
+        return [str(_network(start, end)) for start, end, _ in released]
+
+    def save(self, ledger: str = None):
+        # Write the ledger atomically so concurrent readers never see half a file
+        ledger = ledger or self.ledger
+        directory = os.path.dirname(os.path.abspath(ledger))
+        with tempfile.NamedTemporaryFile(
+            "w", dir=directory, delete=False, suffix=".tmp"
+        ) as f:
+            try:
+                json.dump(
+                    {"pool": str(self.pool), "allocations": self.allocations()},
+                    f,
+                    indent=2,
+                )
+                f.flush()
+                os.fsync(f.fileno())
+            except BaseException:
+                os.unlink(f.name)
+                raise
+        os.replace(f.name, ledger)
+
+    def _overlapping(self, start: int, end: int) -> list:
+        last = bisect.bisect_right(self._starts, end)
+        first = bisect.bisect_left(self._starts, start)
+        if first > 0 and self._blocks[first - 1][1] >= start:
+            first -= 1
+        return self._blocks[first:last]
+
+    def _insert(self, start: int, end: int, owner: str):
+        index = bisect.bisect_left(self._starts, start)
+        self._starts.insert(index, start)
+        self._blocks.insert(index, (start, end, owner))
+
+
+@contextlib.contextmanager
+def open_ledger(ledger: str, pool: str = DEFAULT_POOL):
+    # The allocator of a ledger file, held under an exclusive lock from load
+    # to save so concurrent synth runs never hand out the same prefix. The
+    # ledger is only written when the block exits cleanly.
+    os.makedirs(os.path.dirname(os.path.abspath(ledger)), exist_ok=True)
+    with open(f"{ledger}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            allocator = AddressAllocator(pool, ledger=ledger)
+            yield allocator
+            allocator.save()
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _align(address: int, size: int) -> int:
+    return -(-address // size) * size
+
+
+def _network(start: int, end: int):
+    # Blocks are always aligned powers of two, so the size gives the prefix length
+    address = ipaddress.ip_address(start)
+    prefixlen = address.max_prefixlen - (end - start + 1).bit_length() + 1
+    return ipaddress.ip_network((address, prefixlen))
+
+
+def allocate_topology(
+    allocator: AddressAllocator,
+    customer: str,
+    template: NetworkTopology,
+    vnet_prefixlen: int = 16,
+    tier_prefixlen: int = 24,
+    vpn_client_prefixlen: int = 24,
+    vpn_client_address_space: str = None,
+) -> NetworkTopology:
+    # Re-address a topology template for one customer. The VNet and VPN client
+    # pool come from the shared pool, or are the ones the customer already
+    # holds there, so the result is stable from run to run; tiers and the
+    # gateway subnet are carved out of the VNet. Explicit NSG rule prefixes
+    # follow the tiers they referred to; policies name tiers and pick up the
+    # new prefixes on their own. Pass vpn_client_address_space to use a
+    # shared client pool, e.g. a hub's, instead of allocating one.
+    def allocation(owner: str, prefixlen: int) -> str:
+        owned = allocator.owned(owner)
+        return owned[0] if owned else allocator.allocate(owner, prefixlen)
+
+    vnet = allocation(customer, vnet_prefixlen)
+    vpn_client_pool = vpn_client_address_space or allocation(
+        f"{customer}/vpn-client", vpn_client_prefixlen
+    )
+    subnets = AddressAllocator(vnet)
+    mapping = {template.vpn_client_address_space: vpn_client_pool}
+    for tier in template.tiers:
+        mapping[tier.cidr] = subnets.allocate(tier.name, tier_prefixlen)
+    gateway_subnet = subnets.allocate("GatewaySubnet", tier_prefixlen)
+
+    tiers = tuple(
+        replace(
+            tier,
+            cidr=mapping[tier.cidr],
+            rules=tuple(
+                replace(
+                    rule,
+                    source_address_prefix=mapping.get(
+                        rule.source_address_prefix, rule.source_address_prefix
+                    ),
+                    destination_address_prefix=mapping.get(
+                        rule.destination_address_prefix,
+                        rule.destination_address_prefix,
+                    ),
+                )
+                for rule in tier.rules
+            ),
+        )
+        for tier in template.tiers
+    )
+    return NetworkTopology(
+        address_space=(vnet,),
+        gateway_subnet_cidr=gateway_subnet,
+        vpn_client_address_space=vpn_client_pool,
+        tiers=tiers,
+        policies=template.policies,
+    )
+
+
+def check_topology(topology: NetworkTopology):
+    # Reject a topology whose subnets overlap or fall outside the VNet, or
+    # whose VPN client pool overlaps the VNet
+    spaces = [ipaddress.ip_network(cidr) for cidr in topology.address_space]
+    subnets = [(tier.subnet_name, tier.cidr) for tier in topology.tiers]
+    subnets.append(("GatewaySubnet", topology.gateway_subnet_cidr))
+    within = AddressAllocator("0.0.0.0/0")
+    for name, cidr in subnets:
+        network = ipaddress.ip_network(cidr)
+        if not any(network.subnet_of(space) for space in spaces):
+            raise ValueError(
+                f"Subnet {name} ({cidr}) is outside {topology.address_space}"
+            )
+        within.reserve(name, cidr)
+    vpn_client_pool = ipaddress.ip_network(topology.vpn_client_address_space)
+    if any(vpn_client_pool.overlaps(space) for space in spaces):
+        raise AddressOverlapError(
+            f"VPN client pool {vpn_client_pool} overlaps {topology.address_space}"
+        )
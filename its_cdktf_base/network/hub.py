@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+import ipaddress
+from dataclasses import dataclass, replace
+
+from its_cdktf_base.interning import intern
+from its_cdktf_base.network.address_allocator import (
+    AddressAllocator,
+    AddressOverlapError,
+    allocate_topology,
+)
+from its_cdktf_base.network.topology import (
+    VPN_CLIENT_POOL,
+    NetworkTopology,
+    SubnetTier,
+)
+from its_cdktf_base.region import RegionConfig
+
+# Region name of the hub, which suffixes its resource group names
+HUB_REGION_NAME = "hub"
+
+# Names add_core gives the hub's resource group and virtual network
+HUB_RESOURCE_GROUP = "its-networking-stack"
+HUB_VNET_NAME = "its-vnet"
+
+# The hub only holds shared services; customer workloads live in the spokes
+DEFAULT_HUB_TOPOLOGY = NetworkTopology(
+    address_space=("10.254.0.0/16",),
+    gateway_subnet_cidr="10.254.254.0/24",
+    vpn_client_address_space=VPN_CLIENT_POOL,
+    tiers=(SubnetTier(name="shared", cidr="10.254.1.0/24", nat=True),),
+)
+
+DEFAULT_HUB_REGION = RegionConfig(name=HUB_REGION_NAME, topology=DEFAULT_HUB_TOPOLOGY)
+
+
+@dataclass(frozen=True, slots=True)
+class HubConfig:
+    # Where the hub network lives. Spokes only need this plain data to peer
+    # with the hub, so they can be synthesized in any app or worker.
+    subscription_id: str
+    region: RegionConfig = DEFAULT_HUB_REGION
+
+    @classmethod
+    def from_dict(cls, spec: dict):
+        # Build a hub from plain data, e.g. a customer inventory entry
+        spec = dict(spec)
+        if "region" in spec:
+            spec["region"] = RegionConfig.from_dict(
+                {"name": HUB_REGION_NAME, **spec["region"]}
+            )
+        return intern(cls(**spec))
+
+    @property
+    def topology(self) -> NetworkTopology:
+        return self.region.topology
+
+    @property
+    def resource_group_name(self) -> str:
+        return self.region.resource_group_name(HUB_RESOURCE_GROUP)
+
+    @property
+    def vnet_name(self) -> str:
+        return HUB_VNET_NAME
+
+    @property
+    def vnet_id(self) -> str:
+        return (
+            f"/subscriptions/{self.subscription_id}/resourceGroups/"
+            f"{self.resource_group_name}/providers/Microsoft.Network/"
+            f"virtualNetworks/{self.vnet_name}"
+        )
+
+    def spoke_topology(self, topology: NetworkTopology) -> NetworkTopology:
+        # A spoke's topology with VPN policies pointing at the hub's client
+        # pool. Peered address spaces must not overlap, so a spoke overlapping
+        # the hub or its VPN clients is rejected here rather than at apply.
+        hub_spaces = [
+            ipaddress.ip_network(cidr)
+            for cidr in self.topology.address_space
+            + (self.topology.vpn_client_address_space,)
+        ]
+        for cidr in topology.address_space:
+            network = ipaddress.ip_network(cidr)
+            overlapping = [
+                str(space) for space in hub_spaces if network.overlaps(space)
+            ]
+            if overlapping:
+                raise AddressOverlapError(
+                    f"Spoke address space {cidr} overlaps the hub's {overlapping}"
+                )
+        return replace(
+            topology, vpn_client_address_space=self.topology.vpn_client_address_space
+        )
+
+    def assign_spoke(
+        self,
+        allocator: AddressAllocator,
+        owner: str,
+        topology: NetworkTopology = None,
+        template: NetworkTopology = None,
+    ) -> NetworkTopology:
+        # The spoke topology of owner, with its address space claimed in
+        # allocator so no other spoke of this hub can overlap it. Without a
+        # topology, template is re-addressed to the VNet owner holds in
+        # allocator, or to a new one.
+        for cidr in self.topology.address_space + (
+            self.topology.vpn_client_address_space,
+        ):
+            if ipaddress.ip_network(cidr).subnet_of(allocator.pool):
+                allocator.claim(self.vnet_id, cidr)
+        if topology is None:
+            if template is None:
+                raise ValueError(f"Spoke {owner} needs a topology or a template")
+            topology = allocate_topology(
+                allocator,
+                owner,
+                template,
+                vpn_client_address_space=self.topology.vpn_client_address_space,
+            )
+        topology = self.spoke_topology(topology)
+        held = allocator.owned(owner)
+        if sorted(held) != sorted(topology.address_space):
+            allocator.release(owner)
+            for cidr in topology.address_space:
+                allocator.reserve(owner, cidr)
+        return topology
+
+
+def hub_config(hub) -> HubConfig:
+    # Spoke constructors accept a HubConfig or its plain data
+    if isinstance(hub, dict):
+        return HubConfig.from_dict(hub)
+    return hub
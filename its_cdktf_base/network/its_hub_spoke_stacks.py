@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+from constructs import Construct
+from cdktf import TerraformStack
+from its_cdktf_base.deploy.backend import its_backend
+from its_cdktf_base.network.address_allocator import AddressAllocator, check_topology
+from its_cdktf_base.network.hub import HubConfig, hub_config
+from its_cdktf_base.network.layers import (
+    AUTHORED_DEPENDS_ON,
+    REQUIRED_ORDERING,
+    add_core,
+    add_egress,
+    add_gateway,
+    add_peering,
+    add_security,
+)
+from its_cdktf_base.network.topology import NetworkTopology
+from its_cdktf_base.region import DEFAULT_REGION, RegionConfig, region_config
+from its_cdktf_base.registry import ProviderRegistry
+from its_cdktf_base.synth.dependency_graph import apply_required_ordering
+
+
+class ItsHubStack(TerraformStack):
+    # The one network per region that owns the VPN gateway and NAT gateway.
+    # Customer networks are spokes peered to it, so a new customer does not
+    # wait on (or pay for) a gateway of its own.
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        hub: HubConfig,
+        tenant_id: str = None,
+        customer: str = None,
+    ):
+        super().__init__(scope, id)
+
+        # Keep state in the operator's bootstrapped storage, local otherwise
+        if customer:
+            its_backend(self, customer)
+
+        # Accept plain data, e.g. from an inventory file
+        hub = hub_config(hub)
+        self.hub = hub
+        check_topology(hub.topology)
+
+        # Address spaces of the spokes built against this stack, so two of
+        # them cannot overlap
+        self.spokes = AddressAllocator("0.0.0.0/0")
+
+        # Initialize the Azure provider in the hub's subscription
+        ProviderRegistry.of(self).provider(self, subscription_id=hub.subscription_id)
+
+        core = add_core(self, hub.topology, hub.region)
+        add_security(self, hub.topology, hub.region, core)
+        add_egress(self, hub.topology, hub.region, core)
+        add_gateway(self, hub.topology, hub.region, core, tenant_id)
+
+        # Add the ordering edges that attribute references do not cover
+        apply_required_ordering(self, REQUIRED_ORDERING, AUTHORED_DEPENDS_ON)
+
+
+class ItsSpokeStack(TerraformStack):
+    # A customer network with the subnet and NSG layout of
+    # ItsNetworkingStackBase, peered to a hub instead of running its own VPN
+    # gateway. VPN clients of the hub reach the spoke through gateway transit.
+    #
+    # Everything a spoke needs from the hub is plain data, and both peerings
+    # live in the spoke's stack, so adding a spoke is constant work and never
+    # changes the hub's stack or state.
+    #
+    # A NAT gateway only serves subnets of its own virtual network, so the
+    # hub's NAT gateway cannot carry spoke traffic. Spokes that need a fixed
+    # egress address set egress=True to get one of their own.
+    #
+    # Peered spokes must not overlap, so every spoke needs its own topology.
+    # The synth driver allocates one from the hub's address ledger for
+    # inventory spokes that leave it out.
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        hub,
+        topology: NetworkTopology = None,
+        region: RegionConfig = DEFAULT_REGION,
+        egress: bool = False,
+        customer: str = None,
+    ):
+        super().__init__(scope, id)
+
+        # Keep state in the customer's bootstrapped storage, local otherwise
+        if customer:
+            its_backend(self, customer)
+
+        # Accept plain data, e.g. from a customer inventory file
+        if isinstance(topology, dict):
+            topology = NetworkTopology.from_dict(topology)
+        if topology is None:
+            raise ValueError(
+                f"Spoke {id} needs its own topology; the region's default "
+                "would overlap every other spoke of the hub"
+            )
+
+        # The hub is an ItsHubStack in the same app, a HubConfig or its data.
+        # VPN policies use the hub's client pool.
+        if isinstance(hub, ItsHubStack):
+            self.add_dependency(hub)
+            topology = hub.hub.assign_spoke(hub.spokes, id, topology)
+            hub = hub.hub
+        hub = hub_config(hub)
+        topology = hub.spoke_topology(topology)
+        check_topology(topology)
+        region = region_config(region)
+        self.hub = hub
+        self.topology = topology
+
+        # Initialize the Azure provider
+        ProviderRegistry.of(self).provider(self)
+
+        # Create the resource group, virtual network and subnets; the hub's
+        # gateway stands in for the GatewaySubnet
+        self.core = add_core(self, topology, region, gateway_subnet=False)
+
+        # Create the nsgs and associate them with their subnets
+        add_security(self, topology, region, self.core)
+
+        if egress:
+            add_egress(self, topology, region, self.core)
+            apply_required_ordering(self, REQUIRED_ORDERING, AUTHORED_DEPENDS_ON)
+
+        # Peer with the hub in both directions
+        add_peering(self, self.core, hub)
+
+    def subnet_id(self, tier: str) -> str:
+        # Subnet id of a tier, usable from any other stack in the same app
+        return self.core.named_subnet_id(tier)
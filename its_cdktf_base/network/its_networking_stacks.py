@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+from constructs import Construct
+from cdktf import TerraformStack
+from its_cdktf_base.deploy.backend import its_backend
+from its_cdktf_base.network.address_allocator import check_topology
+from its_cdktf_base.network.layers import (
+    AUTHORED_DEPENDS_ON,
+    REQUIRED_ORDERING,
+    add_core,
+    add_egress,
+    add_gateway,
+    add_provider,
+    add_security,
+)
+from its_cdktf_base.network.topology import NetworkTopology
+from its_cdktf_base.region import DEFAULT_REGION, RegionConfig, region_config
+from its_cdktf_base.synth.dependency_graph import apply_required_ordering
+
+
+class ItsNetworkCoreStack(TerraformStack):
+    # Resource group, virtual network and subnets
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        topology: NetworkTopology = None,
+        region: RegionConfig = DEFAULT_REGION,
+        customer: str = None,
+    ):
+        super().__init__(scope, id)
+        if customer:
+            its_backend(self, customer)
+        self.customer = customer
+
+        # Accept plain data, e.g. from a customer inventory file
+        region = region_config(region)
+        if isinstance(topology, dict):
+            topology = NetworkTopology.from_dict(topology)
+
+        # An explicit topology overrides the region's address layout
+        topology = topology or region.topology
+
+        # Fail at synth time instead of at apply time on overlapping prefixes
+        check_topology(topology)
+
+        self.topology = topology
+        self.region = region
+        add_provider(self)
+        self.core = add_core(self, topology, region)
+
+    def subnet_id(self, tier: str) -> str:
+        # Subnet id of a tier, usable from any other stack in the same app
+        return self.core.named_subnet_id(tier)
+
+
+class ItsNetworkSecurityStack(TerraformStack):
+    # NSGs with their inline rules and the subnet associations
+    def __init__(self, scope: Construct, id: str, core: ItsNetworkCoreStack):
+        super().__init__(scope, id)
+        if core.customer:
+            its_backend(self, core.customer)
+        add_provider(self)
+        add_security(self, core.topology, core.region, core.core)
+
+
+class ItsNetworkEgressStack(TerraformStack):
+    # NAT gateway, its public ip and the subnet associations
+    def __init__(self, scope: Construct, id: str, core: ItsNetworkCoreStack):
+        super().__init__(scope, id)
+        if core.customer:
+            its_backend(self, core.customer)
+        add_provider(self)
+        add_egress(self, core.topology, core.region, core.core)
+
+        # Add the ordering edges that attribute references do not cover
+        apply_required_ordering(self, REQUIRED_ORDERING, AUTHORED_DEPENDS_ON)
+
+
+class ItsNetworkGatewayStack(TerraformStack):
+    # Virtual network gateway and its public ip
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        core: ItsNetworkCoreStack,
+        tenant_id: str = None,
+    ):
+        super().__init__(scope, id)
+        if core.customer:
+            its_backend(self, core.customer)
+        add_provider(self)
+        add_gateway(self, core.topology, core.region, core.core, tenant_id)
+
+
+class ItsNetworkingStacks:
+    # The networking stack split into four stacks with their own state files,
+    # wired through cdktf cross-stack references. An NSG change only plans the
+    # security stack.
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        topology: NetworkTopology = None,
+        region: RegionConfig = DEFAULT_REGION,
+        tenant_id: str = None,
+        customer: str = None,
+    ):
+        self.core = ItsNetworkCoreStack(scope, f"{id}-core", topology, region, customer)
+        self.security = ItsNetworkSecurityStack(scope, f"{id}-security", self.core)
+        self.egress = ItsNetworkEgressStack(scope, f"{id}-egress", self.core)
+        self.gateway = ItsNetworkGatewayStack(
+            scope, f"{id}-gateway", self.core, tenant_id
+        )
+        # The gateway only depends on the core stack it references, so it
+        # builds while the security and egress stacks deploy
+
+    def stacks(self) -> list:
+        return [self.core, self.security, self.egress, self.gateway]
+
+    def subnet_id(self, tier: str) -> str:
+        return self.core.subnet_id(tier)
@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+from constructs import Construct
+from cdktf import Fn, TerraformIterator, TerraformLocal, TerraformStack
+from its_cdktf_base.lazy_imports import lazy_import
+from its_cdktf_base.network.hub import HubConfig
+from its_cdktf_base.network.topology import NetworkTopology
+from its_cdktf_base.region import RegionConfig
+from its_cdktf_base.registry import ProviderRegistry
+from its_cdktf_base.references import (
+    instance_map,
+    instance_reference,
+    moved_to_instances,
+)
+
+# Provider bindings are loaded on first use to keep module import cheap
+nat_gateway = lazy_import("imports.azurerm.nat_gateway")
+nat_gateway_public_ip_association = lazy_import(
+    "imports.azurerm.nat_gateway_public_ip_association"
+)
+network_security_group = lazy_import("imports.azurerm.network_security_group")
+public_ip = lazy_import("imports.azurerm.public_ip")
+resource_group = lazy_import("imports.azurerm.resource_group")
+subnet = lazy_import("imports.azurerm.subnet")
+subnet_nat_gateway_association = lazy_import(
+    "imports.azurerm.subnet_nat_gateway_association"
+)
+subnet_network_security_group_association = lazy_import(
+    "imports.azurerm.subnet_network_security_group_association"
+)
+virtual_network = lazy_import("imports.azurerm.virtual_network")
+virtual_network_gateway = lazy_import("imports.azurerm.virtual_network_gateway")
+virtual_network_peering = lazy_import("imports.azurerm.virtual_network_peering")
+
+# Ordering edges Terraform cannot derive from attribute references, by construct id.
+# Everything else is ordered by the .id/.name references between resources.
+# Edges between layers deployed as separate stacks become stack dependencies.
+# The gateway only waits on what it references (its subnet and public ip),
+# so NSGs, their associations and the NAT gateway deploy while it builds.
+REQUIRED_ORDERING = {
+    # The NAT gateway must have its public ip before subnets start routing through it
+    "its-natgw-associations": ["its-natgw-public-ip-association"],
+}
+
+# The depends_on the networking stack was written with before pruning, by the
+# construct ids of the layers below. NSG rules are now inline in its-nsgs.
+# apply_required_ordering records these as the baseline of the critical path
+# report; they are never synthesized as depends_on.
+AUTHORED_DEPENDS_ON = {
+    "its-vnet": ["its-networking-stack"],
+    "its-subnets": ["its-vnet"],
+    "its-vngw-subnet": ["its-vnet"],
+    "its-nsgs": ["its-vnet"],
+    "its-nsg-associations": ["its-subnets", "its-nsgs"],
+    "its-natgw": ["its-natgw-public-ip"],
+    "its-natgw-public-ip-association": ["its-natgw", "its-natgw-public-ip"],
+    "its-natgw-associations": [
+        "its-subnets",
+        "its-natgw-public-ip",
+        "its-natgw",
+        "its-natgw-public-ip-association",
+    ],
+    "its-vngw": [
+        "its-networking-stack",
+        "its-vnet",
+        "its-subnets",
+        "its-vngw-subnet",
+        "its-vngw-public-ip",
+        "its-nsgs",
+        "its-nsg-associations",
+        "its-natgw-public-ip",
+        "its-natgw",
+        "its-natgw-public-ip-association",
+        "its-natgw-associations",
+    ],
+}
+
+# The layers below add the networking resources to a stack. They keep the
+# construct ids of the original single stack, so ItsNetworkingStackBase and the
+# split stacks produce the same resource addresses.
+
+
+# Construct ids the single stack gave each tier's resources before they used
+# for_each, by the id of the for_each resource that replaced them. Their NSG
+# rules were standalone resources then and have no counterpart to move to.
+LEGACY_TIER_IDS = {
+    "its-subnets": "its-{}-subnet",
+    "its-nsgs": "its-{}-nsg",
+    "its-nsg-associations": "its-{}-nsg-association",
+    "its-natgw-associations": "its-{}-natgw-association",
+}
+
+
+def legacy_tier_moves(resource, tiers) -> list:
+    # (from, to) pairs that move each tier's legacy resource to its instance
+    legacy_id = LEGACY_TIER_IDS[resource.node.id]
+    return moved_to_instances(
+        resource, {tier: legacy_id.format(tier) for tier in tiers}
+    )
+
+
+class NetworkCore:
+    # Resources from the core layer that the other layers reference
+    def __init__(self, stack, resource_group, vnet, subnets, gateway_subnet, tiers=()):
+        self.stack = stack
+        self.resource_group = resource_group
+        self.vnet = vnet
+        self.subnets = subnets
+        self.gateway_subnet = gateway_subnet
+        self.tiers = tuple(tiers)
+        self._subnet_ids = None
+
+    @property
+    def subnet_ids(self):
+        # Subnet ids by tier for other stacks to look up. Created on first use,
+        # so a network that is not referenced from elsewhere declares no local.
+        if self._subnet_ids is None:
+            self._subnet_ids = TerraformLocal(
+                self.stack, "its-subnet-ids", instance_map(self.subnets, "id")
+            )
+        return self._subnet_ids
+
+    def subnet_id(self, scope: Construct, iterator) -> str:
+        # Subnet id for the tier at iterator.key, referenced directly within the
+        # core stack and through the cross-stack subnet id map from other stacks.
+        # The iterator's keys are tiers of the same topology, so the lookup
+        # default is never used.
+        if scope is self.stack:
+            return instance_reference(self.subnets, "each.key", "id")
+        return Fn.lookup(self.subnet_ids.as_string_map, iterator.key, "")
+
+    def named_subnet_id(self, tier: str) -> str:
+        if tier not in self.tiers:
+            raise ValueError(
+                f"Unknown subnet tier {tier!r}, expected one of {list(self.tiers)}"
+            )
+        return Fn.lookup(self.subnet_ids.as_string_map, tier, "")
+
+
+def add_provider(scope: Construct):
+    # Initialize the Azure provider, once per stack
+    return ProviderRegistry.of(scope).provider(scope)
+
+
+def add_core(
+    scope: Construct,
+    topology: NetworkTopology,
+    region: RegionConfig,
+    gateway_subnet: bool = True,
+) -> NetworkCore:
+    # Create resource group for the networking resources
+    its_networking_stack_rg = resource_group.ResourceGroup(
+        scope,
+        "its-networking-stack",
+        name=region.resource_group_name("its-networking-stack"),
+        location=region.location,
+    )
+
+    # Create the virtual network
+    its_vnet = virtual_network.VirtualNetwork(
+        scope,
+        "its-vnet",
+        name="its-vnet",
+        location=region.location,
+        resource_group_name=its_networking_stack_rg.name,
+        address_space=list(topology.address_space),
+    )
+
+    # Create one subnet per tier
+    subnets = TerraformIterator.from_map(topology.subnets())
+    its_subnets = subnet.Subnet(
+        scope,
+        "its-subnets",
+        for_each=subnets,
+        name=subnets.get_string("name"),
+        resource_group_name=its_networking_stack_rg.name,
+        virtual_network_name=its_vnet.name,
+        address_prefixes=subnets.get_list("address_prefixes"),
+    )
+
+    # Create the VNGW subnet, unless the network uses a hub's gateway
+    its_vngw_subnet = None
+    if gateway_subnet:
+        its_vngw_subnet = subnet.Subnet(
+            scope,
+            "its-vngw-subnet",
+            name="GatewaySubnet",
+            resource_group_name=its_networking_stack_rg.name,
+            virtual_network_name=its_vnet.name,
+            address_prefixes=[topology.gateway_subnet_cidr],
+        )
+
+    return NetworkCore(
+        scope,
+        its_networking_stack_rg,
+        its_vnet,
+        its_subnets,
+        its_vngw_subnet,
+        tiers=topology.subnets(),
+    )
+
+
+def add_security(
+    scope: Construct, topology: NetworkTopology, region: RegionConfig, core: NetworkCore
+):
+    # Create one network security group per tier with its compiled rules inline
+    nsg_specs = topology.nsgs()
+    nsgs = TerraformIterator.from_map(nsg_specs)
+    its_nsgs = network_security_group.NetworkSecurityGroup(
+        scope,
+        "its-nsgs",
+        for_each=nsgs,
+        name=nsgs.get_string("name"),
+        location=region.location,
+        resource_group_name=core.resource_group.name,
+        security_rule=nsgs.get_any("security_rules"),
+    )
+
+    # Associate every tier's subnet with its nsg
+    nsg_associations = TerraformIterator.from_map(
+        {name: {"name": nsg["name"]} for name, nsg in nsg_specs.items()}
+    )
+    its_nsg_associations = (
+        subnet_network_security_group_association.SubnetNetworkSecurityGroupAssociation(
+            scope,
+            "its-nsg-associations",
+            for_each=nsg_associations,
+            subnet_id=core.subnet_id(scope, nsg_associations),
+            network_security_group_id=instance_reference(its_nsgs, "each.key", "id"),
+        )
+    )
+    return its_nsgs, its_nsg_associations
+
+
+def add_egress(
+    scope: Construct, topology: NetworkTopology, region: RegionConfig, core: NetworkCore
+):
+    # Create the nat gateway public ip
+    its_natgw_public_ip = public_ip.PublicIp(
+        scope,
+        "its-natgw-public-ip",
+        name="its-natgw-public-ip",
+        resource_group_name=core.resource_group.name,
+        location=region.location,
+        allocation_method="Static",
+        sku=region.public_ip_sku,
+        zones=list(region.zones),
+    )
+
+    # Create the nat gateway
+    its_natgw = nat_gateway.NatGateway(
+        scope,
+        "its-natgw",
+        name="its-natgw",
+        resource_group_name=core.resource_group.name,
+        location=region.location,
+        sku_name=region.nat_gateway_sku,
+        idle_timeout_in_minutes=10,
+        zones=list(region.zones),
+    )
+
+    # Create the natgw public ip association
+    its_natgw_association = (
+        nat_gateway_public_ip_association.NatGatewayPublicIpAssociation(
+            scope,
+            "its-natgw-public-ip-association",
+            nat_gateway_id=its_natgw.id,
+            public_ip_address_id=its_natgw_public_ip.id,
+        )
+    )
+
+    # Route the tiers that need outbound access through the nat gateway
+    natgw_associations = TerraformIterator.from_map(topology.nat_tiers())
+    its_natgw_associations = subnet_nat_gateway_association.SubnetNatGatewayAssociation(
+        scope,
+        "its-natgw-associations",
+        for_each=natgw_associations,
+        subnet_id=core.subnet_id(scope, natgw_associations),
+        nat_gateway_id=its_natgw.id,
+    )
+    return its_natgw, its_natgw_associations
+
+
+def add_gateway(
+    scope: Construct,
+    topology: NetworkTopology,
+    region: RegionConfig,
+    core: NetworkCore,
+    tenant_id: str = None,
+):
+    # Use the injected tenant id, or read it once per app from the azurerm client
+    if tenant_id is None:
+        tenant_id = ProviderRegistry.of(scope).tenant_id(scope)
+
+    # Create a public ip for our VNGW
+    its_vngw_public_ip = public_ip.PublicIp(
+        scope,
+        "its-vngw-public-ip",
+        name="its-vngw-public-ip",
+        location=region.location,
+        allocation_method="Dynamic",
+        resource_group_name=core.resource_group.name,
+    )
+
+    # The VPN client configuration is shared by every gateway with the same
+    # client address space and tenant
+    its_vngw_client_config = topology.vpn_client_config(tenant_id).to_struct()
+
+    # Create the virtual network gateway
+    its_vngw = virtual_network_gateway.VirtualNetworkGateway(
+        scope,
+        "its-vngw",
+        name="its-vngw",
+        resource_group_name=core.resource_group.name,
+        location=region.location,
+        type="Vpn",
+        sku=region.vngw_sku,
+        vpn_type="RouteBased",
+        ip_configuration=[
+            virtual_network_gateway.VirtualNetworkGatewayIpConfiguration(
+                name="vngw-config",
+                public_ip_address_id=its_vngw_public_ip.id,
+                private_ip_address_allocation="Dynamic",
+                subnet_id=core.gateway_subnet.id,
+            )
+        ],
+        vpn_client_configuration=its_vngw_client_config,
+    )
+    return its_vngw
+
+
+def add_peering(scope: Construct, core: NetworkCore, hub: HubConfig):
+    # Peer a spoke's virtual network with the hub in both directions. Both
+    # peerings live in the spoke's stack, so adding a spoke leaves the hub
+    # stack and every other spoke untouched. The hub side lives in the hub's
+    # subscription and uses a provider aliased to it.
+    hub_provider = ProviderRegistry.of(scope).provider(
+        scope, alias="hub", subscription_id=hub.subscription_id
+    )
+    spoke = TerraformStack.of(scope).node.id
+
+    # The hub shares its VPN gateway with the spoke
+    hub_to_spoke = virtual_network_peering.VirtualNetworkPeering(
+        scope,
+        "its-hub-to-spoke-peering",
+        provider=hub_provider,
+        name=f"hub-to-{spoke}",
+        resource_group_name=hub.resource_group_name,
+        virtual_network_name=hub.vnet_name,
+        remote_virtual_network_id=core.vnet.id,
+        allow_virtual_network_access=True,
+        allow_forwarded_traffic=True,
+        allow_gateway_transit=True,
+    )
+
+    # The spoke routes VPN traffic through the hub's gateway, which also
+    # advertises the spoke's prefixes to VPN clients. Azure only accepts
+    # use_remote_gateways once the hub side allows gateway transit.
+    spoke_to_hub = virtual_network_peering.VirtualNetworkPeering(
+        scope,
+        "its-spoke-to-hub-peering",
+        name=f"{spoke}-to-hub",
+        resource_group_name=core.resource_group.name,
+        virtual_network_name=core.vnet.name,
+        remote_virtual_network_id=hub.vnet_id,
+        allow_virtual_network_access=True,
+        allow_forwarded_traffic=True,
+        use_remote_gateways=True,
+        depends_on=[hub_to_spoke],
+    )
+    return hub_to_spoke, spoke_to_hub
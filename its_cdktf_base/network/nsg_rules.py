@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+import bisect
+import functools
+import ipaddress
+from dataclasses import asdict, dataclass
+
+# Named services a policy can allow, as (protocol, destination port)
+SERVICES = {
+    "any": ("*", "*"),
+    "rdp": ("Tcp", "3389"),
+    "ssh": ("Tcp", "22"),
+    "http": ("Tcp", "80"),
+    "https": ("Tcp", "443"),
+    "dns": ("Udp", "53"),
+}
+
+# Source name that resolves to the VNGW point-to-site client pool
+VPN_CLIENTS = "vpn"
+
+FIRST_PRIORITY = 100
+PRIORITY_STEP = 10
+MAX_PRIORITY = 4096
+
+# Every attribute of an inline security_rule block. Inline rules are assigned
+# as a list of objects, so each object has to carry all of them. cdktf drops
+# None values from the synthesized JSON, so the form of a field a rule does
+# not use is an explicit empty value, never None.
+RULE_ATTRIBUTES = {
+    "name": None,
+    "description": "",
+    "priority": None,
+    "direction": None,
+    "access": None,
+    "protocol": None,
+    "source_port_range": "*",
+    "source_port_ranges": [],
+    "destination_port_range": "",
+    "destination_port_ranges": [],
+    "source_address_prefix": "",
+    "source_address_prefixes": [],
+    "destination_address_prefix": "",
+    "destination_address_prefixes": [],
+    "source_application_security_group_ids": [],
+    "destination_application_security_group_ids": [],
+}
+
+
+class PriorityCollisionError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Policy:
+    # Allow (or deny) traffic from sources to destinations for some services.
+    # Sources and destinations are tier names, "vpn", CIDRs or service tags.
+    # Inbound policies land on each destination tier's NSG, outbound policies
+    # on each source tier's NSG.
+    sources: tuple
+    destinations: tuple
+    services: tuple = ("any",)
+    access: str = "Allow"
+    direction: str = "Inbound"
+    name: str = None
+    priority: int = None
+
+
+def service_port(service: str) -> tuple:
+    # "rdp" or "Tcp/8080" -> (protocol, port)
+    if service in SERVICES:
+        return SERVICES[service]
+    protocol, _, port = service.partition("/")
+    if not port:
+        raise ValueError(f"Unknown service {service!r}, use a name or 'Tcp/<port>'")
+    return protocol, port
+
+
+def compile_rules(topology) -> dict:
+    # Compile a topology's explicit rules and policies into the inline
+    # security_rule list of each tier's NSG, keyed by tier name
+    tiers = {tier.name: tier for tier in topology.tiers}
+    prefixes = {name: tier.cidr for name, tier in tiers.items()}
+    prefixes[VPN_CLIENTS] = topology.vpn_client_address_space
+
+    # Expand every policy into one atom per NSG, protocol, port, source and
+    # destination, in evaluation order
+    atoms = {name: [] for name in tiers}
+    for order, policy in enumerate(topology.policies):
+        inbound = policy.direction == "Inbound"
+        owners = policy.destinations if inbound else policy.sources
+        for owner in owners:
+            if owner not in tiers:
+                raise ValueError(f"Policy {policy} targets unknown tier {owner!r}")
+            sources = (owner,) if not inbound else policy.sources
+            destinations = (owner,) if inbound else policy.destinations
+            for service in policy.services:
+                protocol, port = service_port(service)
+                for source in sources:
+                    for destination in destinations:
+                        atoms[owner].append(
+                            {
+                                "order": order,
+                                "name": policy.name,
+                                "priority": policy.priority,
+                                "direction": policy.direction,
+                                "access": policy.access,
+                                "protocol": protocol,
+                                "ports": frozenset((port,)),
+                                "sources": frozenset((prefixes.get(source, source),)),
+                                "destinations": frozenset(
+                                    (prefixes.get(destination, destination),)
+                                ),
+                            }
+                        )
+
+    return {
+        name: _assign_priorities(name, tiers[name].rules, _merge(atoms[name]))
+        for name in tiers
+    }
+
+
+# Dimensions of a rule; two rules merge exactly when they differ in only one
+DIMENSIONS = ("ports", "sources", "destinations")
+
+
+def _merge(atoms: list) -> list:
+    # Merge rules whose union covers exactly the traffic of both, until no
+    # more merges apply. A later rule is only folded into an earlier one if no
+    # rule of the opposite access between them overlaps it, so every packet
+    # still meets the same first matching rule.
+    rules = list(atoms)
+    while True:
+        merged = _merge_pass(rules)
+        if len(merged) == len(rules):
+            break
+        rules = merged
+    return [
+        dict(
+            rule,
+            ports=sorted(rule["ports"], key=_port_key),
+            sources=sorted(rule["sources"]),
+            destinations=sorted(rule["destinations"]),
+        )
+        for rule in rules
+    ]
+
+
+def _merge_pass(rules: list) -> list:
+    merged = []
+    candidates = {}
+    # Positions in merged of the rules of each (direction, access)
+    positions = {}
+    for rule in rules:
+        target = _merge_target(merged, candidates, positions, rule)
+        if target:
+            index, dimension = target
+            values = merged[index][dimension] | rule[dimension]
+            if dimension == "ports" and "*" in values:
+                values = frozenset(("*",))
+            merged[index] = dict(merged[index], **{dimension: values})
+        else:
+            index = len(merged)
+            merged.append(rule)
+            positions.setdefault((rule["direction"], rule["access"]), []).append(index)
+        for dimension in DIMENSIONS:
+            candidates.setdefault(_merge_key(merged[index], dimension), []).append(
+                index
+            )
+    return merged
+
+
+def _merge_target(merged: list, candidates: dict, positions: dict, rule: dict):
+    # (index, dimension) of the latest earlier rule the rule can merge into
+    opposite = "Deny" if rule["access"] == "Allow" else "Allow"
+    between = positions.get((rule["direction"], opposite), [])
+    best = None
+    for dimension in DIMENSIONS:
+        key = _merge_key(rule, dimension)
+        for index in reversed(candidates.get(key, ())):
+            if best and index <= best[0]:
+                break
+            if _merge_key(merged[index], key[0]) != key:
+                continue
+            if not _can_combine(dimension, merged[index], rule):
+                continue
+            later = between[bisect.bisect_right(between, index) :]
+            if any(_overlaps(merged[other], rule) for other in later):
+                # Earlier candidates are behind the same rule
+                break
+            best = (index, dimension)
+            break
+    return best
+
+
+def _merge_key(rule: dict, dimension: str) -> tuple:
+    # Everything that has to match for two rules to merge along dimension
+    return (dimension, rule["access"], rule["direction"], rule["priority"]) + tuple(
+        rule[other] if other != dimension else None
+        for other in ("protocol",) + DIMENSIONS
+    )
+
+
+def _can_combine(dimension: str, first: dict, second: dict) -> bool:
+    # Service tags, "*" and VirtualNetwork only go in the singular
+    # *_address_prefix fields, so they never share a rule with other prefixes
+    if dimension == "ports":
+        return True
+    return all(_network(value) for value in first[dimension] | second[dimension])
+
+
+@functools.lru_cache(maxsize=None)
+def _network(value: str):
+    try:
+        return ipaddress.ip_network(value, strict=False)
+    except ValueError:
+        return None
+
+
+def _overlaps(first: dict, second: dict) -> bool:
+    # Whether any packet matches both rules; tags are assumed to match
+    # anything
+    if "*" not in (first["protocol"], second["protocol"]):
+        if first["protocol"] != second["protocol"]:
+            return False
+    return (
+        _ranges_overlap(first["ports"], second["ports"])
+        and _prefixes_overlap(first["sources"], second["sources"])
+        and _prefixes_overlap(first["destinations"], second["destinations"])
+    )
+
+
+def _ranges_overlap(first, second) -> bool:
+    return any(
+        a[0] <= b[1] and b[0] <= a[1]
+        for a in map(_port_range, first)
+        for b in map(_port_range, second)
+    )
+
+
+def _port_range(port: str) -> tuple:
+    if port == "*":
+        return (0, 65535)
+    low, _, high = port.partition("-")
+    return int(low), int(high or low)
+
+
+def _prefixes_overlap(first, second) -> bool:
+    for a in first:
+        for b in second:
+            a_network, b_network = _network(a), _network(b)
+            if a_network is None or b_network is None:
+                return True
+            if a_network.version == b_network.version and a_network.overlaps(b_network):
+                return True
+    return False
+
+
+def _port_key(port: str):
+    first = port.split("-")[0]
+    return (0, int(first)) if first.isdigit() else (1, port)
+
+
+def _assign_priorities(tier: str, explicit: tuple, compiled: list) -> list:
+    # Explicit priorities must be unique per direction, and compiled rules
+    # without one take the next free slot in policy order
+    taken = {}
+    rules = []
+    for rule in list(explicit) + [r for r in compiled if r["priority"]]:
+        priority, direction = _field(rule, "priority"), _field(rule, "direction")
+        name = _field(rule, "name") or f"unnamed {direction} policy"
+        if (direction, priority) in taken:
+            raise PriorityCollisionError(
+                f"NSG for tier {tier!r}: {direction} priority {priority} is used by "
+                f"{taken[(direction, priority)]!r} and {name!r}"
+            )
+        if not FIRST_PRIORITY <= priority <= MAX_PRIORITY:
+            raise ValueError(
+                f"NSG for tier {tier!r}: priority {priority} is outside "
+                f"{FIRST_PRIORITY}-{MAX_PRIORITY}"
+            )
+        taken[(direction, priority)] = name
+
+    for rule in explicit:
+        rules.append(dict(RULE_ATTRIBUTES, **asdict(rule)))
+
+    next_priority = {}
+    names = {rule["name"] for rule in rules}
+    for rule in compiled:
+        priority = rule["priority"]
+        if not priority:
+            priority = next_priority.get(rule["direction"], FIRST_PRIORITY)
+            while (rule["direction"], priority) in taken:
+                priority += PRIORITY_STEP
+            if priority > MAX_PRIORITY:
+                raise PriorityCollisionError(
+                    f"NSG for tier {tier!r} has no free {rule['direction']} priority"
+                )
+            taken[(rule["direction"], priority)] = rule["name"]
+            next_priority[rule["direction"]] = priority + PRIORITY_STEP
+        name = rule["name"] or f"{rule['access']}{rule['direction']}"
+        if name in names:
+            name = f"{name}-{priority}"
+        names.add(name)
+        rules.append(_inline_rule(rule, name, priority))
+    return sorted(rules, key=lambda rule: (rule["direction"], rule["priority"]))
+
+
+def _inline_rule(rule: dict, name: str, priority: int) -> dict:
+    inline = dict(
+        RULE_ATTRIBUTES,
+        name=name,
+        priority=priority,
+        direction=rule["direction"],
+        access=rule["access"],
+        protocol=rule["protocol"],
+    )
+    for single, plural, values in (
+        ("destination_port_range", "destination_port_ranges", rule["ports"]),
+        ("source_address_prefix", "source_address_prefixes", rule["sources"]),
+        (
+            "destination_address_prefix",
+            "destination_address_prefixes",
+            rule["destinations"],
+        ),
+    ):
+        if len(values) == 1:
+            inline[single] = values[0]
+        else:
+            inline[plural] = values
+    return inline
+
+
+def _field(rule, name: str):
+    return rule[name] if isinstance(rule, dict) else getattr(rule, name)
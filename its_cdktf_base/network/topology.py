@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+from dataclasses import asdict, dataclass, field
+
+from its_cdktf_base.interning import cached_struct, intern
+from its_cdktf_base.lazy_imports import lazy_import
+from its_cdktf_base.network.nsg_rules import VPN_CLIENTS, Policy, compile_rules
+
+# Provider bindings are loaded on first use to keep module import cheap
+virtual_network_gateway = lazy_import("imports.azurerm.virtual_network_gateway")
+
+# Application id of the Azure VPN client, the audience of its AAD tokens
+AZURE_VPN_AUDIENCE = "41b23e61-6c1e-4545-b367-cd054e0ed4b4"
+
+
+@dataclass(frozen=True, slots=True)
+class NsgRule:
+    name: str
+    priority: int
+    direction: str = "Inbound"
+    access: str = "Allow"
+    protocol: str = "*"
+    source_port_range: str = "*"
+    destination_port_range: str = "*"
+    source_address_prefix: str = "*"
+    destination_address_prefix: str = "*"
+
+
+@dataclass(frozen=True, slots=True)
+class SubnetTier:
+    # A subnet with its own NSG, optionally routed through the NAT gateway.
+    # Rules here are used as written; most traffic is better described by
+    # the topology's policies.
+    name: str
+    cidr: str
+    rules: tuple = ()
+    nat: bool = False
+
+    @property
+    def subnet_name(self) -> str:
+        return f"its-{self.name}-subnet"
+
+    @property
+    def nsg_name(self) -> str:
+        return f"its-{self.name}-nsg"
+
+
+@dataclass(frozen=True, slots=True)
+class VpnClientConfig:
+    # Point-to-site configuration of the VNGW, authenticated against the
+    # tenant's AAD with the Azure VPN client
+    address_space: tuple
+    tenant_id: str
+    protocols: tuple = ("OpenVPN",)
+    audience: str = AZURE_VPN_AUDIENCE
+
+    @cached_struct
+    def to_struct(self):
+        return virtual_network_gateway.VirtualNetworkGatewayVpnClientConfiguration(
+            address_space=list(self.address_space),
+            vpn_client_protocols=list(self.protocols),
+            aad_tenant=f"https://login.microsoftonline.com/{self.tenant_id}",
+            aad_audience=self.audience,
+            aad_issuer=f"https://sts.windows.net/{self.tenant_id}/",
+        )
+
+
+@dataclass(frozen=True)
+class NetworkTopology:
+    address_space: tuple
+    gateway_subnet_cidr: str
+    vpn_client_address_space: str
+    tiers: tuple = field(default_factory=tuple)
+    policies: tuple = field(default_factory=tuple)
+
+    @classmethod
+    def from_dict(cls, spec: dict):
+        # Build a topology from plain data, e.g. a customer inventory entry
+        tiers = tuple(
+            intern(
+                SubnetTier(
+                    name=tier["name"],
+                    cidr=tier["cidr"],
+                    rules=tuple(
+                        intern(NsgRule(**rule)) for rule in tier.get("rules", ())
+                    ),
+                    nat=tier.get("nat", False),
+                )
+            )
+            for tier in spec.get("tiers", ())
+        )
+        policies = tuple(
+            Policy(
+                **dict(
+                    policy,
+                    sources=tuple(policy["sources"]),
+                    destinations=tuple(policy["destinations"]),
+                    services=tuple(policy.get("services", ("any",))),
+                )
+            )
+            for policy in spec.get("policies", ())
+        )
+        return cls(
+            address_space=tuple(spec["address_space"]),
+            gateway_subnet_cidr=spec["gateway_subnet_cidr"],
+            vpn_client_address_space=spec["vpn_client_address_space"],
+            tiers=tiers,
+            policies=policies,
+        )
+
+    def to_dict(self) -> dict:
+        # Plain data that from_dict turns back into an equal topology
+        return asdict(self)
+
+    def subnets(self) -> dict:
+        # for_each maps, keyed by tier name
+        return {
+            tier.name: {"name": tier.subnet_name, "address_prefixes": [tier.cidr]}
+            for tier in self.tiers
+        }
+
+    def nsgs(self) -> dict:
+        # Each NSG carries its compiled rules inline
+        security_rules = compile_rules(self)
+        return {
+            tier.name: {
+                "name": tier.nsg_name,
+                "security_rules": security_rules[tier.name],
+            }
+            for tier in self.tiers
+        }
+
+    def nat_tiers(self) -> dict:
+        return {tier.name: {"name": tier.name} for tier in self.tiers if tier.nat}
+
+    def vpn_client_config(self, tenant_id: str) -> VpnClientConfig:
+        return intern(VpnClientConfig((self.vpn_client_address_space,), tenant_id))
+
+
+VPN_CLIENT_POOL = "10.10.10.0/24"
+
+DEFAULT_TOPOLOGY = NetworkTopology(
+    address_space=("10.0.0.0/16",),
+    gateway_subnet_cidr="10.0.254.0/24",
+    vpn_client_address_space=VPN_CLIENT_POOL,
+    tiers=(
+        SubnetTier(name="client", cidr="10.0.2.0/24", nat=True),
+        SubnetTier(name="server", cidr="10.0.1.0/24", nat=True),
+        SubnetTier(
+            name="dmz",
+            cidr="10.0.0.0/24",
+            rules=(
+                NsgRule(name="DenyAllInbound", priority=400, access="Deny"),
+                NsgRule(
+                    name="DenyAllOutbound",
+                    priority=410,
+                    direction="Outbound",
+                    access="Deny",
+                ),
+            ),
+        ),
+    ),
+    policies=(
+        Policy(
+            name="AllowVngwInbound",
+            sources=(VPN_CLIENTS,),
+            destinations=("client", "server"),
+            services=("rdp", "ssh"),
+        ),
+        Policy(
+            name="AllowServerAnyInbound",
+            sources=("server",),
+            destinations=("client",),
+        ),
+        Policy(
+            name="AllowClientAnyInbound",
+            sources=("client",),
+            destinations=("server",),
+        ),
+    ),
+)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+
+def address(resource) -> str:
+    # The resource's address in the synthesized configuration
+    return f"{resource.terraform_resource_type}.{resource.friendly_unique_id}"
+
+
+def instance_reference(resource, key: str, attribute: str) -> str:
+    # Reference one instance of a for_each or count resource, e.g.
+    # its-subnets[each.key].id or avd-session-host-nics[count.index].id
+    return f"${{{address(resource)}[{key}].{attribute}}}"
+
+
+def instance_map(resource, attribute: str) -> str:
+    # Map of instance key to attribute over a for_each resource
+    return (
+        f"${{{{ for key, instance in {address(resource)} : "
+        f"key => instance.{attribute} }}}}"
+    )
+
+
+def moved_blocks(stack, moves):
+    # One moved block per (from, to) address pair. A stack takes a single
+    # moved override, so every move of a stack goes in one call.
+    stack.add_override(
+        "moved", [{"from": source, "to": target} for source, target in moves]
+    )
+
+
+def moved_to_first_instance(stack, *resources):
+    # moved blocks from the address each resource had before it used count to
+    # its instance 0, so the object in existing state is kept, not replaced
+    moved_blocks(
+        stack,
+        [(address(resource), f"{address(resource)}[0]") for resource in resources],
+    )
+
+
+def moved_to_instances(resource, legacy_ids: dict) -> list:
+    # (from, to) pairs from the standalone resources a for_each resource
+    # replaced, by instance key, to its instances
+    return [
+        (
+            f"{resource.terraform_resource_type}.{legacy_id}",
+            f'{address(resource)}["{key}"]',
+        )
+        for key, legacy_id in legacy_ids.items()
+    ]
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+import inspect
+from dataclasses import dataclass
+
+from its_cdktf_base.network.topology import DEFAULT_TOPOLOGY, NetworkTopology
+
+DEFAULT_REGION_NAME = "primary"
+
+
+@dataclass(frozen=True)
+class RegionConfig:
+    # Everything that differs between two deployments of the same stacks. The
+    # name keeps construct ids unique when several regions share an app.
+    name: str = DEFAULT_REGION_NAME
+    location: str = "westus2"
+    zones: tuple = ("1",)
+    topology: NetworkTopology = DEFAULT_TOPOLOGY
+    vngw_sku: str = "Standard"
+    nat_gateway_sku: str = "Standard"
+    public_ip_sku: str = "Standard"
+
+    @classmethod
+    def from_dict(cls, spec: dict):
+        # Build a region from plain data, e.g. a customer inventory entry
+        spec = dict(spec)
+        if "topology" in spec:
+            spec["topology"] = NetworkTopology.from_dict(spec["topology"])
+        if "zones" in spec:
+            spec["zones"] = tuple(spec["zones"])
+        return cls(**spec)
+
+    @property
+    def address_space(self) -> tuple:
+        return self.topology.address_space
+
+    def resource_group_name(self, base: str) -> str:
+        # Resource group names are unique per subscription, so every region but
+        # the primary one gets a suffix. The primary keeps the existing names.
+        if self.name == DEFAULT_REGION_NAME:
+            return base
+        return f"{base}-{self.name}"
+
+
+DEFAULT_REGION = RegionConfig()
+
+
+def region_config(region) -> RegionConfig:
+    # Stack constructors accept a RegionConfig or its plain data
+    if isinstance(region, dict):
+        return RegionConfig.from_dict(region)
+    return region
+
+
+class RegionalStacks:
+    # One instance of a stack class per region, all in the same app. Each
+    # region gets its own stack and state, so regions plan and deploy in
+    # parallel (`cdktf deploy '<id>-*' --parallelism <n>`). Lookups that do not
+    # depend on the region, such as the tenant id, live once in the shared stack
+    # so no region depends on the state of another.
+    def __init__(
+        self,
+        scope,
+        id: str,
+        stack_class,
+        regions: list,
+        region_kwargs=None,
+        **kwargs,
+    ):
+        # Imported here so RegionConfig stays usable without cdktf installed
+        from its_cdktf_base.registry import ProviderRegistry
+        from its_cdktf_base.shared_stack import ItsSharedStack
+
+        # With an injected tenant id there is nothing left to share
+        tenant_id = ProviderRegistry.of(scope).tenant_id_value
+        self.shared = None
+        if tenant_id is None:
+            self.shared = ItsSharedStack(scope, f"{id}-shared")
+            tenant_id = self.shared.tenant_id
+
+        parameters = inspect.signature(stack_class).parameters
+        self.stacks = {}
+        for region in map(region_config, regions):
+            if region.name in self.stacks:
+                raise ValueError(f"Region name {region.name!r} is used twice")
+            stack_kwargs = dict(kwargs)
+            if region_kwargs:
+                stack_kwargs.update(region_kwargs(region))
+            if "tenant_id" in parameters:
+                stack_kwargs.setdefault("tenant_id", tenant_id)
+            self.stacks[region.name] = stack_class(
+                scope, f"{id}-{region.name}", region=region, **stack_kwargs
+            )
+
+    def __getitem__(self, name: str):
+        return self.stacks[name]
+
+    def __iter__(self):
+        return iter(self.stacks.values())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+import hashlib
+import json
+import weakref
+
+from constructs import Construct
+from cdktf import TerraformStack
+from its_cdktf_base.lazy_imports import lazy_import
+
+# Provider bindings are loaded on first use to keep module import cheap
+data_azurerm_client_config = lazy_import("imports.azurerm.data_azurerm_client_config")
+provider = lazy_import("imports.azurerm.provider")
+
+# cdktf.json context key that supplies the tenant id as a plain value
+TENANT_ID_CONTEXT_KEY = "its-cdktf-base:tenantId"
+
+# One registry per app, dropped with the app
+_registries = weakref.WeakKeyDictionary()
+
+
+def config_hash(config: dict) -> str:
+    encoded = json.dumps(config, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class ProviderRegistry:
+    # Memoizes providers and data sources across the stacks of one app, keyed
+    # by a hash of their configuration. Terraform cannot share a provider block
+    # between state files, so providers are memoized per stack and alias. Data
+    # sources are read once per app; stacks other than the one that created a
+    # data source reference it through cdktf cross-stack outputs.
+    def __init__(self, tenant_id: str = None):
+        self.tenant_id_value = tenant_id
+        self._providers = {}
+        self._data_sources = {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def of(cls, scope: Construct) -> "ProviderRegistry":
+        root = scope.node.root
+        registry = _registries.get(root)
+        if registry is None:
+            registry = cls(root.node.try_get_context(TENANT_ID_CONTEXT_KEY))
+            _registries[root] = registry
+        return registry
+
+    def provider(self, scope: Construct, alias: str = None, **config):
+        # The azurerm provider of scope's stack for this alias and configuration
+        stack = TerraformStack.of(scope)
+        config.setdefault("features", {})
+        key = (stack.node.path, alias)
+        digest = config_hash(config)
+        if key in self._providers:
+            existing, existing_digest = self._providers[key]
+            if existing_digest != digest:
+                raise ValueError(
+                    f"Stack {stack.node.path!r} already has an azurerm provider "
+                    f"with alias {alias!r} and a different configuration"
+                )
+            self.hits += 1
+            return existing
+        self.misses += 1
+        construct_id = "azure" if alias is None else f"azure-{alias}"
+        created = provider.AzurermProvider(stack, construct_id, alias=alias, **config)
+        self._providers[key] = (created, digest)
+        return created
+
+    def data_source(self, scope: Construct, data_class, id: str, **config):
+        # A data source shared by every stack of the app
+        key = (
+            f"{data_class.__module__}.{data_class.__qualname__}",
+            config_hash(config),
+        )
+        if key in self._data_sources:
+            self.hits += 1
+            return self._data_sources[key]
+        self.misses += 1
+        created = data_class(TerraformStack.of(scope), id, **config)
+        self._data_sources[key] = created
+        return created
+
+    def tenant_id(self, scope: Construct) -> str:
+        # The injected tenant id, or one client config data source for the app
+        if self.tenant_id_value:
+            return self.tenant_id_value
+        return self.data_source(
+            scope,
+            data_azurerm_client_config.DataAzurermClientConfig,
+            "azure-tenant-id",
+        ).tenant_id
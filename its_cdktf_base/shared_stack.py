@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+from constructs import Construct
+from cdktf import TerraformStack
+from its_cdktf_base.registry import ProviderRegistry
+
+
+class ItsSharedStack(TerraformStack):
+    # Lookups that are the same in every region, read once and referenced by
+    # the regional stacks. Created first, so the app's registry places the
+    # shared data sources here rather than in one of the regions.
+    def __init__(self, scope: Construct, id: str):
+        super().__init__(scope, id)
+
+        # Initialize the Azure provider
+        registry = ProviderRegistry.of(self)
+        registry.provider(self)
+
+        # Read the tenant id from the azurerm client
+        self.tenant_id = registry.tenant_id(self)
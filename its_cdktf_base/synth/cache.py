@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from importlib import metadata
+
+import its_cdktf_base
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "its-cdktf-base", "synth"
+)
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Installed packages whose version changes the synthesized JSON
+PROVIDER_PACKAGES = ["cdktf", "cdktf-cdktf-provider-azurerm"]
+
+
+@functools.lru_cache(maxsize=None)
+def library_digest() -> str:
+    # Hash the source of every stack class and the library code it builds on
+    digest = hashlib.sha256()
+    root = os.path.dirname(its_cdktf_base.__file__)
+    for directory, _, files in sorted(os.walk(root)):
+        for name in sorted(files):
+            if name.endswith(".py"):
+                path = os.path.join(directory, name)
+                digest.update(os.path.relpath(path, root).encode())
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def provider_pins(cdktf_json: str = "cdktf.json") -> tuple:
+    try:
+        with open(cdktf_json) as f:
+            return tuple(json.load(f).get("terraformProviders", []))
+    except FileNotFoundError:
+        return ()
+
+
+@functools.lru_cache(maxsize=None)
+def app_context(cdktf_json: str = "cdktf.json") -> dict:
+    # Context values such as an injected tenant id end up in the synthesized JSON
+    try:
+        with open(cdktf_json) as f:
+            return json.load(f).get("context", {})
+    except FileNotFoundError:
+        return {}
+
+
+@functools.lru_cache(maxsize=None)
+def provider_versions() -> tuple:
+    versions = []
+    for package in PROVIDER_PACKAGES:
+        try:
+            versions.append((package, metadata.version(package)))
+        except metadata.PackageNotFoundError:
+            versions.append((package, None))
+    return tuple(versions)
+
+
+def cache_key(
+    stack_class: str,
+    stack_id: str,
+    kwargs: dict,
+    cdktf_json: str = "cdktf.json",
+    app: list = None,
+) -> str:
+    # app lists (stack id, stack class, kwargs) of every stack synthesized in
+    # the same app, in construction order. A stack's JSON depends on its
+    # siblings too: cross-stack references become outputs and remote states,
+    # and ProviderRegistry puts data sources shared by the app, such as the
+    # tenant lookup, in whichever stack asks first. So any change to the app
+    # changes the key of each of its stacks.
+    inputs = {
+        "stack_class": stack_class,
+        "stack_id": stack_id,
+        "source": library_digest(),
+        "kwargs": kwargs,
+        "app": app or [],
+        "terraform_providers": provider_pins(cdktf_json),
+        "context": app_context(cdktf_json),
+        "provider_versions": provider_versions(),
+    }
+    encoded = json.dumps(inputs, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class SynthCache:
+    # Local on-disk cache of synthesized stack directories, one entry per key.
+    # Entry mtimes track last use, and eviction removes the least recently used
+    # entries until the cache fits in max_bytes.
+    def __init__(
+        self, root: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES
+    ):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.join(self.root, "entries"), exist_ok=True)
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.root, "entries", key)
+
+    def get(self, key: str):
+        # Returns the entry directory on a hit, None on a miss
+        path = self.entry_path(key)
+        if os.path.isfile(os.path.join(path, "manifest-entry.json")):
+            os.utime(path)
+            self.hits += 1
+            return path
+        self.misses += 1
+        return None
+
+    def put(self, key: str, stack_dir: str, manifest_entry: dict):
+        # Copy a synthesized stack directory into the cache atomically
+        path = self.entry_path(key)
+        if os.path.isdir(path):
+            return
+        staging = tempfile.mkdtemp(dir=os.path.join(self.root, "entries"))
+        shutil.copytree(stack_dir, os.path.join(staging, "stack"))
+        with open(os.path.join(staging, "manifest-entry.json"), "w") as f:
+            json.dump(manifest_entry, f)
+        try:
+            os.rename(staging, path)
+        except OSError:
+            # Another worker stored the same key first
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def restore(self, path: str, stack_dir: str) -> dict:
+        # Copy a cached stack directory into place and return its manifest entry
+        shutil.rmtree(stack_dir, ignore_errors=True)
+        shutil.copytree(os.path.join(path, "stack"), stack_dir)
+        with open(os.path.join(path, "manifest-entry.json")) as f:
+            return json.load(f)
+
+    def entries(self) -> list:
+        # (last used, size in bytes, path) for every complete entry
+        entries = []
+        root = os.path.join(self.root, "entries")
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if os.path.isfile(os.path.join(path, "manifest-entry.json")):
+                entries.append((os.path.getmtime(path), _size(path), path))
+        return entries
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self) -> int:
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        while entries and total > self.max_bytes:
+            _, size, path = entries.pop(0)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            evicted += 1
+        return evicted
+
+    def record(self, hits: int = 0, misses: int = 0) -> dict:
+        # Add counters to the persisted totals and return them
+        stats = self.stats()
+        stats["hits"] += self.hits + hits
+        stats["misses"] += self.misses + misses
+        self.hits = self.misses = 0
+        with open(os.path.join(self.root, "stats.json"), "w") as f:
+            json.dump(stats, f)
+        return stats
+
+    def stats(self) -> dict:
+        try:
+            with open(os.path.join(self.root, "stats.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"hits": 0, "misses": 0}
+
+
+def _size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(directory, name))
+        for directory, _, files in os.walk(path)
+        for name in files
+    )
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import tarfile
+
+from its_cdktf_base.synth.dependency_graph import (
+    DependencyGraph,
+    dependency_address,
+    resources,
+)
+from its_cdktf_base.synth.incremental import stack_files, write_bytes_if_changed
+
+# Written next to the archives; content hash and sizes per stack
+ARCHIVE_INDEX = "index.json"
+
+
+def canonical_json(config: dict) -> bytes:
+    # Sorted keys and no whitespace, so equal configs serialize to equal bytes
+    return json.dumps(
+        config, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    ).encode()
+
+
+def content_hash(config: dict) -> str:
+    return hashlib.sha256(canonical_json(config)).hexdigest()
+
+
+def compact_config(config: dict, strip_metadata: bool = False) -> dict:
+    # Drop depends_on entries that are listed twice, or that an attribute
+    # reference or a longer depends_on chain already implies. Only implied
+    # edges go, so terraform orders every resource exactly as before.
+    # Construct metadata ("//") is kept unless strip_metadata is set; terraform
+    # ignores it but cdktf and the tools here read construct paths from it.
+    compacted = json.loads(json.dumps(config))
+    redundant = DependencyGraph.from_config(compacted).redundant_depends_on()
+    for address, body in resources(compacted).items():
+        if strip_metadata:
+            body.pop("//", None)
+        if "depends_on" not in body:
+            continue
+        depends_on = []
+        for target in body["depends_on"]:
+            implied = dependency_address(target) in redundant.get(address, ())
+            if target not in depends_on and not implied:
+                depends_on.append(target)
+        if depends_on:
+            body["depends_on"] = depends_on
+        else:
+            del body["depends_on"]
+    if strip_metadata:
+        compacted.pop("//", None)
+    return compacted
+
+
+def archive(stack_dir: str) -> bytes:
+    # A gzipped tar of a stack's synthesized files that only depends on their
+    # names and contents: sorted entries, no timestamps and no owners
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb", filename="", mtime=0) as gz:
+        with tarfile.open(fileobj=gz, mode="w", format=tarfile.PAX_FORMAT) as tar:
+            for name in stack_files(stack_dir):
+                with open(os.path.join(stack_dir, name), "rb") as f:
+                    content = f.read()
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                info.mode = 0o644
+                tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def compact_outdir(
+    outdir: str, strip_metadata: bool = False, archive_dir: str = None
+) -> dict:
+    # Rewrite every stack of a cdktf.out as compact canonical JSON and, with
+    # archive_dir, write one archive per stack plus an index of content
+    # hashes. Files whose bytes do not change keep their mtime.
+    with open(os.path.join(outdir, "manifest.json")) as f:
+        manifest = json.load(f)
+    index = {}
+    for name, stack in manifest["stacks"].items():
+        path = os.path.join(outdir, stack["synthesizedStackPath"])
+        with open(path, "rb") as f:
+            synthesized = f.read()
+        config = compact_config(json.loads(synthesized), strip_metadata)
+        compacted = canonical_json(config)
+        write_bytes_if_changed(path, compacted)
+        index[name] = {
+            "sha256": hashlib.sha256(compacted).hexdigest(),
+            "bytes": {"synthesized": len(synthesized), "compacted": len(compacted)},
+        }
+        if archive_dir:
+            data = archive(os.path.join(outdir, stack["workingDirectory"]))
+            write_bytes_if_changed(os.path.join(archive_dir, f"{name}.tar.gz"), data)
+            index[name]["archive"] = f"{name}.tar.gz"
+            index[name]["archive_sha256"] = hashlib.sha256(data).hexdigest()
+            index[name]["bytes"]["archive"] = len(data)
+    if archive_dir:
+        # Archives of stacks that are no longer synthesized go with them
+        for file in os.listdir(archive_dir):
+            if file.endswith(".tar.gz") and file[: -len(".tar.gz")] not in index:
+                os.remove(os.path.join(archive_dir, file))
+        write_bytes_if_changed(
+            os.path.join(archive_dir, ARCHIVE_INDEX),
+            json.dumps(index, indent=2, sort_keys=True).encode(),
+        )
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Rewrite synthesized stacks as compact canonical JSON and archive them."
+    )
+    parser.add_argument("outdir", help="cdktf.out directory to compact in place")
+    parser.add_argument(
+        "--archive-dir",
+        help="Directory for the per-stack archives (default: <outdir>/archives)",
+    )
+    parser.add_argument(
+        "--no-archive", action="store_true", help="Only rewrite the JSON"
+    )
+    parser.add_argument(
+        "--strip-metadata",
+        action="store_true",
+        help="Also drop the // construct metadata terraform ignores",
+    )
+    args = parser.parse_args(argv)
+
+    archive_dir = None
+    if not args.no_archive:
+        archive_dir = args.archive_dir or os.path.join(args.outdir, "archives")
+    index = compact_outdir(args.outdir, args.strip_metadata, archive_dir)
+    for name, stack in index.items():
+        sizes = stack["bytes"]
+        archived = f", {sizes['archive']} archived" if "archive" in sizes else ""
+        print(
+            f"{name}: {sizes['synthesized']} -> {sizes['compacted']} bytes"
+            f"{archived}, sha256 {stack['sha256'][:12]}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+#!/usr/bin/env python
+import argparse
+import atexit
+import json
+import os
+import re
+import sys
+
+# Matches every Terraform interpolation in a synthesized attribute value
+INTERPOLATION = re.compile(r"\$\{(.*?)\}")
+
+# Matches resource and data source addresses inside an interpolation
+ADDRESS = re.compile(r"\b((?:data\.)?[a-z][a-z0-9_]*\.[A-Za-z0-9_-]+)")
+
+# Key of the "//" block where apply_required_ordering records the ordering it
+# applied and the depends_on it replaced
+METADATA_KEY = "its-cdktf-base"
+
+# The critical path report is printed after synth with ITS_CDKTF_CRITICAL_PATH=1
+# or "context": {"its-cdktf-base:criticalPath": true} in cdktf.json
+ENV_VAR = "ITS_CDKTF_CRITICAL_PATH"
+CONTEXT_KEY = "its-cdktf-base:criticalPath"
+
+# Rough provisioning time in seconds per resource type, used to weight the
+# critical path. Anything not listed is assumed to take DEFAULT_DURATION.
+DEFAULT_DURATION = 10
+DEFAULT_DURATIONS = {
+    "azurerm_resource_group": 5,
+    "azurerm_virtual_network": 15,
+    "azurerm_subnet": 10,
+    "azurerm_network_security_group": 5,
+    "azurerm_network_security_rule": 10,
+    "azurerm_subnet_network_security_group_association": 15,
+    "azurerm_subnet_nat_gateway_association": 15,
+    "azurerm_public_ip": 10,
+    "azurerm_nat_gateway": 60,
+    "azurerm_nat_gateway_public_ip_association": 15,
+    "azurerm_virtual_network_gateway": 2700,
+    "azurerm_virtual_network_peering": 20,
+    "azurerm_network_interface": 10,
+    "azurerm_windows_virtual_machine": 180,
+    "azurerm_virtual_machine_extension": 300,
+    "azurerm_virtual_desktop_workspace": 10,
+    "azurerm_virtual_desktop_host_pool": 15,
+    "azurerm_virtual_desktop_host_pool_registration_info": 5,
+    "azurerm_virtual_desktop_application_group": 15,
+}
+
+
+def resources(config: dict) -> dict:
+    # Flatten the synthesized resource and data blocks into address -> body
+    flattened = {}
+    for resource_type, instances in config.get("resource", {}).items():
+        for name, body in instances.items():
+            flattened[f"{resource_type}.{name}"] = body
+    for data_type, instances in config.get("data", {}).items():
+        for name, body in instances.items():
+            flattened[f"data.{data_type}.{name}"] = body
+    return flattened
+
+
+def dependency_address(entry: str) -> str:
+    # cdktf writes depends_on entries as "${address}"
+    if entry.startswith("${") and entry.endswith("}"):
+        return entry[2:-1]
+    return entry
+
+
+def depends_on(body: dict) -> list:
+    return [dependency_address(entry) for entry in body.get("depends_on", [])]
+
+
+def construct_ids(config: dict) -> dict:
+    # Map each construct id (the last segment of its construct path) to its address
+    ids = {}
+    for address, body in resources(config).items():
+        path = body.get("//", {}).get("metadata", {}).get("path")
+        ids[path.split("/")[-1] if path else address.split(".")[-1]] = address
+    return ids
+
+
+def references(value, known: set) -> set:
+    # Collect every known address referenced from an attribute value
+    found = set()
+    if isinstance(value, str):
+        for expression in INTERPOLATION.findall(value):
+            found.update(a for a in ADDRESS.findall(expression) if a in known)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            if key not in ("//", "depends_on"):
+                found |= references(item, known)
+    elif isinstance(value, list):
+        for item in value:
+            found |= references(item, known)
+    return found
+
+
+class DependencyGraph:
+    def __init__(self, implicit: dict, explicit: dict):
+        # Edges point from a resource to the resources it waits on
+        self.implicit = implicit
+        self.explicit = explicit
+
+    @classmethod
+    def from_config(cls, config: dict):
+        # A reference to a local stands for the references of its value
+        bodies = resources(config)
+        known = set(bodies)
+        values = {f"local.{name}": v for name, v in config.get("locals", {}).items()}
+        direct = {
+            name: references(v, known | set(values)) for name, v in values.items()
+        }
+        local_references = {}
+        for name in values:
+            found, pending = set(), [name]
+            while pending:
+                for address in direct[pending.pop()]:
+                    if address in values and address not in found:
+                        pending.append(address)
+                    found.add(address)
+            local_references[name] = found - set(values)
+
+        implicit = {}
+        explicit = {}
+        for address, body in bodies.items():
+            found = references(body, known | set(values))
+            for name in found & set(values):
+                found |= local_references[name]
+            implicit[address] = (found - set(values)) - {address}
+            explicit[address] = {d for d in depends_on(body) if d in known}
+        return cls(implicit, explicit)
+
+    def edges(self) -> dict:
+        return {
+            address: self.implicit[address] | self.explicit[address]
+            for address in self.implicit
+        }
+
+    def redundant_depends_on(self) -> dict:
+        # Explicit edges that are already implied by another path in the graph
+        edges = self.edges()
+        redundant = {}
+        for address, explicit in self.explicit.items():
+            for target in explicit:
+                others = edges[address] - {target}
+                if target in self.implicit[address] or _reachable(
+                    edges, others, target
+                ):
+                    redundant.setdefault(address, set()).add(target)
+        return redundant
+
+    def pruned(self, required: dict = None):
+        # Keep only the attribute references plus the required ordering edges,
+        # then drop any required edge another path already implies
+        explicit = {address: set() for address in self.implicit}
+        for address, targets in (required or {}).items():
+            explicit[address] = set(targets)
+        graph = DependencyGraph(self.implicit, explicit)
+        for address, targets in graph.redundant_depends_on().items():
+            explicit[address] -= targets
+        return graph
+
+    def schedule(self, durations: dict = None) -> dict:
+        # Earliest (start, finish) per address with unbounded parallelism
+        durations = DEFAULT_DURATIONS if durations is None else durations
+        edges = self.edges()
+        times = {}
+
+        def visit(address, stack=()):
+            if address in times:
+                return times[address][1]
+            if address in stack:
+                raise ValueError(f"Dependency cycle through {address}")
+            start = max(
+                (visit(p, stack + (address,)) for p in edges[address]), default=0
+            )
+            finish = start + duration(address, durations)
+            times[address] = (start, finish)
+            return finish
+
+        for address in edges:
+            visit(address)
+        return times
+
+    def critical_path(self, durations: dict = None) -> list:
+        durations = DEFAULT_DURATIONS if durations is None else durations
+        times = self.schedule(durations)
+        if not times:
+            return []
+        edges = self.edges()
+        address = max(times, key=lambda a: times[a][1])
+        path = [address]
+        while edges[address]:
+            address = max(edges[address], key=lambda a: times[a][1])
+            path.append(address)
+        return list(reversed(path))
+
+
+def duration(address: str, durations: dict) -> int:
+    parts = address.split(".")
+    resource_type = parts[1] if parts[0] == "data" else parts[0]
+    return durations.get(resource_type, DEFAULT_DURATION)
+
+
+def _reachable(edges: dict, starts: set, target: str) -> bool:
+    seen = set()
+    pending = list(starts)
+    while pending:
+        address = pending.pop()
+        if address == target:
+            return True
+        if address not in seen:
+            seen.add(address)
+            pending.extend(edges.get(address, ()))
+    return False
+
+
+def required_addresses(config: dict, ordering: dict) -> dict:
+    # Translate a construct id allowlist into resource addresses
+    ids = construct_ids(config)
+    return {
+        ids[construct_id]: {ids[p] for p in predecessors if p in ids}
+        for construct_id, predecessors in ordering.items()
+        if construct_id in ids
+    }
+
+
+def prune_depends_on(config: dict, ordering: dict = None) -> dict:
+    # Rewrite every depends_on in a synthesized config to the minimal edge set
+    graph = DependencyGraph.from_config(config).pruned(
+        required_addresses(config, ordering or {})
+    )
+    pruned = json.loads(json.dumps(config))
+    for address, body in resources(pruned).items():
+        depends_on = sorted(graph.explicit[address])
+        if depends_on:
+            body["depends_on"] = depends_on
+        else:
+            body.pop("depends_on", None)
+    return pruned
+
+
+def apply_required_ordering(stack, ordering: dict, authored: dict = None):
+    # Set depends_on on the constructs of a stack from a construct id allowlist
+    # Edges to constructs in other stacks are left to stack dependencies. The
+    # allowlist and the depends_on the stack was authored with go into the
+    # stack's "//" block, so the critical path report can compare the config
+    # as authored with the pruned one. authored maps construct ids to the
+    # construct ids they depended on before pruning; depends_on already set on
+    # a construct of the allowlist counts as authored too.
+    unpruned = {}
+    for construct_id, predecessors in (authored or {}).items():
+        resource = stack.node.try_find_child(construct_id)
+        found = [stack.node.try_find_child(p) for p in predecessors]
+        if resource is not None:
+            unpruned[resource.fqn] = [p.fqn for p in found if p is not None]
+    for construct_id, predecessors in ordering.items():
+        resource = stack.node.try_find_child(construct_id)
+        if resource is None:
+            continue
+        if resource.depends_on:
+            unpruned.setdefault(resource.fqn, [])
+            unpruned[resource.fqn] += [
+                d for d in resource.depends_on if d not in unpruned[resource.fqn]
+            ]
+        found = [stack.node.try_find_child(p) for p in predecessors]
+        resource.depends_on = [p.fqn for p in found if p is not None]
+    stack.add_override(
+        f"//.{METADATA_KEY}",
+        {
+            "requiredOrdering": {k: list(v) for k, v in ordering.items()},
+            "unprunedDependsOn": {k: v for k, v in unpruned.items() if v},
+        },
+    )
+    if report_enabled():
+        _report_at_exit()
+
+
+def recorded_ordering(config: dict) -> dict:
+    # What apply_required_ordering recorded in a synthesized config, if anything
+    return config.get("//", {}).get(METADATA_KEY, {})
+
+
+def unpruned_config(config: dict) -> dict:
+    # The config with the depends_on apply_required_ordering replaced put back
+    unpruned = json.loads(json.dumps(config))
+    bodies = resources(unpruned)
+    replaced = recorded_ordering(config).get("unprunedDependsOn", {})
+    for address, targets in replaced.items():
+        bodies[dependency_address(address)]["depends_on"] = list(targets)
+    return unpruned
+
+
+def report_enabled() -> bool:
+    if os.environ.get(ENV_VAR, "") not in ("", "0"):
+        return True
+    # cdktf-cli passes the cdktf.json context to the app in this variable
+    context = json.loads(os.environ.get("CDKTF_CONTEXT_JSON") or "{}")
+    return bool(context.get(CONTEXT_KEY))
+
+
+_report_registered = False
+
+
+def _report_at_exit():
+    global _report_registered
+    if not _report_registered:
+        _report_registered = True
+        atexit.register(report_outdir)
+
+
+def report_outdir(
+    outdir: str = None, durations: dict = None, watch: str = "its-vngw", stream=None
+) -> str:
+    # Critical path report of every stack of a synthesized app that
+    # apply_required_ordering ran on, comparing the config as authored with the
+    # pruned config. Runs at exit when the report is enabled.
+    outdir = outdir or os.environ.get("CDKTF_OUTDIR", "cdktf.out")
+    try:
+        with open(os.path.join(outdir, "manifest.json")) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    reports = []
+    for name, stack in sorted(manifest["stacks"].items()):
+        with open(os.path.join(outdir, stack["synthesizedStackPath"])) as f:
+            config = json.load(f)
+        recorded = recorded_ordering(config)
+        if not recorded:
+            continue
+        after = prune_depends_on(config, recorded["requiredOrdering"])
+        report = critical_path_report(unpruned_config(config), after, durations, watch)
+        reports.append(f"{name}:\n{report}")
+    text = "\n\n".join(reports)
+    if text:
+        print(text, file=stream or sys.stderr)
+    return text
+
+
+def critical_path_report(
+    before: dict, after: dict, durations: dict = None, watch: str = None
+) -> str:
+    # Compare the critical path of two synthesized configs of the same stack
+    durations = DEFAULT_DURATIONS if durations is None else durations
+    lines = []
+    rows = []
+    for label, config in (("before", before), ("after", after)):
+        graph = DependencyGraph.from_config(config)
+        times = graph.schedule(durations)
+        path = graph.critical_path(durations)
+        edge_count = sum(len(e) for e in graph.edges().values())
+        depends_on_count = sum(len(e) for e in graph.explicit.values())
+        finish = max((t[1] for t in times.values()), default=0)
+        rows.append((label, graph, times, path))
+        lines.append(
+            f"{label:>6}: {len(times)} resources, {edge_count} edges "
+            f"({depends_on_count} depends_on), critical path {len(path)} hops, "
+            f"~{finish / 60:.1f} min"
+        )
+    for label, graph, times, path in rows:
+        lines.append(f"{label:>6} critical path: {' -> '.join(path)}")
+    if watch:
+        waits_on = {}
+        for label, graph, times, path in rows:
+            ids = construct_ids(before if label == "before" else after)
+            address = ids.get(watch, watch)
+            if address in times:
+                waits_on[label] = _ancestors(graph.edges(), address)
+                lines.append(
+                    f"{label:>6}: {watch} starts at ~{times[address][0]}s "
+                    f"after {len(waits_on[label])} predecessors"
+                )
+        if len(waits_on) == 2:
+            # Summarize by type so dropped NSG rules stand out
+            released = {}
+            for address in waits_on["before"] - waits_on["after"]:
+                resource_type = address.split(".")[-2]
+                released[resource_type] = released.get(resource_type, 0) + 1
+            for resource_type, count in sorted(released.items()):
+                lines.append(f"{watch} no longer waits on {count} x {resource_type}")
+    return "\n".join(lines)
+
+
+def _ancestors(edges: dict, address: str) -> set:
+    seen = set()
+    pending = list(edges[address])
+    while pending:
+        current = pending.pop()
+        if current not in seen:
+            seen.add(current)
+            pending.extend(edges.get(current, ()))
+    return seen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Report the critical path of a synthesized stack before and after dependency pruning."
+    )
+    parser.add_argument("config", help="Path to a synthesized cdk.tf.json")
+    parser.add_argument(
+        "--baseline",
+        help="cdk.tf.json to report as 'before' (defaults to the config with "
+        "the depends_on recorded at synth put back)",
+    )
+    parser.add_argument(
+        "--watch",
+        default="its-vngw",
+        help="Construct id whose start time is reported (default: its-vngw)",
+    )
+    args = parser.parse_args(argv)
+
+    with open(args.config) as f:
+        config = json.load(f)
+    before = unpruned_config(config)
+    if args.baseline:
+        with open(args.baseline) as f:
+            before = json.load(f)
+
+    ordering = recorded_ordering(config).get("requiredOrdering")
+    if ordering is None:
+        from its_cdktf_base.network.layers import REQUIRED_ORDERING
+
+        ordering = REQUIRED_ORDERING
+    after = prune_depends_on(config, ordering)
+    print(critical_path_report(before, after, watch=args.watch))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+import argparse
+import contextlib
+import copy
+import importlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from its_cdktf_base.network.address_allocator import (
+    DEFAULT_POOL,
+    AddressAllocator,
+    open_ledger,
+)
+from its_cdktf_base.network.hub import hub_config
+from its_cdktf_base.network.topology import NetworkTopology
+from its_cdktf_base.region import DEFAULT_REGION, region_config
+from its_cdktf_base.synth.cache import (
+    DEFAULT_CACHE_DIR,
+    DEFAULT_MAX_BYTES,
+    SynthCache,
+    cache_key,
+)
+from its_cdktf_base.synth.compaction import compact_outdir
+from its_cdktf_base.synth.incremental import staging_outdir, sync_outdir
+
+# Where spoke address spaces are recorded, one ledger per hub subscription
+DEFAULT_LEDGER_DIR = "address-ledgers"
+
+# Stack classes a customer inventory can reference, by key
+STACKS = {
+    "network": "its_cdktf_base.network:ItsNetworkingStackBase",
+    "avd": "its_cdktf_base.compute:ItsVirtualDesktopStack",
+    "hub": "its_cdktf_base.network:ItsHubStack",
+    "spoke": "its_cdktf_base.network:ItsSpokeStack",
+}
+
+
+def load_inventory(path: str) -> list:
+    # The inventory is a JSON list of customers, each naming the stacks to
+    # synthesize and the keyword arguments for each stack class:
+    # [{"customer": "abc", "stacks": {"network": {}, "avd": {"subnet_id": "..."}}}]
+    with open(path) as f:
+        inventory = json.load(f)
+    for entry in inventory:
+        unknown = set(entry["stacks"]) - set(STACKS)
+        if unknown:
+            raise ValueError(
+                f"Unknown stacks for customer {entry['customer']}: {sorted(unknown)}"
+            )
+    return inventory
+
+
+def allocate_spokes(
+    inventory: list, ledger_dir: str = None, pool: str = DEFAULT_POOL
+) -> list:
+    # The inventory with a topology for every spoke. Spokes without one get
+    # their region's layout re-addressed to a VNet from the hub's address
+    # ledger (<ledger_dir>/<hub subscription>.json), which keeps the VNet of
+    # every customer between runs. Spokes of the same hub that overlap are
+    # rejected before any worker starts.
+    inventory = copy.deepcopy(inventory)
+    hubs = {}
+    for entry in inventory:
+        spoke = entry["stacks"].get("spoke")
+        if spoke is not None:
+            hubs.setdefault(hub_config(spoke["hub"]), []).append(entry)
+    for hub, entries in hubs.items():
+        # Explicit topologies are claimed first, so allocations go around them
+        entries = sorted(entries, key=lambda e: "topology" not in e["stacks"]["spoke"])
+        if ledger_dir:
+            ledger = open_ledger(
+                os.path.join(ledger_dir, f"{hub.subscription_id}.json"), pool
+            )
+        else:
+            ledger = contextlib.nullcontext(AddressAllocator(pool))
+        with ledger as allocator:
+            for entry in entries:
+                spoke = entry["stacks"]["spoke"]
+                if "topology" not in spoke and not ledger_dir:
+                    raise ValueError(
+                        f"Spoke of customer {entry['customer']} has no topology "
+                        "and there is no address ledger to allocate one from"
+                    )
+                topology = spoke.get("topology")
+                if isinstance(topology, dict):
+                    topology = NetworkTopology.from_dict(topology)
+                template = region_config(spoke.get("region", DEFAULT_REGION)).topology
+                spoke["topology"] = hub.assign_spoke(
+                    allocator, entry["customer"], topology, template
+                ).to_dict()
+    return inventory
+
+
+def stack_class(key: str):
+    module_name, class_name = STACKS[key].split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def customer_outdir(outdir: str, customer: str) -> str:
+    return os.path.join(outdir, customer, "cdktf.out")
+
+
+def synth_customer(
+    entry: dict, outdir: str, cache_dir: str = None, compact: bool = False
+) -> dict:
+    # Runs inside a pool worker, which owns its own JSII runtime. Stacks are
+    # synthesized (or restored) into a staging directory, and only the stacks
+    # that changed are copied into the customer's cdktf.out.
+    start = time.perf_counter()
+    customer = entry["customer"]
+    app_outdir = customer_outdir(outdir, customer)
+    staging = staging_outdir(app_outdir)
+    shutil.rmtree(staging, ignore_errors=True)
+    # Neither cdktf nor the cache restore create the customer's directory
+    os.makedirs(os.path.dirname(staging), exist_ok=True)
+    result = {"customer": customer, "pid": os.getpid(), "stacks": [], "cached": False}
+    cache = SynthCache(cache_dir) if cache_dir else None
+    try:
+        # Every stack keeps its state under its own key in the customer's storage
+        stacks = {
+            f"{customer}-{key}": (key, {"customer": customer, **kwargs})
+            for key, kwargs in entry["stacks"].items()
+        }
+        keys = {}
+        if cache:
+            # Each key covers the whole app, since stacks of one app share
+            # data sources and reference each other's outputs
+            members = [
+                (stack_id, STACKS[key], kwargs)
+                for stack_id, (key, kwargs) in stacks.items()
+            ]
+            keys = {
+                stack_id: cache_key(STACKS[key], stack_id, kwargs, app=members)
+                for stack_id, (key, kwargs) in stacks.items()
+            }
+            cached = {stack_id: cache.get(keys[stack_id]) for stack_id in stacks}
+            if all(cached.values()):
+                # Every stack is unchanged, so JSII is never started
+                restore_app(cache, cached, staging)
+                result["stacks"] = list(stacks)
+                result["cached"] = True
+
+        if not result["cached"]:
+            from cdktf import App
+
+            app = App(outdir=staging)
+            for stack_id, (key, kwargs) in stacks.items():
+                stack_class(key)(app, stack_id, **kwargs)
+                result["stacks"].append(stack_id)
+            app.synth()
+            if cache:
+                store_app(cache, keys, staging)
+        if compact:
+            # Compact before the sync so unchanged stacks still compare equal
+            compact_outdir(staging)
+        result["changed"] = sync_outdir(staging, app_outdir)["changed"]
+        if compact:
+            compact_outdir(app_outdir, archive_dir=os.path.join(app_outdir, "archives"))
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    if cache:
+        result["hits"], result["misses"] = cache.hits, cache.misses
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def restore_app(cache: SynthCache, cached: dict, app_outdir: str):
+    # Rebuild a cdktf.out directory from cached stack entries
+    manifest = {"stacks": {}}
+    for stack_id, path in cached.items():
+        entry = cache.restore(path, os.path.join(app_outdir, "stacks", stack_id))
+        manifest["version"] = entry["version"]
+        manifest["stacks"][stack_id] = entry["stack"]
+    with open(os.path.join(app_outdir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def store_app(cache: SynthCache, keys: dict, app_outdir: str):
+    with open(os.path.join(app_outdir, "manifest.json")) as f:
+        manifest = json.load(f)
+    for stack_id, key in keys.items():
+        cache.put(
+            key,
+            os.path.join(app_outdir, "stacks", stack_id),
+            {"version": manifest.get("version"), "stack": manifest["stacks"][stack_id]},
+        )
+
+
+def synth_all(
+    inventory: list,
+    outdir: str,
+    max_workers: int = None,
+    cache_dir: str = None,
+    cache_max_bytes: int = DEFAULT_MAX_BYTES,
+    report=print,
+    compact: bool = False,
+    ledger_dir: str = None,
+    address_pool: str = DEFAULT_POOL,
+):
+    inventory = allocate_spokes(inventory, ledger_dir, address_pool)
+
+    # Spawn rather than fork so every worker starts its own JSII runtime
+    context = multiprocessing.get_context("spawn")
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        futures = [
+            pool.submit(synth_customer, entry, outdir, cache_dir, compact)
+            for entry in inventory
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            status = result.get("error", "cached" if result["cached"] else "ok")
+            report(
+                f"[worker {result['pid']}] {result['customer']}: "
+                f"{len(result['stacks'])} stacks in {result['seconds']:.1f}s ({status}), "
+                f"{len(result.get('changed', []))} changed"
+            )
+    report(
+        f"Synthesized {len(results)} customers in {time.perf_counter() - start:.1f}s"
+    )
+    if cache_dir:
+        cache = SynthCache(cache_dir, cache_max_bytes)
+        stats = cache.record(
+            hits=sum(r.get("hits", 0) for r in results),
+            misses=sum(r.get("misses", 0) for r in results),
+        )
+        evicted = cache.evict()
+        report(
+            f"Synth cache: {sum(r.get('hits', 0) for r in results)} hits, "
+            f"{sum(r.get('misses', 0) for r in results)} misses this run "
+            f"({stats['hits']} hits, {stats['misses']} misses total), "
+            f"{evicted} entries evicted"
+        )
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Synthesize the stacks of every customer in an inventory file in parallel."
+    )
+    parser.add_argument("inventory", help="Path to the customer inventory JSON")
+    parser.add_argument(
+        "--outdir",
+        default="build",
+        help="Root directory for the per-customer cdktf.out directories",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Maximum number of concurrent synthesis workers",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help="Synth cache directory (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-max-bytes",
+        type=int,
+        default=DEFAULT_MAX_BYTES,
+        help="Evict least recently used cache entries above this size",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Always synthesize every stack"
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Write compact canonical JSON and a hashed archive per stack",
+    )
+    parser.add_argument(
+        "--address-ledger-dir",
+        default=DEFAULT_LEDGER_DIR,
+        help="Directory of the per-hub ledgers spoke address spaces are "
+        "allocated from (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--address-pool",
+        default=DEFAULT_POOL,
+        help="Address pool spoke address spaces are allocated from",
+    )
+    args = parser.parse_args(argv)
+
+    results = synth_all(
+        load_inventory(args.inventory),
+        args.outdir,
+        args.max_workers,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        cache_max_bytes=args.cache_max_bytes,
+        compact=args.compact,
+        ledger_dir=args.address_ledger_dir,
+        address_pool=args.address_pool,
+    )
+    if any("error" in result for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+# Written next to manifest.json; lists which stacks moved since the last synth
+CHANGES_FILE = "changes.json"
+
+# Files terraform leaves in a stack directory, which synth must not touch
+TERRAFORM_FILES = (".terraform", ".terraform.lock.hcl", "terraform.tfstate")
+
+
+def staging_outdir(outdir: str) -> str:
+    return outdir.rstrip(os.sep) + ".staging"
+
+
+def stack_files(stack_dir: str) -> list:
+    # Relative paths of the synthesized files of a stack directory
+    files = []
+    for directory, subdirectories, names in os.walk(stack_dir):
+        subdirectories[:] = sorted(
+            d for d in subdirectories if not d.startswith(TERRAFORM_FILES)
+        )
+        for name in sorted(names):
+            if not name.startswith(TERRAFORM_FILES):
+                path = os.path.join(directory, name)
+                files.append(os.path.relpath(path, stack_dir).replace(os.sep, "/"))
+    return files
+
+
+def fingerprint(stack_dir: str, files: list, manifest_entry: dict) -> str:
+    # Hash of a stack's manifest entry and the content of its files; None when
+    # one of the files is missing
+    digest = hashlib.sha256(json.dumps(manifest_entry, sort_keys=True).encode())
+    for name in sorted(files):
+        try:
+            with open(os.path.join(stack_dir, name), "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        digest.update(name.encode() + b"\0")
+        digest.update(hashlib.sha256(content).digest())
+    return digest.hexdigest()
+
+
+def write_if_changed(source: str, target: str) -> bool:
+    # Replace target with source atomically unless the bytes already match,
+    # so unchanged files keep their mtime
+    with open(source, "rb") as f:
+        return write_bytes_if_changed(target, f.read())
+
+
+def write_bytes_if_changed(target: str, content: bytes) -> bool:
+    try:
+        with open(target, "rb") as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(target))
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    os.replace(temporary, target)
+    return True
+
+
+def load_changes(outdir: str) -> dict:
+    try:
+        with open(os.path.join(outdir, CHANGES_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"stacks": {}}
+
+
+def sync_outdir(staging: str, outdir: str) -> dict:
+    # Bring outdir up to date with a freshly synthesized staging directory.
+    # Stacks whose fingerprint matches what is on disk are not written at all;
+    # changed stacks only rewrite the files that differ. Returns the changes
+    # manifest, which is also written to outdir.
+    with open(os.path.join(staging, "manifest.json")) as f:
+        manifest = json.load(f)
+    previous = load_changes(outdir)["stacks"]
+    changes = {"stacks": {}, "changed": [], "removed": []}
+
+    for name, entry in manifest["stacks"].items():
+        source = os.path.join(staging, entry["workingDirectory"])
+        target = os.path.join(outdir, entry["workingDirectory"])
+        files = stack_files(source)
+        new = fingerprint(source, files, entry)
+        recorded = previous.get(name, {})
+        stale = set(recorded.get("files", [])) - set(files)
+        old = fingerprint(target, files, recorded.get("entry", entry))
+        if new == old and not stale:
+            status = "unchanged"
+        elif recorded:
+            status = "changed"
+        else:
+            status = "added"
+
+        if status != "unchanged":
+            for file in files:
+                write_if_changed(os.path.join(source, file), os.path.join(target, file))
+            for file in stale:
+                try:
+                    os.remove(os.path.join(target, file))
+                except FileNotFoundError:
+                    pass
+            changes["changed"].append(name)
+        changes["stacks"][name] = {
+            "status": status,
+            "fingerprint": new,
+            "files": files,
+            "entry": entry,
+        }
+
+    for name, stack in previous.items():
+        if name not in manifest["stacks"]:
+            shutil.rmtree(
+                os.path.join(outdir, stack["entry"]["workingDirectory"]),
+                ignore_errors=True,
+            )
+            changes["removed"].append(name)
+
+    os.makedirs(outdir, exist_ok=True)
+    write_if_changed(
+        os.path.join(staging, "manifest.json"), os.path.join(outdir, "manifest.json")
+    )
+    fd, temporary = tempfile.mkstemp(dir=outdir)
+    with os.fdopen(fd, "w") as f:
+        json.dump(changes, f, indent=2)
+    os.replace(temporary, os.path.join(outdir, CHANGES_FILE))
+    return changes
+
+
+def changed_stacks(outdir: str) -> Optional[set]:
+    # Stacks the last incremental synth added or changed. None when the outdir
+    # has no baseline to compare against, i.e. treat every stack as changed.
+    changes = load_changes(outdir)
+    if not changes["stacks"]:
+        return None
+    return set(changes["changed"])
+
+
+def incremental_app(outdir: str = None, **kwargs):
+    # An App that synthesizes into a staging directory; pass it to
+    # synth_incremental instead of calling app.synth()
+    from cdktf import App
+
+    outdir = outdir or os.environ.get("CDKTF_OUTDIR", "cdktf.out")
+    shutil.rmtree(staging_outdir(outdir), ignore_errors=True)
+    return App(outdir=staging_outdir(outdir), **kwargs)
+
+
+def synth_incremental(app, outdir: str = None) -> dict:
+    outdir = outdir or os.environ.get("CDKTF_OUTDIR", "cdktf.out")
+    staging = staging_outdir(outdir)
+    try:
+        app.synth()
+        return sync_outdir(staging, outdir)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Copy a synthesized cdktf.out into place, writing only changed stacks."
+    )
+    parser.add_argument("staging", help="Freshly synthesized cdktf.out directory")
+    parser.add_argument("outdir", help="cdktf.out directory to update")
+    args = parser.parse_args(argv)
+
+    changes = sync_outdir(args.staging, args.outdir)
+    for name, stack in changes["stacks"].items():
+        print(f"{name}: {stack['status']}")
+    for name in changes["removed"]:
+        print(f"{name}: removed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,523 @@
+#!/usr/bin/env python
+import argparse
+import ast
+import ipaddress
+import json
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass
+
+from its_cdktf_base.synth.dependency_graph import (
+    ADDRESS,
+    INTERPOLATION,
+    DependencyGraph,
+    depends_on,
+)
+
+SEVERITIES = ("warning", "error")
+
+# Attribute names whose literal values are credentials
+SECRET_ATTRIBUTE = re.compile(
+    r"(^|_)(password|secret|access_key|sas_token|connection_string)$"
+)
+
+# A whole attribute value taken from the current for_each instance
+EACH_VALUE = re.compile(r"^\$\{each\.value(?:\.([A-Za-z0-9_]+))?\}$")
+
+
+@dataclass(frozen=True)
+class Finding:
+    rule: str
+    severity: str
+    stack: str
+    address: str
+    message: str
+
+    def __str__(self):
+        return f"{self.severity}: {self.stack}: {self.address}: {self.message} [{self.rule}]"
+
+
+class StackIndex:
+    # Everything the rules look up, built in one walk over a synthesized
+    # config: resource bodies by address and type, the attribute references
+    # of every resource, and every name referenced anywhere in the config
+    def __init__(self, config: dict, stack: str):
+        self.config = config
+        self.stack = stack
+        self.bodies = {}
+        self.by_type = {}
+        self.implicit = {}
+        self.explicit = {}
+        self.used = set()
+        self.providers = set()
+        self._instances = {}
+
+        for section, prefix in (("resource", ""), ("data", "data.")):
+            for resource_type, instances in config.get(section, {}).items():
+                addresses = self.by_type.setdefault(prefix + resource_type, [])
+                for name, body in instances.items():
+                    address = f"{prefix}{resource_type}.{name}"
+                    addresses.append(address)
+                    self.bodies[address] = body
+        for address, body in self.bodies.items():
+            found = _references(body)
+            self.used |= found
+            self.implicit[address] = found - {address}
+            self.explicit[address] = depends_on(body)
+            if "provider" in body:
+                self.providers.add(body["provider"])
+        for section in ("output", "locals", "provider", "module", "terraform"):
+            self.used |= _references(config.get(section, {}))
+
+    def resources(self, resource_type: str) -> list:
+        return self.by_type.get(resource_type, [])
+
+    def instances(self, address: str) -> list:
+        # (instance address, body) per instance of a literal for_each map, with
+        # each.key and each.value substituted; the body itself otherwise
+        if address not in self._instances:
+            body = self.bodies[address]
+            for_each = body.get("for_each")
+            if isinstance(for_each, dict):
+                # The map itself is left out of every instance body
+                template = {k: v for k, v in body.items() if k != "for_each"}
+                self._instances[address] = [
+                    (f'{address}["{key}"]', _substitute(template, key, value))
+                    for key, value in for_each.items()
+                ]
+            else:
+                self._instances[address] = [(address, body)]
+        return self._instances[address]
+
+    def graph(self) -> DependencyGraph:
+        known = set(self.bodies)
+        return DependencyGraph(
+            {a: refs & known for a, refs in self.implicit.items()},
+            {a: set(d) & known for a, d in self.explicit.items()},
+        )
+
+
+def _references(value) -> set:
+    # Every address-like name in the interpolations of a value, e.g.
+    # azurerm_subnet.its-subnets, data.azurerm_client_config.x, var.y, local.z
+    found = set()
+    if isinstance(value, str):
+        if "${" in value:
+            for expression in INTERPOLATION.findall(value):
+                found.update(ADDRESS.findall(expression))
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            if key not in ("//", "depends_on"):
+                found |= _references(item)
+    elif isinstance(value, list):
+        for item in value:
+            found |= _references(item)
+    return found
+
+
+def _substitute(value, key: str, each: dict):
+    if isinstance(value, str):
+        match = EACH_VALUE.match(value)
+        if match:
+            attribute = match.group(1)
+            if attribute is None:
+                return each
+            return each.get(attribute, value) if isinstance(each, dict) else value
+        return value.replace("${each.key}", key)
+    if isinstance(value, dict):
+        return {k: _substitute(v, key, each) for k, v in value.items() if k != "//"}
+    if isinstance(value, list):
+        return [_substitute(item, key, each) for item in value]
+    return value
+
+
+def _literal(value) -> bool:
+    return isinstance(value, str) and "${" not in value
+
+
+class Rule:
+    # A policy check. The engine creates one rule object per stack, calls visit
+    # for every resource of the listed types (every resource when types is
+    # None), then finish once the walk is done.
+    name = None
+    severity = "error"
+    types = None
+
+    def __init__(self, index: StackIndex):
+        self.index = index
+
+    def finding(self, address: str, message: str, severity: str = None) -> Finding:
+        return Finding(
+            self.name, severity or self.severity, self.index.stack, address, message
+        )
+
+    def visit(self, address: str, body: dict):
+        return ()
+
+    def finish(self):
+        return ()
+
+
+class CidrOverlapRule(Rule):
+    # Virtual networks whose address spaces overlap, subnets of the same
+    # virtual network that overlap, and subnets outside their network
+    name = "cidr-overlap"
+    types = ("azurerm_virtual_network", "azurerm_subnet")
+
+    def __init__(self, index):
+        super().__init__(index)
+        self.networks = []
+        self.spaces = {}
+        self.subnets = {}
+
+    def visit(self, address, body):
+        for instance, resolved in self.index.instances(address):
+            if address.startswith("azurerm_virtual_network."):
+                for cidr in _cidrs(resolved.get("address_space")):
+                    self.networks.append((cidr, instance))
+                    self.spaces.setdefault(address, []).append(cidr)
+            else:
+                network = resolved.get("virtual_network_name")
+                for cidr in _cidrs(resolved.get("address_prefixes")):
+                    self.subnets.setdefault(network, []).append((cidr, instance))
+        return ()
+
+    def finish(self):
+        findings = [
+            self.finding(address, f"{cidr} overlaps {other_cidr} of {other}")
+            for cidr, address, other_cidr, other in _overlaps(self.networks)
+        ]
+        for network, subnets in self.subnets.items():
+            findings.extend(
+                self.finding(address, f"{cidr} overlaps {other_cidr} of {other}")
+                for cidr, address, other_cidr, other in _overlaps(subnets)
+            )
+            # ${azurerm_virtual_network.x.name} names the network in this stack
+            owner = ADDRESS.findall(network or "")
+            spaces = self.spaces.get(owner[0]) if owner else None
+            if spaces:
+                findings.extend(
+                    self.finding(
+                        address,
+                        f"{cidr} is outside the address space of {owner[0]}",
+                    )
+                    for cidr, address in subnets
+                    if not any(
+                        cidr.version == space.version and cidr.subnet_of(space)
+                        for space in spaces
+                    )
+                )
+        return findings
+
+
+def _cidrs(value) -> list:
+    cidrs = []
+    for item in value if isinstance(value, list) else ():
+        if _literal(item):
+            try:
+                cidrs.append(ipaddress.ip_network(item))
+            except ValueError:
+                pass
+    return cidrs
+
+
+def _overlaps(blocks: list) -> list:
+    # Sweep the blocks by first address; a block overlaps the earlier block
+    # that reaches furthest whenever it starts before that block ends
+    found = []
+    widest = None
+    for network, owner in sorted(
+        blocks, key=lambda b: (b[0].version, int(b[0].network_address))
+    ):
+        start, end = int(network.network_address), int(network.broadcast_address)
+        if widest and widest[0].version == network.version and start <= widest[2]:
+            found.append((network, owner, widest[0], widest[1]))
+        if not widest or widest[0].version != network.version or end > widest[2]:
+            widest = (network, owner, end)
+    return found
+
+
+class NsgPriorityRule(Rule):
+    # Security rules of one NSG that share a direction and priority, or a name
+    name = "nsg-priority"
+    types = ("azurerm_network_security_group", "azurerm_network_security_rule")
+
+    def __init__(self, index):
+        super().__init__(index)
+        self.standalone = {}
+
+    def visit(self, address, body):
+        for instance, resolved in self.index.instances(address):
+            if address.startswith("azurerm_network_security_rule."):
+                key = (
+                    resolved.get("resource_group_name"),
+                    resolved.get("network_security_group_name"),
+                )
+                self.standalone.setdefault(key, []).append((instance, resolved))
+            elif isinstance(resolved.get("security_rule"), list):
+                yield from self._collisions(
+                    [(instance, rule) for rule in resolved["security_rule"]]
+                )
+
+    def finish(self):
+        for rules in self.standalone.values():
+            yield from self._collisions(rules)
+
+    def _collisions(self, rules: list):
+        priorities = {}
+        names = {}
+        for address, rule in rules:
+            if not isinstance(rule, dict):
+                continue
+            key = (rule.get("direction"), rule.get("priority"))
+            name = rule.get("name")
+            if key in priorities:
+                yield self.finding(
+                    address,
+                    f"{key[0]} rule {name!r} reuses priority {key[1]} "
+                    f"of {priorities[key]!r}",
+                )
+            else:
+                priorities[key] = name
+            if name in names:
+                yield self.finding(address, f"rule name {name!r} is used twice")
+            names[name] = key
+
+
+class PlaintextSecretRule(Rule):
+    # Credentials written into the config instead of referenced from a
+    # variable, a key vault or a generated password
+    name = "plaintext-secret"
+
+    def visit(self, address, body):
+        for path, value in _secrets(body, ()):
+            yield self.finding(
+                address, f"{'.'.join(path)} is a literal of {len(value)} characters"
+            )
+
+
+def _secrets(value, path: tuple):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key == "//":
+                continue
+            if SECRET_ATTRIBUTE.search(key) and _literal(item) and item:
+                yield path + (key,), item
+            else:
+                yield from _secrets(item, path + (key,))
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            yield from _secrets(item, path + (str(i),))
+
+
+class RedundantDependsOnRule(Rule):
+    # depends_on entries that are listed twice or already implied by an
+    # attribute reference or another path through the graph
+    name = "redundant-depends-on"
+    severity = "warning"
+
+    def visit(self, address, body):
+        seen = set()
+        for target in body.get("depends_on", ()):
+            if target in seen:
+                yield self.finding(address, f"depends_on lists {target} twice")
+            seen.add(target)
+
+    def finish(self):
+        for address, targets in self.index.graph().redundant_depends_on().items():
+            for target in sorted(targets):
+                yield self.finding(address, f"depends_on {target} is already implied")
+
+
+class UnusedDeclarationRule(Rule):
+    # Data sources, remote states, variables, locals and aliased providers
+    # that nothing in the stack references
+    name = "unused-declaration"
+    severity = "warning"
+    types = ()
+
+    def finish(self):
+        config = self.index.config
+        used = self.index.used
+        declared = [a for a in self.index.bodies if a.startswith("data.")]
+        declared += [f"var.{name}" for name in config.get("variable", {})]
+        declared += [f"local.{name}" for name in config.get("locals", {})]
+        for address in declared:
+            if address not in used:
+                yield self.finding(address, "is declared but never referenced")
+        for provider, blocks in config.get("provider", {}).items():
+            for block in blocks if isinstance(blocks, list) else [blocks]:
+                alias = block.get("alias")
+                if alias and f"{provider}.{alias}" not in self.index.providers:
+                    yield self.finding(
+                        f"provider.{provider}.{alias}", "no resource uses this provider"
+                    )
+
+
+RULES = (
+    CidrOverlapRule,
+    NsgPriorityRule,
+    PlaintextSecretRule,
+    RedundantDependsOnRule,
+    UnusedDeclarationRule,
+)
+
+
+class PolicyEngine:
+    # Runs a rule set over synthesized stacks, visiting each resource once and
+    # dispatching it only to the rules that asked for its type
+    def __init__(self, rules: tuple = RULES, disabled: tuple = ()):
+        self.rules = [rule for rule in rules if rule.name not in disabled]
+
+    def check(self, config: dict, stack: str) -> list:
+        index = StackIndex(config, stack)
+        rules = [rule(index) for rule in self.rules]
+        every = [rule for rule in rules if rule.types is None]
+        dispatch = {}
+        for rule in rules:
+            for resource_type in rule.types or ():
+                dispatch.setdefault(resource_type, []).append(rule)
+
+        findings = []
+        for resource_type, addresses in index.by_type.items():
+            visitors = every + dispatch.get(resource_type, [])
+            for address in addresses:
+                body = index.bodies[address]
+                for rule in visitors:
+                    findings.extend(rule.visit(address, body))
+        for rule in rules:
+            findings.extend(rule.finish())
+        return findings
+
+    def check_file(self, path: str, stack: str = None) -> list:
+        with open(path) as f:
+            config = json.load(f)
+        return self.check(config, stack or os.path.basename(os.path.dirname(path)))
+
+
+def synthesized_stacks(path: str) -> list:
+    # (stack, cdk.tf.json) for a cdk.tf.json, a cdktf.out directory or a
+    # directory of per-customer cdktf.out directories
+    if os.path.isfile(path):
+        return [(os.path.basename(os.path.dirname(os.path.abspath(path))), path)]
+    manifest = os.path.join(path, "manifest.json")
+    if os.path.isfile(manifest):
+        with open(manifest) as f:
+            stacks = json.load(f)["stacks"]
+        return [
+            (name, os.path.join(path, stack["synthesizedStackPath"]))
+            for name, stack in stacks.items()
+        ]
+    found = []
+    for name in sorted(os.listdir(path)):
+        if os.path.isdir(os.path.join(path, name, "cdktf.out")):
+            found.extend(synthesized_stacks(os.path.join(path, name, "cdktf.out")))
+    return found
+
+
+def unused_bindings(path: str) -> list:
+    # Module-level imports and lazy_import bindings of a Python source file
+    # that the module never uses. A binding that is never touched synthesizes
+    # nothing, so this is checked against the source rather than the JSON.
+    # Package __init__ modules import to re-export and are skipped.
+    if os.path.basename(path) == "__init__.py":
+        return []
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    bound = {}
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                name = (alias.asname or alias.name).split(".")[0]
+                bound[name] = node.lineno
+        elif (
+            isinstance(node, ast.Assign)
+            and isinstance(node.value, ast.Call)
+            and getattr(node.value.func, "id", None) == "lazy_import"
+        ):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    bound[target.id] = node.lineno
+    used = {
+        node.id
+        for node in ast.walk(tree)
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)
+    }
+    exported = set()
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+            getattr(t, "id", None) == "__all__" for t in node.targets
+        ):
+            exported = set(ast.literal_eval(node.value))
+    return [
+        Finding(
+            "unused-import",
+            "warning",
+            path,
+            f"line {line}",
+            f"{name} is imported but never used",
+        )
+        for name, line in bound.items()
+        if name not in used and name not in exported and name != "__future__"
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check synthesized stacks against the policy rules before plan."
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        help="cdk.tf.json files, cdktf.out directories or a synth driver outdir",
+    )
+    parser.add_argument(
+        "--source",
+        nargs="*",
+        default=(),
+        help="Python files or packages to check for unused imports",
+    )
+    parser.add_argument(
+        "--disable", action="append", default=[], help="Rule to skip, repeatable"
+    )
+    parser.add_argument(
+        "--fail-on",
+        choices=SEVERITIES,
+        default="error",
+        help="Exit non-zero on findings of this severity or worse",
+    )
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    engine = PolicyEngine(disabled=tuple(args.disable))
+    findings = []
+    stacks = [stack for path in args.paths for stack in synthesized_stacks(path)]
+    for stack, path in stacks:
+        findings.extend(engine.check_file(path, stack))
+    for source in args.source:
+        files = [source]
+        if os.path.isdir(source):
+            files = [
+                os.path.join(directory, name)
+                for directory, _, names in os.walk(source)
+                for name in sorted(names)
+                if name.endswith(".py")
+            ]
+        for path in files:
+            findings.extend(unused_bindings(path))
+
+    for finding in findings:
+        print(finding)
+    print(
+        f"Checked {len(stacks)} stacks in {time.perf_counter() - start:.2f}s: "
+        f"{len(findings)} findings"
+    )
+    threshold = SEVERITIES.index(args.fail_on)
+    if any(SEVERITIES.index(f.severity) >= threshold for f in findings):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
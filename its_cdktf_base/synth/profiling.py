@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+import atexit
+import functools
+import glob
+import json
+import os
+import sys
+import time
+
+# Profiling is opt-in, either with ITS_CDKTF_PROFILE=1 or with
+# "context": {"its-cdktf-base:profile": true} in cdktf.json
+ENV_VAR = "ITS_CDKTF_PROFILE"
+CONTEXT_KEY = "its-cdktf-base:profile"
+TOP_ENV_VAR = "ITS_CDKTF_PROFILE_TOP"
+
+# jsii module functions that each make one round-trip to the JSII kernel
+JSII_CALLS = ("create", "get", "set", "invoke", "sinvoke", "sget", "sset")
+
+# Bucket for kernel calls made outside any profiled construct
+UNATTRIBUTED = "(outside constructs)"
+
+_profiler = None
+
+
+def enabled() -> bool:
+    if os.environ.get(ENV_VAR, "") not in ("", "0"):
+        return True
+    # cdktf-cli passes the cdktf.json context to the app in this variable
+    context = json.loads(os.environ.get("CDKTF_CONTEXT_JSON") or "{}")
+    return bool(context.get(CONTEXT_KEY))
+
+
+def profiler():
+    # The process-wide profiler, installed on first use
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+        _profiler.install()
+    return _profiler
+
+
+def reset():
+    # Uninstall the process-wide profiler, if any, and drop its records
+    global _profiler
+    if _profiler is not None:
+        _profiler.uninstall()
+        _profiler = None
+
+
+class Profiler:
+    # Records per construct path the Python-side construction time, the JSII
+    # kernel round-trips made while constructing it and, after synthesis, the
+    # bytes of JSON it contributed to cdk.tf.json
+    def __init__(self):
+        self.records = {}
+        self._active = []
+        self._paused = False
+        # What install and instrument replaced, so uninstall can put it back
+        self._jsii_calls = {}
+        self._inits = {}
+
+    def record(self, path: str) -> dict:
+        return self.records.setdefault(
+            path, {"seconds": 0.0, "jsii_calls": 0, "json_bytes": 0}
+        )
+
+    def install(self):
+        import jsii
+
+        for name in JSII_CALLS:
+            self._jsii_calls[name] = getattr(jsii, name)
+            setattr(jsii, name, self._counted(self._jsii_calls[name]))
+        atexit.register(self.finish)
+
+    def uninstall(self):
+        # Restore the jsii functions and construct constructors, and skip the
+        # report at exit
+        import jsii
+
+        for name, call in self._jsii_calls.items():
+            setattr(jsii, name, call)
+        for cls, init in self._inits.items():
+            if init is None:
+                del cls.__init__
+            else:
+                cls.__init__ = init
+        self._jsii_calls = {}
+        self._inits = {}
+        atexit.unregister(self.finish)
+
+    def _counted(self, call):
+        @functools.wraps(call)
+        def counted(*args, **kwargs):
+            if not self._paused:
+                path = self._active[-1] if self._active else UNATTRIBUTED
+                self.record(path)["jsii_calls"] += 1
+            return call(*args, **kwargs)
+
+        return counted
+
+    def instrument(self, module):
+        # Time the constructor of every construct class a provider module defines
+        from constructs import Construct
+
+        for value in list(vars(module).values()):
+            if (
+                isinstance(value, type)
+                and issubclass(value, Construct)
+                and value.__module__ == module.__name__
+                and not getattr(value.__init__, "_its_profiled", False)
+            ):
+                # None when the class inherits its constructor
+                self._inits[value] = vars(value).get("__init__")
+                value.__init__ = self._timed(value.__init__)
+
+    def _timed(self, init):
+        @functools.wraps(init)
+        def timed(instance, scope, id, *args, **kwargs):
+            # Resolving the path is a kernel call of its own, so it is not counted
+            self._paused = True
+            try:
+                path = f"{scope.node.path}/{id}".lstrip("/")
+            finally:
+                self._paused = False
+            self._active.append(path)
+            start = time.perf_counter()
+            try:
+                return init(instance, scope, id, *args, **kwargs)
+            finally:
+                self.record(path)["seconds"] += time.perf_counter() - start
+                self._active.pop()
+
+        timed._its_profiled = True
+        return timed
+
+    def add_json_bytes(self, outdir: str):
+        # Attribute every resource and data source block to its construct path
+        pattern = os.path.join(outdir, "stacks", "*", "cdk.tf.json")
+        for path in glob.glob(pattern):
+            with open(path) as f:
+                config = json.load(f)
+            for kind in ("resource", "data"):
+                for blocks in config.get(kind, {}).values():
+                    for block in blocks.values():
+                        construct = block.get("//", {}).get("metadata", {}).get("path")
+                        if construct in self.records:
+                            self.record(construct)["json_bytes"] += len(
+                                json.dumps(block, separators=(",", ":"))
+                            )
+
+    def folded(self) -> str:
+        # Collapsed stack lines (stack;construct microseconds) for flamegraph.pl,
+        # speedscope or inferno
+        lines = []
+        for path, record in sorted(self.records.items()):
+            micros = int(record["seconds"] * 1_000_000)
+            if micros:
+                lines.append(f"{path.replace('/', ';')} {micros}")
+        return "\n".join(lines) + "\n"
+
+    def table(self, top: int = 20) -> str:
+        rows = sorted(
+            self.records.items(), key=lambda item: item[1]["seconds"], reverse=True
+        )[:top]
+        width = max([len(path) for path, _ in rows] + [len("construct")])
+        lines = [
+            f"{'construct':<{width}}  {'ms':>9}  {'jsii calls':>10}  {'json bytes':>10}"
+        ]
+        for path, record in rows:
+            lines.append(
+                f"{path:<{width}}  {record['seconds'] * 1000:9.1f}  "
+                f"{record['jsii_calls']:10d}  {record['json_bytes']:10d}"
+            )
+        total_calls = sum(record["jsii_calls"] for record in self.records.values())
+        total_seconds = sum(record["seconds"] for record in self.records.values())
+        lines.append(
+            f"{len(self.records)} constructs, {total_seconds * 1000:.1f} ms, "
+            f"{total_calls} jsii calls"
+        )
+        return "\n".join(lines)
+
+    def finish(self, outdir: str = None, top: int = None, stream=sys.stderr):
+        # Runs at exit, after the app has synthesized
+        outdir = outdir or os.environ.get("CDKTF_OUTDIR", "cdktf.out")
+        top = top or int(os.environ.get(TOP_ENV_VAR, "20"))
+        if not self.records:
+            return None
+        self.add_json_bytes(outdir)
+        os.makedirs(outdir, exist_ok=True)
+        folded_path = os.path.join(outdir, "profile.folded")
+        with open(folded_path, "w") as f:
+            f.write(self.folded())
+        with open(os.path.join(outdir, "profile.json"), "w") as f:
+            json.dump(self.records, f, indent=2, sort_keys=True)
+        print(self.table(top), file=stream)
+        print(f"Flame graph input written to {folded_path}", file=stream)
+        return folded_path
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Print the slowest constructs from a profiled synth."
+    )
+    parser.add_argument(
+        "outdir", nargs="?", default="cdktf.out", help="cdktf output directory"
+    )
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    report = Profiler()
+    with open(os.path.join(args.outdir, "profile.json")) as f:
+        report.records = json.load(f)
+    print(report.table(args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+import json
+import os
+
+# Set to 1 to rewrite golden snapshots from the current synth output
+UPDATE_ENV = "ITS_UPDATE_SNAPSHOTS"
+
+# Differences reported per snapshot before the rest are summarized
+MAX_DIFFERENCES = 25
+
+# Marks a key that only one side of a diff has
+MISSING = "<missing>"
+
+
+def normalize(config: dict) -> dict:
+    # Drop what changes without the stack changing: the cdktf version that
+    # wrote the config
+    metadata = config.get("//", {}).get("metadata")
+    if isinstance(metadata, dict) and "version" in metadata:
+        config = dict(config, **{"//": dict(config["//"])})
+        config["//"]["metadata"] = {
+            key: value for key, value in metadata.items() if key != "version"
+        }
+    return config
+
+
+def structural_diff(expected, actual, path: str = "$", limit: int = None) -> list:
+    # (path, expected, actual) for every leaf that differs. Equal subtrees are
+    # skipped with one == at the top, so a matching snapshot costs a single
+    # comparison and a mismatch only walks the branches that differ.
+    differences = []
+
+    def walk(expected, actual, path):
+        if limit is not None and len(differences) >= limit:
+            return
+        if expected == actual:
+            return
+        if isinstance(expected, dict) and isinstance(actual, dict):
+            for key in sorted(expected.keys() | actual.keys()):
+                walk(
+                    expected.get(key, MISSING),
+                    actual.get(key, MISSING),
+                    f"{path}.{key}",
+                )
+        elif isinstance(expected, list) and isinstance(actual, list):
+            for index in range(max(len(expected), len(actual))):
+                walk(
+                    expected[index] if index < len(expected) else MISSING,
+                    actual[index] if index < len(actual) else MISSING,
+                    f"{path}[{index}]",
+                )
+        else:
+            differences.append((path, expected, actual))
+
+    walk(expected, actual, path)
+    return differences
+
+
+def format_diff(name: str, differences: list, limit: int = MAX_DIFFERENCES) -> str:
+    lines = [f"{name} differs from its snapshot:"]
+    for path, expected, actual in differences[:limit]:
+        lines.append(f"  {path}: expected {expected!r}, got {actual!r}")
+    if len(differences) > limit:
+        lines.append(f"  ... and {len(differences) - limit} more")
+    lines.append(f"Run with {UPDATE_ENV}=1 to accept the new output.")
+    return "\n".join(lines)
+
+
+class SnapshotStore:
+    # Golden synth output, one <name>.json per stack configuration. Snapshots
+    # are written sorted and indented so reviews of an update read like any
+    # other diff.
+    def __init__(self, directory: str, update: bool = None):
+        self.directory = directory
+        self.update = os.environ.get(UPDATE_ENV) == "1" if update is None else update
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.json")
+
+    def load(self, name: str) -> dict:
+        try:
+            with open(self.path(name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, name: str, config: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path(name), "w") as f:
+            json.dump(config, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    def check(self, name: str, config: dict) -> list:
+        # Differences between the snapshot and config, or None if the snapshot
+        # was (re)written instead: it was missing, or it differs and updating
+        # is switched on
+        config = normalize(config)
+        expected = self.load(name)
+        if expected is None or (self.update and expected != config):
+            self.save(name, config)
+            return None
+        return structural_diff(expected, config)
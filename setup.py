@@ -10,6 +10,16 @@ setup(
         "twine",
         "keyring",
         "artifacts-keyring",
+        # Bootstrap, deploy orchestrator and drift checker
+        "azure-core",
+        "azure-identity",
+        "azure-storage-blob",
+        "azure-keyvault-secrets",
+        "azure-mgmt-authorization",
+        "azure-mgmt-keyvault",
+        "azure-mgmt-resource",
+        "azure-mgmt-storage",
+        "aiohttp",
     ],
     # Optional: Add metadata about the package
     description="Set of reusable infrastructure constructs to build Azure resources with CDK using Terraform.",
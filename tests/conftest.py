@@ -0,0 +1,49 @@
+import json
+import os
+
+import pytest
+
+from its_cdktf_base.synth.snapshots import SnapshotStore
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), "snapshots")
+
+
+def pytest_configure(config):
+    # Registered here too so the marker is known without pytest-xdist
+    config.addinivalue_line(
+        "markers",
+        "xdist_group(name): run on the worker that synthesized the same stack",
+    )
+
+
+@pytest.fixture(scope="session")
+def jsii_kernel():
+    # The JSII kernel is one node process per Python process, started by the
+    # first call into cdktf. Starting it here keeps that startup out of the
+    # first test, and every later test of this worker reuses the warm kernel.
+    pytest.importorskip("cdktf")
+    pytest.importorskip("imports.azurerm")
+    from cdktf import Testing
+
+    Testing.app()
+    return Testing
+
+
+@pytest.fixture(scope="session")
+def synthesized(jsii_kernel):
+    # synthesized(name, build) -> the synthesized config of one stack,
+    # memoized for the session. build(app, name) constructs the stack. Each
+    # caller gets its own copy of the config, so it may change it freely.
+    memo = {}
+
+    def synth(name: str, build) -> dict:
+        if name not in memo:
+            memo[name] = jsii_kernel.synth(build(jsii_kernel.app(), name))
+        return json.loads(memo[name])
+
+    return synth
+
+
+@pytest.fixture(scope="session")
+def snapshots():
+    return SnapshotStore(SNAPSHOT_DIR)
@@ -0,0 +1,128 @@
+import json
+import threading
+
+import pytest
+
+from its_cdktf_base.network.address_allocator import (
+    AddressAllocator,
+    AddressOverlapError,
+    allocate_topology,
+    check_topology,
+    open_ledger,
+)
+from its_cdktf_base.network.topology import DEFAULT_TOPOLOGY
+
+
+def test_allocations_are_aligned_and_sequential():
+    allocator = AddressAllocator("10.0.0.0/16")
+    assert allocator.allocate("a", 24) == "10.0.0.0/24"
+    assert allocator.allocate("b", 26) == "10.0.1.0/26"
+    # A /24 cannot start inside the /26 block
+    assert allocator.allocate("c", 24) == "10.0.2.0/24"
+    assert allocator.allocations() == {
+        "10.0.0.0/24": "a",
+        "10.0.1.0/26": "b",
+        "10.0.2.0/24": "c",
+    }
+    assert len(allocator) == 3
+
+
+def test_allocations_skip_reserved_prefixes():
+    allocator = AddressAllocator("10.0.0.0/16")
+    allocator.reserve("existing", "10.0.0.0/23")
+    assert allocator.allocate("a", 24) == "10.0.2.0/24"
+    assert allocator.overlaps("10.0.1.128/25") == [("10.0.0.0/23", "existing")]
+    assert allocator.overlaps("10.0.3.0/24") == []
+
+
+def test_reserve_rejects_overlaps_and_prefixes_outside_the_pool():
+    allocator = AddressAllocator("10.0.0.0/16")
+    allocator.reserve("a", "10.0.4.0/24")
+    with pytest.raises(AddressOverlapError, match="10.0.4.0/24"):
+        allocator.reserve("b", "10.0.0.0/21")
+    with pytest.raises(ValueError):
+        allocator.reserve("b", "10.1.0.0/24")
+    # claim accepts what the owner already holds, but nothing new that overlaps
+    assert allocator.claim("a", "10.0.4.0/24") == "10.0.4.0/24"
+    with pytest.raises(AddressOverlapError):
+        allocator.claim("b", "10.0.4.0/24")
+    assert allocator.owned("a") == ["10.0.4.0/24"]
+
+
+def test_released_prefixes_are_reused_after_wrapping():
+    allocator = AddressAllocator("10.0.0.0/22")
+    for owner in "abcd":
+        allocator.allocate(owner, 24)
+    with pytest.raises(ValueError, match="No free /24"):
+        allocator.allocate("e", 24)
+    assert allocator.release("b") == ["10.0.1.0/24"]
+    assert allocator.release("b") == []
+    assert allocator.allocate("e", 24) == "10.0.1.0/24"
+    with pytest.raises(ValueError):
+        allocator.allocate("f", 25)
+
+
+def test_ledger_round_trip(tmp_path):
+    ledger = str(tmp_path / "ledger.json")
+    allocator = AddressAllocator("10.0.0.0/16", ledger=ledger)
+    allocator.allocate("a", 24)
+    allocator.reserve("b", "10.0.8.0/22")
+    allocator.save()
+    assert not [p for p in tmp_path.iterdir() if p.suffix == ".tmp"]
+
+    reloaded = AddressAllocator("10.0.0.0/16", ledger=ledger)
+    assert reloaded.allocations() == allocator.allocations()
+    assert reloaded.allocate("c", 24) == "10.0.1.0/24"
+    with pytest.raises(ValueError, match="pool"):
+        AddressAllocator("10.1.0.0/16", ledger=ledger)
+
+
+def test_open_ledger_serializes_writers(tmp_path):
+    # Every thread loads, allocates and saves under the lock, so none of them
+    # loses another's allocation or gets the same prefix
+    ledger = str(tmp_path / "ledgers" / "hub.json")
+
+    def allocate(owner):
+        with open_ledger(ledger, "10.0.0.0/16") as allocator:
+            allocator.allocate(owner, 24)
+
+    threads = [threading.Thread(target=allocate, args=(f"c{i}",)) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with open(ledger) as f:
+        allocations = json.load(f)["allocations"]
+    assert sorted(allocations.values()) == sorted(f"c{i}" for i in range(16))
+    assert len(allocations) == 16
+
+
+def test_ledger_is_not_written_when_the_block_fails(tmp_path):
+    ledger = str(tmp_path / "hub.json")
+    with pytest.raises(RuntimeError):
+        with open_ledger(ledger) as allocator:
+            allocator.allocate("a", 16)
+            raise RuntimeError
+    with open_ledger(ledger) as allocator:
+        assert len(allocator) == 0
+
+
+def test_allocated_topology_is_valid_and_stable():
+    allocator = AddressAllocator()
+    first = allocate_topology(allocator, "abc", DEFAULT_TOPOLOGY)
+    check_topology(first)
+    assert first.address_space == ("10.0.0.0/16",)
+    assert first.vpn_client_address_space == "10.1.0.0/24"
+    assert [tier.cidr for tier in first.tiers] == [
+        "10.0.0.0/24",
+        "10.0.1.0/24",
+        "10.0.2.0/24",
+    ]
+    # Asking again for the same customer returns the same addresses
+    assert allocate_topology(allocator, "abc", DEFAULT_TOPOLOGY) == first
+    second = allocate_topology(
+        allocator, "def", DEFAULT_TOPOLOGY, vpn_client_address_space="10.10.10.0/24"
+    )
+    assert second.address_space == ("10.2.0.0/16",)
+    assert second.vpn_client_address_space == "10.10.10.0/24"
@@ -0,0 +1,151 @@
+import json
+
+import pytest
+
+from its_cdktf_base.deploy.apply_simulator import (
+    instance_addresses,
+    simulate,
+    simulate_app,
+)
+from its_cdktf_base.synth.dependency_graph import DependencyGraph
+
+DURATIONS = {"slow": 100, "fast": 10}
+
+
+def config(**resources) -> dict:
+    # resources: "type.name" with __ for the dot -> body
+    resource = {}
+    for key, body in resources.items():
+        resource_type, name = key.split("__")
+        resource.setdefault(resource_type, {})[name] = body
+    return {"resource": resource}
+
+
+def test_instances_of_for_each_and_count():
+    assert instance_addresses("a.b", {"for_each": {"x": {}, "y": {}}}) == [
+        'a.b["x"]',
+        'a.b["y"]',
+    ]
+    assert instance_addresses("a.b", {"count": 2}) == ["a.b[0]", "a.b[1]"]
+    assert instance_addresses("a.b", {"count": "${var.hosts}"}) == ["a.b"]
+
+
+def test_chain_runs_in_order():
+    simulation = simulate(
+        config(
+            slow__a={},
+            fast__b={"x": "${slow.a.id}"},
+            fast__c={"depends_on": ["fast.b"]},
+        ),
+        durations=DURATIONS,
+    )
+    assert simulation.times == {
+        "slow.a": (0, 100),
+        "fast.b": (100, 110),
+        "fast.c": (110, 120),
+    }
+    assert [instance for instance, _ in simulation.critical_path()] == [
+        "slow.a",
+        "fast.b",
+        "fast.c",
+    ]
+
+
+def test_parallelism_limits_concurrent_instances():
+    resources = config(fast__a={"count": 25})
+    assert simulate(resources, 10, DURATIONS).wall_time == 30
+    assert simulate(resources, 5, DURATIONS).wall_time == 50
+    assert simulate(resources, 25, DURATIONS).peak() == 25
+    assert simulate(resources, 10, DURATIONS).peak() == 10
+
+
+def test_unbounded_parallelism_matches_the_dependency_graph_schedule():
+    resources = config(
+        slow__vngw={"depends_on": ["fast.nsg", "fast.natgw"]},
+        fast__nsg={"x": "${fast.rg.name}"},
+        fast__natgw={"x": "${fast.rg.name}"},
+        fast__rg={},
+    )
+    simulation = simulate(resources, 1000, DURATIONS)
+    schedule = DependencyGraph.from_config(resources).schedule(DURATIONS)
+    assert simulation.times == schedule
+
+
+def test_critical_path_records_waits_for_a_slot():
+    # Two fast instances fill both slots, so the slow one waits for one of them
+    resources = config(fast__a={"count": 2}, slow__b={})
+    simulation = simulate(resources, 2, DURATIONS)
+    assert simulation.times["slow.b"] == (10, 110)
+    path = simulation.critical_path()
+    assert path[-1] == ("slow.b", "slot")
+    assert path[0][0] in ("fast.a[0]", "fast.a[1]")
+
+
+def test_dependents_wait_for_every_instance():
+    resources = config(
+        fast__subnets={"for_each": {"a": {}, "b": {}, "c": {}}},
+        slow__vngw={"depends_on": ["fast.subnets"]},
+    )
+    simulation = simulate(resources, 2, DURATIONS)
+    assert simulation.times["slow.vngw"] == (20, 120)
+
+
+def test_empty_count_does_not_block_dependents():
+    resources = config(fast__a={"count": 0}, fast__b={"depends_on": ["fast.a"]})
+    assert simulate(resources, durations=DURATIONS).times == {"fast.b": (0, 10)}
+
+
+def test_cycles_are_reported():
+    resources = config(
+        fast__a={"depends_on": ["fast.b"]}, fast__b={"depends_on": ["fast.a"]}
+    )
+    with pytest.raises(ValueError):
+        simulate(resources, durations=DURATIONS)
+
+
+def test_networking_stack_is_dominated_by_the_gateway():
+    resources = config(
+        azurerm_resource_group__rg={},
+        azurerm_virtual_network__vnet={"x": "${azurerm_resource_group.rg.name}"},
+        azurerm_subnet__subnets={
+            "for_each": {"client": {}, "server": {}, "dmz": {}},
+            "x": "${azurerm_virtual_network.vnet.name}",
+        },
+        azurerm_subnet__gateway={"x": "${azurerm_virtual_network.vnet.name}"},
+        azurerm_public_ip__vngw={"x": "${azurerm_resource_group.rg.name}"},
+        azurerm_virtual_network_gateway__vngw={
+            "ip": "${azurerm_public_ip.vngw.id}",
+            "subnet": "${azurerm_subnet.gateway.id}",
+            "depends_on": ["azurerm_subnet.subnets"],
+        },
+    )
+    simulation = simulate(resources)
+    path = [instance for instance, _ in simulation.critical_path()]
+    assert path[-1] == "azurerm_virtual_network_gateway.vngw"
+    assert simulation.wall_time == 5 + 15 + 10 + 2700
+
+
+def test_stacks_are_scheduled_after_their_dependencies(tmp_path):
+    manifest = {"stacks": {}}
+    for name, resource_type, dependencies in (
+        ("core", "slow", []),
+        ("security", "fast", ["core"]),
+        ("gateway", "slow", ["core"]),
+    ):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "cdk.tf.json").write_text(
+            json.dumps(config(**{f"{resource_type}__x": {}}))
+        )
+        manifest["stacks"][name] = {
+            "synthesizedStackPath": f"{name}/cdk.tf.json",
+            "dependencies": dependencies,
+        }
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest))
+
+    simulations, stacks = simulate_app(str(tmp_path), durations=DURATIONS)
+    assert simulations["gateway"].wall_time == 100
+    # 30 seconds of init per stack, security and gateway run side by side
+    assert stacks.times["core"] == (0, 130)
+    assert stacks.times["security"] == (130, 170)
+    assert stacks.times["gateway"] == (130, 260)
+    assert simulate_app(str(tmp_path), 10, 1, DURATIONS)[1].wall_time == 300
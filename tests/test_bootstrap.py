@@ -0,0 +1,176 @@
+import asyncio
+import time
+
+import pytest
+
+from its_cdktf_base.deploy.bootstrap import (
+    CONTRIBUTOR_ROLE,
+    SECRETS_OFFICER_ROLE,
+    SERVICE_PRINCIPAL_NAME,
+    Bootstrapper,
+    Customer,
+    InMemoryClient,
+    key_vault_scope,
+)
+
+
+def customers(count: int, subscriptions: int = 2) -> list:
+    return [
+        Customer(name=f"cust{i}", subscription_id=f"sub-{i % subscriptions}")
+        for i in range(count)
+    ]
+
+
+def bootstrap(client, customers, **kwargs):
+    messages = []
+    results = asyncio.run(
+        Bootstrapper(client, report=messages.append, **kwargs).run(customers)
+    )
+    return results, messages
+
+
+def test_onboards_every_resource():
+    client = InMemoryClient()
+    results, messages = bootstrap(client, customers(3))
+
+    assert [result["status"] for result in results] == ["ok"] * 3
+    resources = client.resources
+    assert ("group", "sub-0", "tfstate-cust0") in resources
+    assert ("account", "sub-1", "tfstatecust1") in resources
+    assert ("container", "sub-0", "tfstatecust2", "tfstate-cust2") in resources
+    assert ("vault", "its-sp-cust0") in resources
+    assert ("secret", "its-sp-cust2", SERVICE_PRINCIPAL_NAME) in resources
+    assert any(message.startswith("[3/3]") for message in messages)
+
+
+def test_one_principal_with_a_role_assignment_per_subscription():
+    client = InMemoryClient()
+    bootstrap(client, customers(6, subscriptions=2))
+
+    principals = [key for key in client.resources if key[0] == "principal"]
+    roles = [
+        key
+        for key in client.resources
+        if key[0] == "role" and key[3] == CONTRIBUTOR_ROLE
+    ]
+    assert len(principals) == 1
+    assert sorted(key[1] for key in roles) == ["sub-0", "sub-1"]
+
+
+def test_caller_gets_secrets_officer_on_each_vault_before_writing():
+    # The new assignment only becomes visible after two access checks; the
+    # secret is written once it has
+    client = InMemoryClient(propagation_checks=2)
+    results, _ = bootstrap(client, customers(2))
+    assert [result["status"] for result in results] == ["ok"] * 2
+
+    officers = [
+        key
+        for key in client.resources
+        if key[0] == "role" and key[3] == SECRETS_OFFICER_ROLE
+    ]
+    assert sorted(officers) == [
+        (
+            "role",
+            key_vault_scope("sub-0", "tfstate-cust0", "its-sp-cust0"),
+            "caller",
+            SECRETS_OFFICER_ROLE,
+        ),
+        (
+            "role",
+            key_vault_scope("sub-1", "tfstate-cust1", "its-sp-cust1"),
+            "caller",
+            SECRETS_OFFICER_ROLE,
+        ),
+    ]
+    operations = [call[:2] for call in client.calls]
+    checks = operations.index(("check", ("vault-access", "its-sp-cust0")))
+    written = operations.index(
+        ("create", ("secret", "its-sp-cust0", SERVICE_PRINCIPAL_NAME))
+    )
+    assert operations.count(("check", ("vault-access", "its-sp-cust0"))) == 2
+    assert checks < written
+
+
+def test_secrets_are_refused_without_the_role():
+    client = InMemoryClient()
+    bootstrap(client, customers(1))
+    scope = key_vault_scope("sub-0", "tfstate-cust0", "its-sp-cust0")
+    del client.resources[("role", scope, "caller", SECRETS_OFFICER_ROLE)]
+    with pytest.raises(PermissionError):
+        asyncio.run(client.set_secret("its-sp-cust0", SERVICE_PRINCIPAL_NAME, "x"))
+
+    # A rerun assigns it again
+    results, _ = bootstrap(client, customers(1))
+    assert results[0]["status"] == "ok"
+    assert ("role", scope, "caller", SECRETS_OFFICER_ROLE) in client.resources
+
+
+def test_soft_deleted_vault_is_recovered():
+    client = InMemoryClient()
+    client.deleted_vaults["its-sp-cust0"] = {"secrets": {SERVICE_PRINCIPAL_NAME: "old"}}
+    results, messages = bootstrap(client, customers(1))
+    assert results[0]["status"] == "ok"
+    assert "its-sp-cust0" not in client.deleted_vaults
+    assert ("recover", ("vault", "its-sp-cust0")) in [call[:2] for call in client.calls]
+    assert "cust0: key vault its-sp-cust0 recovered" in messages
+    # The recovered secret is kept, so no new password is issued
+    assert client.resources[("secret", "its-sp-cust0", SERVICE_PRINCIPAL_NAME)] == "old"
+    assert not [call for call in client.calls if call[1][0] == "password"]
+
+
+def test_rerun_creates_nothing():
+    client = InMemoryClient()
+    bootstrap(client, customers(4))
+    created = len([call for call in client.calls if call[0] == "create"])
+
+    client.calls.clear()
+    results, messages = bootstrap(client, customers(4))
+    assert [result["status"] for result in results] == ["ok"] * 4
+    assert [call for call in client.calls if call[0] == "create"] == []
+    assert not any(message.endswith(" created") for message in messages)
+    assert created > 0
+
+
+def test_rerun_completes_a_partial_onboarding():
+    client = InMemoryClient()
+    bootstrap(client, customers(1))
+    del client.resources[("container", "sub-0", "tfstatecust0", "tfstate-cust0")]
+    del client.resources[("secret", "its-sp-cust0", SERVICE_PRINCIPAL_NAME)]
+
+    client.calls.clear()
+    bootstrap(client, customers(1))
+    created = [call[1][0] for call in client.calls if call[0] == "create"]
+    assert sorted(created) == ["container", "password", "secret"]
+
+
+def test_fifty_customers_onboard_concurrently():
+    # Every call takes 20 ms; one customer is about 10 calls deep, so serial
+    # onboarding of 50 customers would take over 10 seconds
+    client = InMemoryClient(latency=0.02)
+    start = time.perf_counter()
+    results, _ = bootstrap(client, customers(50), max_concurrency=25)
+    elapsed = time.perf_counter() - start
+
+    assert [result["status"] for result in results] == ["ok"] * 50
+    assert elapsed < 3
+
+
+def test_a_failing_customer_does_not_stop_the_others():
+    class FailingClient(InMemoryClient):
+        async def create_storage_account(self, subscription, group, name, location):
+            if name == "tfstatecust1":
+                raise RuntimeError("StorageAccountAlreadyTaken")
+            return await super().create_storage_account(
+                subscription, group, name, location
+            )
+
+    results, _ = bootstrap(FailingClient(), customers(3))
+    statuses = {result["customer"]: result["status"] for result in results}
+    assert statuses == {"cust0": "ok", "cust1": "failed", "cust2": "ok"}
+    assert "StorageAccountAlreadyTaken" in results[1]["error"]
+
+
+def test_duplicate_customers_are_rejected():
+    with pytest.raises(ValueError):
+        bootstrap(InMemoryClient(), customers(2) + customers(1))
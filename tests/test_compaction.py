@@ -0,0 +1,190 @@
+import io
+import json
+import os
+import random
+import tarfile
+
+from its_cdktf_base.synth.compaction import (
+    ARCHIVE_INDEX,
+    canonical_json,
+    compact_config,
+    compact_outdir,
+    content_hash,
+)
+from its_cdktf_base.synth.dependency_graph import DependencyGraph, resources
+
+# Shaped like a synthesized networking stack, including the duplicated and
+# transitively implied depends_on entries cdktf writes out
+CONFIG = {
+    "//": {"metadata": {"stackName": "networking"}},
+    "resource": {
+        "azurerm_resource_group": {"rg": {"name": "its", "location": "westus2"}},
+        "azurerm_virtual_network": {
+            "vnet": {
+                "//": {"metadata": {"path": "networking/vnet"}},
+                "resource_group_name": "${azurerm_resource_group.rg.name}",
+                "depends_on": ["azurerm_resource_group.rg"],
+            }
+        },
+        "azurerm_subnet": {
+            "gateway": {"virtual_network_name": "${azurerm_virtual_network.vnet.name}"},
+            "server": {"virtual_network_name": "${azurerm_virtual_network.vnet.name}"},
+        },
+        "azurerm_network_security_group": {
+            "server": {"resource_group_name": "${azurerm_resource_group.rg.name}"}
+        },
+        "azurerm_subnet_network_security_group_association": {
+            "server": {
+                "subnet_id": "${azurerm_subnet.server.id}",
+                "network_security_group_id": (
+                    "${azurerm_network_security_group.server.id}"
+                ),
+            }
+        },
+        "azurerm_virtual_network_gateway": {
+            "vngw": {
+                "ip_configuration": [{"subnet_id": "${azurerm_subnet.gateway.id}"}],
+                "depends_on": [
+                    "azurerm_subnet_network_security_group_association.server",
+                    "azurerm_subnet.server",
+                    "azurerm_virtual_network.vnet",
+                    "azurerm_subnet_network_security_group_association.server",
+                ],
+            }
+        },
+    },
+}
+
+
+def closure(config: dict) -> dict:
+    # Every address each resource waits on, directly or not
+    edges = DependencyGraph.from_config(config).edges()
+
+    def reach(address, seen):
+        for target in edges.get(address, ()):
+            if target not in seen:
+                seen.add(target)
+                reach(target, seen)
+        return seen
+
+    return {address: reach(address, set()) for address in edges}
+
+
+def without_depends_on(config: dict) -> dict:
+    bodies = resources(json.loads(json.dumps(config)))
+    for body in bodies.values():
+        body.pop("depends_on", None)
+    return bodies
+
+
+def shuffled(value):
+    # The same data with every mapping in a different insertion order
+    if isinstance(value, dict):
+        items = [(key, shuffled(item)) for key, item in value.items()]
+        random.shuffle(items)
+        return dict(items)
+    if isinstance(value, list):
+        return [shuffled(item) for item in value]
+    return value
+
+
+def write_outdir(path, stacks: dict):
+    manifest = {"stacks": {}}
+    for name, config in stacks.items():
+        (path / "stacks" / name).mkdir(parents=True)
+        (path / "stacks" / name / "cdk.tf.json").write_text(
+            json.dumps(config, indent=2)
+        )
+        manifest["stacks"][name] = {
+            "workingDirectory": f"stacks/{name}",
+            "synthesizedStackPath": f"stacks/{name}/cdk.tf.json",
+        }
+    (path / "manifest.json").write_text(json.dumps(manifest))
+
+
+def test_compaction_keeps_the_dependency_graph():
+    compacted = compact_config(CONFIG)
+    assert closure(compacted) == closure(CONFIG)
+    assert without_depends_on(compacted) == without_depends_on(CONFIG)
+    assert compacted["//"] == CONFIG["//"]
+
+
+def test_duplicate_and_implied_depends_on_are_dropped():
+    bodies = resources(compact_config(CONFIG))
+    assert bodies["azurerm_virtual_network_gateway.vngw"]["depends_on"] == [
+        "azurerm_subnet_network_security_group_association.server"
+    ]
+    assert "depends_on" not in bodies["azurerm_virtual_network.vnet"]
+    # The input is left alone
+    assert (
+        len(resources(CONFIG)["azurerm_virtual_network_gateway.vngw"]["depends_on"])
+        == 4
+    )
+
+
+def test_metadata_is_only_stripped_on_request():
+    stripped = compact_config(CONFIG, strip_metadata=True)
+    assert "//" not in stripped
+    assert "//" not in resources(stripped)["azurerm_virtual_network.vnet"]
+    assert closure(stripped) == closure(CONFIG)
+
+
+def test_canonical_json_ignores_key_order():
+    random.seed(0)
+    assert canonical_json(shuffled(CONFIG)) == canonical_json(CONFIG)
+    assert content_hash(shuffled(CONFIG)) == content_hash(CONFIG)
+    assert b" " not in canonical_json({"a": [1, 2], "b": {"c": None}})
+
+
+def test_compact_outdir_is_smaller_deterministic_and_idempotent(tmp_path):
+    write_outdir(tmp_path, {"networking": CONFIG, "avd": {"resource": {}}})
+    path = tmp_path / "stacks" / "networking" / "cdk.tf.json"
+    archives = tmp_path / "archives"
+
+    index = compact_outdir(str(tmp_path), archive_dir=str(archives))
+    sizes = index["networking"]["bytes"]
+    assert sizes["compacted"] < sizes["synthesized"]
+    assert path.stat().st_size == sizes["compacted"]
+    assert json.loads(path.read_text()) == compact_config(CONFIG)
+    assert index["networking"]["sha256"] == content_hash(compact_config(CONFIG))
+    assert json.loads((archives / ARCHIVE_INDEX).read_text()) == index
+
+    with tarfile.open(archives / "networking.tar.gz") as tar:
+        assert tar.getnames() == ["cdk.tf.json"]
+        assert tar.extractfile("cdk.tf.json").read() == path.read_bytes()
+
+    # A second run finds nothing to rewrite and leaves every file untouched
+    mtimes = {p: os.stat(p).st_mtime_ns for p in (path, archives / "networking.tar.gz")}
+    again = compact_outdir(str(tmp_path), archive_dir=str(archives))
+    assert again["networking"]["sha256"] == index["networking"]["sha256"]
+    assert again["networking"]["bytes"]["synthesized"] == sizes["compacted"]
+    assert {p: os.stat(p).st_mtime_ns for p in mtimes} == mtimes
+
+
+def test_archives_do_not_depend_on_file_times(tmp_path):
+    for name in ("a", "b"):
+        write_outdir(tmp_path / name, {"networking": shuffled(CONFIG)})
+        os.utime(tmp_path / name / "stacks" / "networking" / "cdk.tf.json", (0, 0))
+    first = compact_outdir(
+        str(tmp_path / "a"), archive_dir=str(tmp_path / "a-archives")
+    )
+    second = compact_outdir(
+        str(tmp_path / "b"), archive_dir=str(tmp_path / "b-archives")
+    )
+    assert (
+        first["networking"]["archive_sha256"] == second["networking"]["archive_sha256"]
+    )
+    data = (tmp_path / "a-archives" / "networking.tar.gz").read_bytes()
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        assert tar.getmembers()[0].mtime == 0
+
+
+def test_archives_of_removed_stacks_are_deleted(tmp_path):
+    write_outdir(tmp_path, {"networking": CONFIG, "avd": {"resource": {}}})
+    archives = tmp_path / "archives"
+    compact_outdir(str(tmp_path), archive_dir=str(archives))
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    del manifest["stacks"]["avd"]
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest))
+    compact_outdir(str(tmp_path), archive_dir=str(archives))
+    assert sorted(os.listdir(archives)) == [ARCHIVE_INDEX, "networking.tar.gz"]
@@ -0,0 +1,50 @@
+import dataclasses
+
+from its_cdktf_base.compute.session_hosts import (
+    DEFAULT_IMAGE,
+    DEFAULT_SESSION_HOSTS,
+    SessionHostPool,
+)
+from its_cdktf_base.interning import intern
+from its_cdktf_base.network.topology import DEFAULT_TOPOLOGY, NetworkTopology
+
+SPEC = {
+    "address_space": ["10.0.0.0/16"],
+    "gateway_subnet_cidr": "10.0.254.0/24",
+    "vpn_client_address_space": "10.10.10.0/24",
+    "tiers": [
+        {"name": "client", "cidr": "10.0.1.0/24", "nat": True},
+        {
+            "name": "dmz",
+            "cidr": "10.0.0.0/24",
+            "rules": [{"name": "DenyAllInbound", "priority": 400, "access": "Deny"}],
+        },
+    ],
+}
+
+
+def test_identical_inventory_entries_share_one_config():
+    pools = [SessionHostPool.from_dict({"count": 10, "image": {}}) for _ in range(1000)]
+    assert all(pool is pools[0] for pool in pools)
+    assert pools[0].image is DEFAULT_IMAGE
+    assert SessionHostPool.from_dict({}) is DEFAULT_SESSION_HOSTS
+
+    first, second = NetworkTopology.from_dict(SPEC), NetworkTopology.from_dict(SPEC)
+    assert all(a is b for a, b in zip(first.tiers, second.tiers))
+    assert first.tiers[1].rules[0] is second.tiers[1].rules[0]
+
+
+def test_configs_have_no_instance_dict():
+    tier = DEFAULT_TOPOLOGY.tiers[0]
+    for config in (DEFAULT_SESSION_HOSTS, DEFAULT_IMAGE, tier):
+        assert not hasattr(config, "__dict__")
+    # An equal config built again is the interned instance, not a copy
+    assert intern(dataclasses.replace(tier)) is intern(tier)
+    assert intern(SessionHostPool()) is DEFAULT_SESSION_HOSTS
+
+
+def test_vpn_client_config_is_shared_per_tenant():
+    config = DEFAULT_TOPOLOGY.vpn_client_config("tenant")
+    assert config is DEFAULT_TOPOLOGY.vpn_client_config("tenant")
+    assert config is not DEFAULT_TOPOLOGY.vpn_client_config("other")
+    assert config.address_space == ("10.10.10.0/24",)
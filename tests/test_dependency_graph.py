@@ -0,0 +1,253 @@
+import io
+import json
+
+import pytest
+
+from its_cdktf_base.synth.dependency_graph import (
+    METADATA_KEY,
+    DependencyGraph,
+    critical_path_report,
+    main,
+    prune_depends_on,
+    report_outdir,
+    resources,
+    unpruned_config,
+)
+
+DURATIONS = {
+    "azurerm_resource_group": 5,
+    "azurerm_virtual_network": 15,
+    "azurerm_subnet": 10,
+    "azurerm_subnet_network_security_group_association": 15,
+    "azurerm_network_security_group": 5,
+    "azurerm_network_security_rule": 10,
+    "azurerm_virtual_network_gateway": 2700,
+}
+
+
+def meta(path: str) -> dict:
+    return {"//": {"metadata": {"path": f"network/{path}"}}}
+
+
+# A networking stack as cdktf writes it: depends_on entries as "${address}",
+# subnet ids passed through a local, and a chain of depends_on the attribute
+# references already imply
+CONFIG = {
+    "locals": {
+        "its-subnet-ids": "${{ for k, s in azurerm_subnet.its-subnets : k => s.id }}"
+    },
+    "resource": {
+        "azurerm_resource_group": {"its-rg": {"name": "rg", **meta("its-rg")}},
+        "azurerm_virtual_network": {
+            "its-vnet": {
+                "resource_group_name": "${azurerm_resource_group.its-rg.name}",
+                "depends_on": ["${azurerm_resource_group.its-rg}"],
+                **meta("its-vnet"),
+            }
+        },
+        "azurerm_subnet": {
+            "its-subnets": {
+                "virtual_network_name": "${azurerm_virtual_network.its-vnet.name}",
+                "depends_on": [
+                    "${azurerm_virtual_network.its-vnet}",
+                    "${azurerm_resource_group.its-rg}",
+                ],
+                **meta("its-subnets"),
+            }
+        },
+        "azurerm_subnet_network_security_group_association": {
+            "its-nsg-associations": {
+                "subnet_id": '${lookup(local.its-subnet-ids, "client")}',
+                **meta("its-nsg-associations"),
+            }
+        },
+        "azurerm_network_security_group": {
+            "its-nsg": {
+                "resource_group_name": "${azurerm_resource_group.its-rg.name}",
+                **meta("its-nsg"),
+            }
+        },
+        "azurerm_network_security_rule": {
+            "its-rules": {
+                "network_security_group_name": (
+                    "${azurerm_network_security_group.its-nsg.name}"
+                ),
+                "depends_on": [
+                    "${azurerm_subnet_network_security_group_association.its-nsg-associations}"
+                ],
+                **meta("its-rules"),
+            }
+        },
+        "azurerm_virtual_network_gateway": {
+            "its-vngw": {
+                "resource_group_name": "${azurerm_resource_group.its-rg.name}",
+                "depends_on": [
+                    "${azurerm_subnet_network_security_group_association.its-nsg-associations}"
+                ],
+                **meta("its-vngw"),
+            }
+        },
+    },
+}
+
+RG = "azurerm_resource_group.its-rg"
+VNET = "azurerm_virtual_network.its-vnet"
+SUBNETS = "azurerm_subnet.its-subnets"
+ASSOCIATIONS = "azurerm_subnet_network_security_group_association.its-nsg-associations"
+VNGW = "azurerm_virtual_network_gateway.its-vngw"
+RULES = "azurerm_network_security_rule.its-rules"
+# The gateway as authored before apply_required_ordering: also waiting on
+# every NSG rule
+UNPRUNED = {f"${{{VNGW}}}": [f"${{{ASSOCIATIONS}}}", f"${{{RULES}}}"]}
+ORDERING = {"its-vngw": ["its-nsg-associations"]}
+
+
+def test_depends_on_in_cdktf_form_and_locals_are_edges():
+    graph = DependencyGraph.from_config(CONFIG)
+    assert graph.explicit[VNET] == {RG}
+    assert graph.explicit[VNGW] == {ASSOCIATIONS}
+    # The association only references the subnets through local.its-subnet-ids
+    assert graph.implicit[ASSOCIATIONS] == {SUBNETS}
+    assert "local.its-subnet-ids" not in graph.edges()
+    assert graph.redundant_depends_on() == {VNET: {RG}, SUBNETS: {VNET, RG}}
+
+
+def test_prune_keeps_references_and_the_required_ordering():
+    pruned = prune_depends_on(CONFIG, ORDERING)
+    bodies = resources(pruned)
+    assert bodies[VNGW]["depends_on"] == [ASSOCIATIONS]
+    assert all("depends_on" not in bodies[a] for a in (RG, VNET, SUBNETS))
+    # Everything else is untouched, and the input is not modified
+    assert (
+        bodies[VNET]["resource_group_name"] == "${azurerm_resource_group.its-rg.name}"
+    )
+    assert "depends_on" in resources(CONFIG)[VNET]
+
+    # Without the ordering the gateway no longer waits on the association
+    bodies = resources(prune_depends_on(CONFIG))
+    assert "depends_on" not in bodies[VNGW]
+
+
+def test_schedule_and_critical_path():
+    graph = DependencyGraph.from_config(CONFIG)
+    times = graph.schedule(DURATIONS)
+    assert times[RG] == (0, 5)
+    assert times[VNET] == (5, 20)
+    assert times[SUBNETS] == (20, 30)
+    assert times[ASSOCIATIONS] == (30, 45)
+    assert times[VNGW] == (45, 2745)
+    assert graph.critical_path(DURATIONS) == [RG, VNET, SUBNETS, ASSOCIATIONS, VNGW]
+
+    pruned = DependencyGraph.from_config(prune_depends_on(CONFIG))
+    assert pruned.schedule(DURATIONS)[VNGW] == (5, 2705)
+    assert pruned.critical_path(DURATIONS) == [RG, VNGW]
+    assert DependencyGraph({}, {}).critical_path() == []
+
+
+def test_cycles_are_reported():
+    graph = DependencyGraph(
+        {"a.a": {"b.b"}, "b.b": {"a.a"}}, {"a.a": set(), "b.b": set()}
+    )
+    with pytest.raises(ValueError, match="cycle"):
+        graph.schedule()
+
+
+def recorded(config: dict, unpruned: dict) -> dict:
+    # config with what apply_required_ordering writes into its "//" block
+    return dict(
+        config,
+        **{
+            "//": {
+                METADATA_KEY: {
+                    "requiredOrdering": ORDERING,
+                    "unprunedDependsOn": unpruned,
+                }
+            }
+        },
+    )
+
+
+def test_unpruned_config_puts_back_the_replaced_depends_on():
+    config = recorded(CONFIG, UNPRUNED)
+    before = resources(unpruned_config(config))
+    assert before[VNGW]["depends_on"] == [f"${{{ASSOCIATIONS}}}", f"${{{RULES}}}"]
+    assert resources(config)[VNGW]["depends_on"] == [f"${{{ASSOCIATIONS}}}"]
+    assert unpruned_config(CONFIG) == CONFIG
+
+
+def test_report_is_emitted_from_the_synthesized_app(tmp_path):
+    config = recorded(CONFIG, UNPRUNED)
+    (tmp_path / "stacks" / "network").mkdir(parents=True)
+    (tmp_path / "stacks" / "network" / "cdk.tf.json").write_text(json.dumps(config))
+    (tmp_path / "stacks" / "avd").mkdir(parents=True)
+    (tmp_path / "stacks" / "avd" / "cdk.tf.json").write_text(json.dumps({}))
+    (tmp_path / "manifest.json").write_text(
+        json.dumps(
+            {
+                "stacks": {
+                    name: {"synthesizedStackPath": f"stacks/{name}/cdk.tf.json"}
+                    for name in ("network", "avd")
+                }
+            }
+        )
+    )
+    stream = io.StringIO()
+    report = report_outdir(str(tmp_path), DURATIONS, stream=stream)
+    assert report == stream.getvalue().strip()
+    # Only stacks that recorded an ordering are reported
+    assert report.startswith("network:\n")
+    assert "avd" not in report
+    # Pruning drops the wait on the NSG rules, so the gateway starts earlier
+    assert "before: its-vngw starts at ~55s" in report
+    assert "after: its-vngw starts at ~45s" in report
+    assert "its-vngw no longer waits on 1 x azurerm_network_security_rule" in report
+    assert report_outdir(str(tmp_path / "missing")) is None
+
+
+def test_cli_compares_against_the_recorded_config(tmp_path, capsys):
+    path = tmp_path / "cdk.tf.json"
+    config = recorded(CONFIG, UNPRUNED)
+    path.write_text(json.dumps(config))
+    main([str(path)])
+    out = capsys.readouterr().out
+    assert (
+        out
+        == critical_path_report(
+            unpruned_config(config),
+            prune_depends_on(config, ORDERING),
+            watch="its-vngw",
+        )
+        + "\n"
+    )
+    assert "no longer waits on 1 x azurerm_network_security_group" in out
+
+
+def test_apply_required_ordering_records_what_it_replaced(tmp_path):
+    pytest.importorskip("cdktf")
+    pytest.importorskip("imports.azurerm")
+    from cdktf import App
+
+    from its_cdktf_base.network.its_networking_stack_base import (
+        ItsNetworkingStackBase,
+    )
+
+    app = App(outdir=str(tmp_path))
+    ItsNetworkingStackBase(app, "network")
+    app.synth()
+    with open(tmp_path / "stacks" / "network" / "cdk.tf.json") as f:
+        config = json.load(f)
+    recorded = config["//"][METADATA_KEY]
+    assert "metadata" in config["//"]
+    # The gateway is ordered by its references alone, but the baseline keeps
+    # the depends_on it was authored with
+    assert "its-vngw" not in recorded["requiredOrdering"]
+    assert not DependencyGraph.from_config(config).explicit[VNGW]
+    unpruned = recorded["unprunedDependsOn"][f"${{{VNGW}}}"]
+    assert f"${{{ASSOCIATIONS}}}" in unpruned
+    before = DependencyGraph.from_config(unpruned_config(config))
+    assert ASSOCIATIONS in before.explicit[VNGW]
+
+    report = report_outdir(str(tmp_path), stream=io.StringIO())
+    assert "before: its-vngw starts at ~105s" in report
+    assert "after: its-vngw starts at ~30s" in report
+    assert "no longer waits on 1 x azurerm_network_security_group\n" in report + "\n"
@@ -0,0 +1,285 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+import pytest
+
+from its_cdktf_base.deploy.backend import StateLocation
+from its_cdktf_base.deploy.orchestrator import (
+    LOCAL_RECORD,
+    ApplyRecords,
+    Backoff,
+    BlobLeaseProbe,
+    DeployOrchestrator,
+    load_stacks,
+)
+from its_cdktf_base.synth.incremental import CHANGES_FILE
+
+# Well-known development account of the Azurite storage emulator
+AZURITE_CONNECTION_STRING = os.environ.get(
+    "AZURITE_CONNECTION_STRING",
+    "DefaultEndpointsProtocol=http;AccountName=devstoreaccount1;"
+    "AccountKey=Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/"
+    "K1SZFPTOtr/KBHBeksoGMGw==;BlobEndpoint=http://127.0.0.1:10000/devstoreaccount1;",
+)
+
+
+def write_app(outdir, stacks: dict, customer: str = "abc"):
+    # A cdktf.out directory with a manifest and a backend block per stack
+    location = StateLocation.for_customer(customer)
+    manifest = {"version": "0.17.3", "stacks": {}}
+    for name, dependencies in stacks.items():
+        directory = outdir / "stacks" / name
+        directory.mkdir(parents=True)
+        backend = {
+            "resource_group_name": location.resource_group_name,
+            "storage_account_name": location.storage_account_name,
+            "container_name": location.container_name,
+            "key": location.key(name),
+        }
+        (directory / "cdk.tf.json").write_text(
+            json.dumps({"terraform": {"backend": {"azurerm": backend}}})
+        )
+        manifest["stacks"][name] = {
+            "name": name,
+            "synthesizedStackPath": f"stacks/{name}/cdk.tf.json",
+            "workingDirectory": f"stacks/{name}",
+            "dependencies": dependencies,
+        }
+    (outdir / "manifest.json").write_text(json.dumps(manifest))
+    return str(outdir)
+
+
+class FakeTerraform:
+    # Records applies and how many ran at once; applies sleep briefly so
+    # independent stacks overlap
+    def __init__(self, lock_errors: dict = None, failures: set = ()):
+        self.lock_errors = dict(lock_errors or {})
+        self.failures = set(failures)
+        self.applied = []
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, directory, args):
+        name = os.path.basename(directory)
+        if args == ["init"]:
+            return 0, "Terraform has been successfully initialized!"
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(0.05)
+            with self._lock:
+                if self.lock_errors.get(name, 0):
+                    self.lock_errors[name] -= 1
+                    return 1, "Error: Error acquiring the state lock"
+                if name in self.failures:
+                    return 1, "Error: creating Virtual Network Gateway"
+                self.applied.append(name)
+                return 0, "Apply complete!"
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+class FakeProbe:
+    # Reports a key as leased for its first few checks
+    def __init__(self, leased: dict):
+        self.leased = dict(leased)
+        self.checks = []
+
+    def is_locked(self, backend):
+        self.checks.append(backend["key"])
+        if self.leased.get(backend["key"], 0):
+            self.leased[backend["key"]] -= 1
+            return True
+        return False
+
+
+def orchestrator(outdir, **kwargs):
+    kwargs.setdefault("backoff", Backoff(base=0, attempts=5))
+    return DeployOrchestrator(load_stacks(outdir), report=lambda _: None, **kwargs)
+
+
+def test_state_location_uses_bootstrap_naming():
+    location = StateLocation.for_customer("abc")
+    assert location.resource_group_name == "tfstate-abc"
+    assert location.storage_account_name == "tfstateabc"
+    assert location.container_name == "tfstate-abc"
+    assert location.key("abc-network") == "abc-network.tfstate"
+    with pytest.raises(ValueError):
+        StateLocation.for_customer("Not-A-Storage-Name")
+
+
+def test_independent_stacks_apply_concurrently_after_dependencies(tmp_path):
+    outdir = write_app(
+        tmp_path,
+        {
+            "core": [],
+            "security": ["core"],
+            "egress": ["core"],
+            "gateway": ["security", "egress"],
+            "avd": [],
+        },
+    )
+    terraform = FakeTerraform()
+    results = orchestrator(outdir, runner=terraform, max_parallel=4).run()
+
+    assert {result["status"] for result in results.values()} == {"ok"}
+    order = terraform.applied
+    assert order.index("core") < order.index("security") < order.index("gateway")
+    assert order.index("egress") < order.index("gateway")
+    assert terraform.max_running >= 2
+
+
+def test_parallelism_is_capped(tmp_path):
+    outdir = write_app(tmp_path, {f"stack{i}": [] for i in range(8)})
+    terraform = FakeTerraform()
+    orchestrator(outdir, runner=terraform, max_parallel=3).run()
+    assert terraform.max_running <= 3
+    assert len(terraform.applied) == 8
+
+
+def test_backs_off_while_the_state_blob_is_leased(tmp_path):
+    outdir = write_app(tmp_path, {"core": [], "avd": []})
+    probe = FakeProbe({"core.tfstate": 2})
+    sleeps = []
+    results = orchestrator(
+        outdir, runner=FakeTerraform(), probe=probe, sleep=sleeps.append
+    ).run()
+
+    assert results["core"]["status"] == "ok"
+    assert probe.checks.count("core.tfstate") == 3
+    assert len(sleeps) == 2
+
+
+def test_retries_when_terraform_loses_the_lock(tmp_path):
+    outdir = write_app(tmp_path, {"core": []})
+    terraform = FakeTerraform(lock_errors={"core": 2})
+    results = orchestrator(outdir, runner=terraform, sleep=lambda _: None).run()
+    assert results["core"]["status"] == "ok"
+    assert results["core"]["attempts"] == 3
+
+
+def test_gives_up_on_a_lock_that_is_never_released(tmp_path):
+    outdir = write_app(tmp_path, {"core": [], "security": ["core"]})
+    probe = FakeProbe({"core.tfstate": 100})
+    results = orchestrator(
+        outdir, runner=FakeTerraform(), probe=probe, sleep=lambda _: None
+    ).run()
+    assert results["core"]["status"] == "locked"
+    assert results["security"]["status"] == "skipped"
+
+
+def test_failure_skips_dependents_only(tmp_path):
+    outdir = write_app(
+        tmp_path, {"core": [], "gateway": ["core"], "avd": [], "hosts": ["avd"]}
+    )
+    terraform = FakeTerraform(failures={"core"})
+    results = orchestrator(outdir, runner=terraform).run()
+    assert results["core"]["status"] == "failed"
+    assert results["gateway"]["status"] == "skipped"
+    assert results["hosts"]["status"] == "ok"
+
+
+class FakeBlobs:
+    # Blobs by (container, key)
+    def __init__(self):
+        self.blobs = {}
+
+    def download(self, backend):
+        return self.blobs.get((backend["container_name"], backend["key"]))
+
+    def upload(self, backend, content):
+        self.blobs[(backend["container_name"], backend["key"])] = content
+
+
+def test_changed_only_skips_stacks_unchanged_since_their_last_apply(tmp_path):
+    outdir = write_app(
+        tmp_path, {"core": [], "security": ["core"], "gateway": ["security"]}
+    )
+    blobs = FakeBlobs()
+    records = ApplyRecords(blobs)
+    terraform = FakeTerraform(failures={"gateway"})
+    orchestrator(outdir, runner=terraform, records=records).run()
+    # Only successful applies are recorded, next to the state blob
+    assert sorted(key for _, key in blobs.blobs) == [
+        "core.tfstate.applied",
+        "security.tfstate.applied",
+    ]
+
+    # gateway never applied, so it runs again even though no synth changed it
+    terraform = FakeTerraform()
+    results = orchestrator(
+        outdir, runner=terraform, records=records, changed_only=True
+    ).run()
+    assert results["core"]["status"] == "unchanged"
+    assert results["security"]["status"] == "unchanged"
+    assert results["gateway"]["status"] == "ok"
+    assert terraform.applied == ["gateway"]
+
+    # A changed stack applies again, whatever changes.json says
+    (tmp_path / "stacks" / "core" / "cdk.tf.json").write_text('{"resource": {}}')
+    (tmp_path / CHANGES_FILE).write_text(
+        json.dumps({"stacks": {"core": {}}, "changed": [], "removed": []})
+    )
+    terraform = FakeTerraform()
+    orchestrator(outdir, runner=terraform, records=records, changed_only=True).run()
+    assert terraform.applied == ["core"]
+
+
+def test_plans_and_local_state_records(tmp_path):
+    outdir = write_app(tmp_path, {"core": []})
+    stacks = load_stacks(outdir)
+    stacks["core"]["backend"] = None
+    records = ApplyRecords()
+    DeployOrchestrator(
+        stacks, runner=FakeTerraform(), command=("plan",), report=lambda _: None
+    ).run()
+    assert records.get(stacks["core"]) is None
+
+    DeployOrchestrator(stacks, runner=FakeTerraform(), report=lambda _: None).run()
+    assert records.get(stacks["core"]) == stacks["core"]["fingerprint"]
+    assert (tmp_path / "stacks" / "core" / LOCAL_RECORD).exists()
+    # The record is not part of the stack's fingerprint
+    assert load_stacks(outdir)["core"]["fingerprint"] == stacks["core"]["fingerprint"]
+
+
+def azurite_running() -> bool:
+    try:
+        socket.create_connection(("127.0.0.1", 10000), timeout=0.5).close()
+        return True
+    except OSError:
+        return False
+
+
+@pytest.mark.skipif(not azurite_running(), reason="Azurite is not running")
+def test_blob_lease_probe_against_azurite():
+    blob_module = pytest.importorskip("azure.storage.blob")
+    service = blob_module.BlobServiceClient.from_connection_string(
+        AZURITE_CONNECTION_STRING
+    )
+    container = service.create_container(f"tfstate-{uuid.uuid4().hex[:8]}")
+    try:
+        backend = {
+            "storage_account_name": "devstoreaccount1",
+            "container_name": container.container_name,
+            "key": "abc-network.tfstate",
+        }
+        probe = BlobLeaseProbe(AZURITE_CONNECTION_STRING)
+        assert probe.is_locked(backend) is False
+        assert probe.download(backend) is None
+
+        blob = container.get_blob_client(backend["key"])
+        blob.upload_blob(b"{}")
+        assert probe.download(backend) == b"{}"
+        lease = blob.acquire_lease(lease_duration=15)
+        assert probe.is_locked(backend) is True
+        lease.release()
+        assert probe.is_locked(backend) is False
+    finally:
+        container.delete_container()
@@ -0,0 +1,285 @@
+import json
+import threading
+
+import pytest
+
+from its_cdktf_base.deploy.drift import (
+    ResourceReader,
+    check_drift,
+    customer_state,
+    stack_states,
+    state_index,
+)
+
+RG = "/subscriptions/0000/resourceGroups/its-networking-stack/providers/Microsoft.Network"
+VNET = f"{RG}/virtualNetworks/its-vnet"
+NSG = f"{RG}/networkSecurityGroups/its-server-nsg"
+SUBNET = f"{VNET}/subnets/its-server-subnet"
+VNGW = f"{RG}/virtualNetworkGateways/its-vngw"
+
+RULE = {
+    "name": "allow-rdp",
+    "priority": 100,
+    "direction": "Inbound",
+    "access": "Allow",
+    "protocol": "Tcp",
+    "source_port_range": "*",
+    "source_port_ranges": [],
+    "destination_port_range": "",
+    "destination_port_ranges": ["3389"],
+    "source_address_prefix": "10.0.1.0/24",
+    "source_address_prefixes": [],
+    "destination_address_prefix": "*",
+    "destination_address_prefixes": [],
+}
+
+# Shaped like the state ItsNetworkingStackBase leaves behind
+STATE = {
+    "version": 4,
+    "resources": [
+        {
+            "mode": "managed",
+            "type": "azurerm_network_security_group",
+            "name": "its-nsgs",
+            "instances": [
+                {
+                    "index_key": "server",
+                    "attributes": {"id": NSG, "security_rule": [RULE]},
+                }
+            ],
+        },
+        {
+            "mode": "managed",
+            "type": "azurerm_subnet",
+            "name": "its-subnets",
+            "instances": [
+                {
+                    "index_key": "server",
+                    "attributes": {
+                        "id": SUBNET,
+                        "address_prefixes": ["10.0.2.0/24"],
+                        "service_endpoints": [],
+                    },
+                }
+            ],
+        },
+        {
+            "mode": "managed",
+            "type": "azurerm_subnet_network_security_group_association",
+            "name": "its-nsg-associations",
+            "instances": [
+                {
+                    "index_key": "server",
+                    "attributes": {"id": SUBNET, "network_security_group_id": NSG},
+                }
+            ],
+        },
+        {
+            "mode": "managed",
+            "type": "azurerm_virtual_network_gateway",
+            "name": "its-vngw",
+            "instances": [{"attributes": {"id": VNGW}}],
+        },
+        {
+            "mode": "data",
+            "type": "azurerm_client_config",
+            "name": "current",
+            "instances": [{"attributes": {"id": "x"}}],
+        },
+    ],
+}
+
+
+def arm_rule(**overrides) -> dict:
+    properties = {
+        "priority": 100,
+        "direction": "Inbound",
+        "access": "Allow",
+        "protocol": "Tcp",
+        "sourcePortRange": "*",
+        "destinationPortRange": "3389",
+        "sourceAddressPrefix": "10.0.1.0/24",
+        "destinationAddressPrefix": "*",
+    }
+    properties.update(overrides)
+    return {"name": "allow-rdp", "properties": properties}
+
+
+def live(**rule) -> dict:
+    # ARM resources by id, matching STATE unless overridden
+    return {
+        NSG: {"properties": {"securityRules": [arm_rule(**rule)]}},
+        SUBNET: {
+            "properties": {
+                "addressPrefix": "10.0.2.0/24",
+                "networkSecurityGroup": {"id": NSG.upper()},
+            }
+        },
+    }
+
+
+class FakeReader(ResourceReader):
+    def __init__(self, resources: dict, fail: set = ()):
+        self.resources = resources
+        self.fail = fail
+        self.reads = []
+        self._lock = threading.Lock()
+
+    def read(self, resource_id):
+        with self._lock:
+            self.reads.append(resource_id)
+        if resource_id in self.fail:
+            raise ConnectionError("throttled")
+        return self.resources.get(resource_id)
+
+
+def test_readers_must_implement_read():
+    class Incomplete(ResourceReader):
+        pass
+
+    with pytest.raises(TypeError, match="read"):
+        Incomplete()
+    assert FakeReader({}).read("missing") is None
+
+
+def test_state_is_indexed_by_instance_address():
+    index = state_index(
+        {
+            "resources": STATE["resources"]
+            + [
+                {
+                    "mode": "managed",
+                    "module": "module.spoke",
+                    "type": "azurerm_subnet",
+                    "name": "hosts",
+                    "instances": [{"index_key": 0, "attributes": {"id": "a"}}],
+                }
+            ]
+        }
+    )
+    assert sorted(index) == [
+        'azurerm_network_security_group.its-nsgs["server"]',
+        'azurerm_subnet.its-subnets["server"]',
+        'azurerm_subnet_network_security_group_association.its-nsg-associations["server"]',
+        "azurerm_virtual_network_gateway.its-vngw",
+        "module.spoke.azurerm_subnet.hosts[0]",
+    ]
+    assert index["azurerm_virtual_network_gateway.its-vngw"].id == VNGW
+
+
+def test_no_drift_and_only_checked_types_are_read():
+    reader = FakeReader(live())
+    assert check_drift(state_index(STATE), reader) == []
+    # The association shares the subnet's id, which is read once; the VNGW
+    # is never read
+    assert sorted(reader.reads) == sorted([NSG, SUBNET])
+
+
+def test_edited_nsg_rule_is_reported():
+    reader = FakeReader(live(priority=4000, sourceAddressPrefix="0.0.0.0/0"))
+    (drift,) = check_drift(state_index(STATE), reader)
+    assert drift.status == "drifted"
+    assert drift.address == 'azurerm_network_security_group.its-nsgs["server"]'
+    ((attribute, state, actual),) = drift.differences
+    assert attribute == "security_rule"
+    assert state[0]["priority"] == 100 and actual[0]["priority"] == 4000
+    assert actual[0]["source_address_prefixes"] == ["0.0.0.0/0"]
+    assert "in Azure" in str(drift)
+
+
+def test_detached_nsg_and_deleted_subnet_are_reported():
+    resources = live()
+    resources[SUBNET]["properties"]["networkSecurityGroup"] = None
+    drifts = check_drift(state_index(STATE), FakeReader(resources))
+    assert [(d.address.split(".")[0], d.status) for d in drifts] == [
+        ("azurerm_subnet_network_security_group_association", "drifted")
+    ]
+
+    del resources[SUBNET]
+    drifts = check_drift(state_index(STATE), FakeReader(resources))
+    assert {d.status for d in drifts} == {"deleted"}
+    assert len(drifts) == 2
+
+
+def test_types_can_be_narrowed_and_read_errors_are_reported():
+    reader = FakeReader(live(), fail={NSG})
+    (drift,) = check_drift(state_index(STATE), reader)
+    assert drift.status == "error" and "throttled" in drift.error
+
+    reader = FakeReader(live(), fail={NSG})
+    assert check_drift(state_index(STATE), reader, types=["azurerm_subnet"]) == []
+    assert reader.reads == [SUBNET]
+    with pytest.raises(ValueError):
+        check_drift(state_index(STATE), reader, types=["azurerm_virtual_machine"])
+
+
+def test_resources_are_read_concurrently():
+    # Every read blocks until all of them have started
+    resources = {f"{RG}/subnets/s{i}": {"properties": {}} for i in range(8)}
+    state = {
+        "resources": [
+            {
+                "mode": "managed",
+                "type": "azurerm_subnet",
+                "name": "s",
+                "instances": [
+                    {"index_key": i, "attributes": {"id": resource_id}}
+                    for i, resource_id in enumerate(resources)
+                ],
+            }
+        ]
+    }
+    barrier = threading.Barrier(len(resources), timeout=5)
+
+    class BlockingReader(FakeReader):
+        def read(self, resource_id):
+            barrier.wait()
+            return super().read(resource_id)
+
+    assert (
+        check_drift(state_index(state), BlockingReader(resources), max_workers=8) == []
+    )
+
+
+class FakeBlobs:
+    def __init__(self, blobs: dict):
+        self.blobs = blobs
+
+    def download(self, backend):
+        return self.blobs.get(
+            (backend["storage_account_name"], backend["container_name"], backend["key"])
+        )
+
+
+def test_states_come_from_the_backend_or_a_local_file(tmp_path):
+    manifest = {"stacks": {}}
+    backends = {
+        "network": {
+            "azurerm": {
+                "storage_account_name": "tfstateabc",
+                "container_name": "tfstate-abc",
+                "key": "network.tfstate",
+            }
+        },
+        "avd": {"local": {"path": "terraform.avd.tfstate"}},
+        "new": {},
+    }
+    for name, backend in backends.items():
+        (tmp_path / "stacks" / name).mkdir(parents=True)
+        (tmp_path / "stacks" / name / "cdk.tf.json").write_text(
+            json.dumps({"terraform": {"backend": backend}})
+        )
+        manifest["stacks"][name] = {
+            "workingDirectory": f"stacks/{name}",
+            "synthesizedStackPath": f"stacks/{name}/cdk.tf.json",
+        }
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest))
+    (tmp_path / "stacks" / "avd" / "terraform.avd.tfstate").write_text('{"serial": 2}')
+
+    blobs = FakeBlobs(
+        {("tfstateabc", "tfstate-abc", "network.tfstate"): json.dumps(STATE).encode()}
+    )
+    states = stack_states(str(tmp_path), blobs)
+    assert states == {"network": STATE, "avd": {"serial": 2}}
+    assert customer_state("abc", "network", blobs) == STATE
+    assert customer_state("abc", "avd", blobs) is None
@@ -0,0 +1,173 @@
+import json
+
+import pytest
+
+from its_cdktf_base.network.address_allocator import (
+    AddressAllocator,
+    AddressOverlapError,
+)
+from its_cdktf_base.network.hub import DEFAULT_HUB_TOPOLOGY, HubConfig
+from its_cdktf_base.network.topology import DEFAULT_TOPOLOGY, NetworkTopology
+from its_cdktf_base.synth.driver import allocate_spokes
+
+HUB = {"subscription_id": "00000000-0000-0000-0000-000000000001"}
+HUB_SPOKE = {"hub": HUB}
+
+
+def spoke(address_space: str) -> NetworkTopology:
+    return NetworkTopology.from_dict(
+        {
+            "address_space": [address_space],
+            "gateway_subnet_cidr": address_space.replace("0.0/16", "254.0/24"),
+            "vpn_client_address_space": "192.168.0.0/24",
+            "tiers": [{"name": "client", "cidr": address_space.replace("/16", "/24")}],
+        }
+    )
+
+
+def test_hub_config_names_the_hub_network():
+    hub = HubConfig.from_dict(HUB)
+    assert hub is HubConfig.from_dict(dict(HUB))
+    assert hub.topology is DEFAULT_HUB_TOPOLOGY
+    assert hub.resource_group_name == "its-networking-stack-hub"
+    assert hub.vnet_id == (
+        "/subscriptions/00000000-0000-0000-0000-000000000001/resourceGroups/"
+        "its-networking-stack-hub/providers/Microsoft.Network/virtualNetworks/its-vnet"
+    )
+
+
+def test_hub_region_from_plain_data():
+    hub = HubConfig.from_dict(dict(HUB, region={"location": "eastus2"}))
+    assert hub.region.name == "hub"
+    assert hub.region.location == "eastus2"
+
+
+def test_spokes_use_the_hub_vpn_client_pool():
+    hub = HubConfig.from_dict(HUB)
+    topology = hub.spoke_topology(spoke("10.1.0.0/16"))
+    assert topology.vpn_client_address_space == (
+        DEFAULT_HUB_TOPOLOGY.vpn_client_address_space
+    )
+    assert hub.spoke_topology(DEFAULT_TOPOLOGY).tiers == DEFAULT_TOPOLOGY.tiers
+
+
+@pytest.mark.parametrize("address_space", ["10.254.0.0/16", "10.10.0.0/16"])
+def test_spokes_overlapping_the_hub_are_rejected(address_space):
+    with pytest.raises(AddressOverlapError):
+        HubConfig.from_dict(HUB).spoke_topology(spoke(address_space))
+
+
+def test_adding_a_spoke_leaves_the_hub_and_other_spokes_unchanged():
+    pytest.importorskip("cdktf")
+    pytest.importorskip("imports.azurerm")
+    from cdktf import Testing
+
+    from its_cdktf_base.network.its_hub_spoke_stacks import ItsHubStack, ItsSpokeStack
+
+    def synth(spokes: int) -> dict:
+        app = Testing.app()
+        hub = ItsHubStack(app, "hub", HUB, tenant_id="tenant")
+        stacks = {"hub": hub}
+        for i in range(spokes):
+            stacks[f"spoke{i}"] = ItsSpokeStack(
+                app, f"spoke{i}", HubConfig.from_dict(HUB), spoke(f"10.{i + 1}.0.0/16")
+            )
+        return {name: json.loads(Testing.synth(s)) for name, s in stacks.items()}
+
+    few, more = synth(2), synth(5)
+    assert few["hub"] == more["hub"]
+    assert few["spoke1"] == more["spoke1"]
+
+    peerings = more["spoke4"]["resource"]["azurerm_virtual_network_peering"]
+    hub_side = next(p for p in peerings.values() if p.get("allow_gateway_transit"))
+    spoke_side = next(p for p in peerings.values() if p.get("use_remote_gateways"))
+    assert hub_side["provider"] == "azurerm.hub"
+    assert spoke_side["remote_virtual_network_id"] == HubConfig.from_dict(HUB).vnet_id
+    assert "azurerm_virtual_network_gateway" not in more["spoke4"]["resource"]
+
+
+def test_spokes_of_a_hub_stack_need_their_own_address_space():
+    pytest.importorskip("cdktf")
+    pytest.importorskip("imports.azurerm")
+    from cdktf import Testing
+
+    from its_cdktf_base.network.its_hub_spoke_stacks import ItsHubStack, ItsSpokeStack
+
+    app = Testing.app()
+    hub = ItsHubStack(app, "hub", HUB, tenant_id="tenant")
+    ItsSpokeStack(app, "abc", hub, spoke("10.1.0.0/16"))
+    with pytest.raises(AddressOverlapError, match="abc"):
+        ItsSpokeStack(app, "def", hub, spoke("10.1.0.0/16"))
+    with pytest.raises(ValueError, match="topology"):
+        ItsSpokeStack(app, "ghi", hub)
+
+
+def test_spokes_of_a_hub_may_not_overlap_each_other():
+    hub = HubConfig.from_dict(HUB)
+    allocator = AddressAllocator()
+    hub.assign_spoke(allocator, "abc", spoke("10.1.0.0/16"))
+    # Assigning the same spoke again is fine, another spoke in its range is not
+    hub.assign_spoke(allocator, "abc", spoke("10.1.0.0/16"))
+    with pytest.raises(AddressOverlapError, match="abc"):
+        hub.assign_spoke(allocator, "def", spoke("10.1.0.0/16"))
+    # A spoke that moves gives up its old range
+    hub.assign_spoke(allocator, "abc", spoke("10.2.0.0/16"))
+    hub.assign_spoke(allocator, "def", spoke("10.1.0.0/16"))
+
+
+def test_spokes_without_a_topology_get_their_own_address_space():
+    hub = HubConfig.from_dict(HUB)
+    allocator = AddressAllocator()
+    first = hub.assign_spoke(allocator, "abc", template=DEFAULT_TOPOLOGY)
+    second = hub.assign_spoke(allocator, "def", template=DEFAULT_TOPOLOGY)
+    assert first.address_space != second.address_space
+    assert (
+        first.vpn_client_address_space == DEFAULT_HUB_TOPOLOGY.vpn_client_address_space
+    )
+    # Allocation goes around the hub and its VPN client pool
+    for cidr in first.address_space + second.address_space:
+        assert not cidr.startswith(("10.254.", "10.10."))
+    with pytest.raises(ValueError):
+        hub.assign_spoke(allocator, "ghi")
+
+
+def inventory(*spokes) -> list:
+    return [
+        {"customer": f"c{i}", "stacks": {"spoke": dict(HUB_SPOKE, **kwargs)}}
+        for i, kwargs in enumerate(spokes)
+    ]
+
+
+def test_driver_allocates_spokes_from_the_hub_ledger(tmp_path):
+    explicit = {"topology": spoke("10.0.0.0/16").to_dict()}
+    planned = allocate_spokes(inventory(explicit, {}, {}), str(tmp_path))
+    spaces = [
+        entry["stacks"]["spoke"]["topology"]["address_space"] for entry in planned
+    ]
+    assert spaces[0] == ("10.0.0.0/16",)
+    assert len({space for (space,) in spaces}) == 3
+
+    # A later run keeps every customer's address space
+    again = allocate_spokes(inventory(explicit, {}, {}), str(tmp_path))
+    assert again == planned
+    ledger = tmp_path / f"{HUB['subscription_id']}.json"
+    assert "c1" in json.loads(ledger.read_text())["allocations"].values()
+
+    # Topologies round-trip through the inventory's plain data
+    topology = NetworkTopology.from_dict(planned[1]["stacks"]["spoke"]["topology"])
+    assert topology.address_space == spaces[1]
+
+
+def test_driver_rejects_overlapping_inventory_spokes():
+    overlapping = inventory(
+        {"topology": spoke("10.1.0.0/16").to_dict()},
+        {"topology": spoke("10.1.0.0/16").to_dict()},
+    )
+    with pytest.raises(AddressOverlapError, match="c0"):
+        allocate_spokes(overlapping)
+    # Spokes of different hubs may reuse a range
+    overlapping[1]["stacks"]["spoke"]["hub"] = {"subscription_id": "other"}
+    allocate_spokes(overlapping)
+    # Without a ledger there is nothing to allocate from
+    with pytest.raises(ValueError, match="ledger"):
+        allocate_spokes(inventory({}))
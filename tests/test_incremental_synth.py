@@ -0,0 +1,132 @@
+import json
+import os
+
+from its_cdktf_base.synth.incremental import (
+    CHANGES_FILE,
+    changed_stacks,
+    sync_outdir,
+)
+
+
+def synthesize(staging, stacks: dict, dependencies: dict = None):
+    # A cdktf.out directory as app.synth() writes it: one cdk.tf.json per stack
+    dependencies = dependencies or {}
+    manifest = {"version": "0.17.3", "stacks": {}}
+    for name, config in stacks.items():
+        directory = staging / "stacks" / name
+        directory.mkdir(parents=True)
+        (directory / "cdk.tf.json").write_text(json.dumps(config, indent=2))
+        manifest["stacks"][name] = {
+            "name": name,
+            "synthesizedStackPath": f"stacks/{name}/cdk.tf.json",
+            "workingDirectory": f"stacks/{name}",
+            "dependencies": dependencies.get(name, []),
+        }
+    (staging / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    return str(staging)
+
+
+def config(**resources) -> dict:
+    return {"resource": {"azurerm_subnet": resources}}
+
+
+def mtimes(outdir) -> dict:
+    return {
+        os.path.relpath(os.path.join(directory, name), outdir): os.stat(
+            os.path.join(directory, name)
+        ).st_mtime_ns
+        for directory, _, files in os.walk(outdir)
+        for name in files
+        if name != CHANGES_FILE
+    }
+
+
+def backdate(outdir):
+    # Push every mtime into the past so a rewrite is always visible
+    for path in mtimes(outdir):
+        os.utime(os.path.join(outdir, path), ns=(0, 0))
+
+
+def test_first_synth_adds_every_stack(tmp_path):
+    staging = synthesize(tmp_path / "staging", {"core": config(a={}), "avd": {}})
+    changes = sync_outdir(staging, str(tmp_path / "out"))
+
+    assert changes["changed"] == ["core", "avd"]
+    assert {s["status"] for s in changes["stacks"].values()} == {"added"}
+    assert (tmp_path / "out" / "stacks" / "core" / "cdk.tf.json").is_file()
+    assert (tmp_path / "out" / "manifest.json").is_file()
+
+
+def test_unchanged_stacks_are_not_rewritten(tmp_path):
+    stacks = {"core": config(a={}), "security": config(b={}), "avd": {}}
+    outdir = str(tmp_path / "out")
+    sync_outdir(synthesize(tmp_path / "first", stacks), outdir)
+    backdate(outdir)
+
+    stacks["security"] = config(b={"name": "renamed"})
+    changes = sync_outdir(synthesize(tmp_path / "second", stacks), outdir)
+
+    assert changes["changed"] == ["security"]
+    assert changes["stacks"]["core"]["status"] == "unchanged"
+    assert changes["stacks"]["security"]["status"] == "changed"
+    assert changed_stacks(outdir) == {"security"}
+    rewritten = {path for path, mtime in mtimes(outdir).items() if mtime}
+    assert rewritten == {os.path.join("stacks", "security", "cdk.tf.json")}
+
+
+def test_resynth_with_no_changes_writes_nothing(tmp_path):
+    stacks = {"core": config(a={}), "avd": {}}
+    outdir = str(tmp_path / "out")
+    sync_outdir(synthesize(tmp_path / "first", stacks), outdir)
+    backdate(outdir)
+
+    changes = sync_outdir(synthesize(tmp_path / "second", stacks), outdir)
+    assert changes["changed"] == []
+    assert set(mtimes(outdir).values()) == {0}
+
+
+def test_dependency_changes_count_as_changes(tmp_path):
+    stacks = {"core": config(a={}), "gateway": {}}
+    outdir = str(tmp_path / "out")
+    sync_outdir(synthesize(tmp_path / "first", stacks), outdir)
+    changes = sync_outdir(
+        synthesize(tmp_path / "second", stacks, {"gateway": ["core"]}), outdir
+    )
+    assert changes["changed"] == ["gateway"]
+
+
+def test_removed_stacks_and_files_are_deleted(tmp_path):
+    outdir = tmp_path / "out"
+    first = synthesize(tmp_path / "first", {"core": config(a={}), "old": {}})
+    (tmp_path / "first" / "stacks" / "core" / "assets.zip").write_bytes(b"zip")
+    sync_outdir(first, str(outdir))
+    (outdir / "stacks" / "core" / ".terraform").mkdir()
+    (outdir / "stacks" / "core" / ".terraform.lock.hcl").write_text("lock")
+
+    changes = sync_outdir(
+        synthesize(tmp_path / "second", {"core": config(a={})}), str(outdir)
+    )
+    assert changes["removed"] == ["old"]
+    assert changes["changed"] == ["core"]
+    assert not (outdir / "stacks" / "old").exists()
+    assert not (outdir / "stacks" / "core" / "assets.zip").exists()
+    # Terraform's own files in the working directory are left alone
+    assert (outdir / "stacks" / "core" / ".terraform").is_dir()
+    assert (outdir / "stacks" / "core" / ".terraform.lock.hcl").is_file()
+
+
+def test_edits_to_the_outdir_are_detected(tmp_path):
+    stacks = {"core": config(a={})}
+    outdir = tmp_path / "out"
+    sync_outdir(synthesize(tmp_path / "first", stacks), str(outdir))
+    (outdir / "stacks" / "core" / "cdk.tf.json").write_text("{}")
+
+    changes = sync_outdir(synthesize(tmp_path / "second", stacks), str(outdir))
+    assert changes["changed"] == ["core"]
+    assert json.loads((outdir / "stacks" / "core" / "cdk.tf.json").read_text()) == (
+        config(a={})
+    )
+
+
+def test_outdirs_without_a_changes_manifest_count_every_stack_as_changed(tmp_path):
+    assert changed_stacks(str(tmp_path)) is None
@@ -0,0 +1,62 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.import_time import EAGER_TARGETS, TARGETS, cold_import_time
+from its_cdktf_base import lazy_imports
+from its_cdktf_base.lazy_imports import lazy_import
+
+# Prints the cdktf and provider modules loaded by a statement
+LOADED = """
+import json, sys
+{statement}
+print(json.dumps(sorted(
+    name for name in sys.modules
+    if name.split(".")[0] in ("cdktf", "imports")
+    or name.startswith("cdktf_cdktf_provider_azurerm")
+)))
+"""
+
+
+def loaded_by(statement: str) -> list:
+    result = subprocess.run(
+        [sys.executable, "-c", LOADED.format(statement=statement)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_importing_the_packages_loads_neither_cdktf_nor_the_provider():
+    assert loaded_by("import its_cdktf_base") == []
+    assert loaded_by("import its_cdktf_base.network, its_cdktf_base.compute") == []
+
+
+def test_importing_a_stack_does_not_load_the_provider():
+    pytest.importorskip("cdktf")
+    pytest.importorskip("imports.azurerm")
+    loaded = loaded_by("from its_cdktf_base.network import ItsNetworkingStackBase")
+    assert "cdktf" in loaded
+    assert not [name for name in loaded if name.startswith("imports.azurerm")]
+
+
+def test_lazy_module_imports_on_first_attribute_access():
+    module = lazy_import("json")
+    assert "json" in lazy_imports.declared
+    assert repr(module) == "<lazy module 'json' (not loaded)>"
+    assert module.dumps([1]) == "[1]"
+    assert repr(module) == "<lazy module 'json' (loaded)>"
+    assert lazy_imports.loaded[-1] == "json"
+
+
+def test_lazy_provider_imports_make_importing_a_stack_faster():
+    pytest.importorskip("cdktf")
+    pytest.importorskip("imports.azurerm")
+    # Cold imports in fresh interpreters. Loading the provider modules up front
+    # takes seconds, importing cdktf alone well under one.
+    lazy = cold_import_time(TARGETS["ItsNetworkingStackBase"])
+    eager = cold_import_time(EAGER_TARGETS["ItsNetworkingStackBase (eager)"])
+    assert lazy < eager
@@ -0,0 +1,165 @@
+import json
+
+import pytest
+
+from its_cdktf_base.network.nsg_rules import (
+    RULE_ATTRIBUTES,
+    Policy,
+    PriorityCollisionError,
+    compile_rules,
+)
+from its_cdktf_base.network.topology import NetworkTopology, NsgRule, SubnetTier
+
+TIERS = (SubnetTier("client", "10.0.1.0/24"), SubnetTier("server", "10.0.2.0/24"))
+
+
+def rules(*policies, tiers=TIERS) -> list:
+    # Compiled rules of the server tier's NSG
+    topology = NetworkTopology(
+        address_space=("10.0.0.0/16",),
+        gateway_subnet_cidr="10.0.254.0/24",
+        vpn_client_address_space="10.10.10.0/24",
+        tiers=tiers,
+        policies=policies,
+    )
+    return compile_rules(topology)["server"]
+
+
+def summary(rule: dict) -> tuple:
+    return (
+        rule["priority"],
+        rule["access"],
+        rule["source_address_prefix"] or rule["source_address_prefixes"],
+        rule["destination_port_range"] or rule["destination_port_ranges"],
+    )
+
+
+def test_services_and_sources_merge_into_one_rule():
+    compiled = rules(
+        Policy(("client", "vpn"), ("server",), ("rdp", "ssh")),
+        Policy(("10.8.0.0/24",), ("server",), ("rdp", "ssh")),
+    )
+    assert [summary(rule) for rule in compiled] == [
+        (
+            100,
+            "Allow",
+            ["10.0.1.0/24", "10.10.10.0/24", "10.8.0.0/24"],
+            ["22", "3389"],
+        )
+    ]
+    assert compiled[0]["destination_address_prefix"] == "10.0.2.0/24"
+
+
+def test_merges_keep_the_first_matching_rule_of_every_packet():
+    # Merging the second Deny into the first would move it ahead of the Allow
+    compiled = rules(
+        Policy(("10.9.0.0/24",), ("server",), ("ssh",), "Deny"),
+        Policy(("10.8.0.0/24",), ("server",), ("ssh",)),
+        Policy(("10.8.0.0/24",), ("server",), ("ssh",), "Deny"),
+    )
+    assert [summary(rule) for rule in compiled] == [
+        (100, "Deny", "10.9.0.0/24", "22"),
+        (110, "Allow", "10.8.0.0/24", "22"),
+        (120, "Deny", "10.8.0.0/24", "22"),
+    ]
+
+
+def test_rules_merge_past_rules_they_do_not_overlap():
+    compiled = rules(
+        Policy(("10.9.0.0/24",), ("server",), ("ssh",), "Deny"),
+        Policy(("10.8.0.0/24",), ("server",), ("rdp",)),
+        Policy(("10.7.0.0/24",), ("server",), ("ssh",), "Deny"),
+    )
+    assert [summary(rule) for rule in compiled] == [
+        (100, "Deny", ["10.7.0.0/24", "10.9.0.0/24"], "22"),
+        (110, "Allow", "10.8.0.0/24", "3389"),
+    ]
+
+
+def test_merging_never_widens_a_rule():
+    # ssh from one source and rdp from another must not become both from both
+    compiled = rules(
+        Policy(("10.8.0.0/24",), ("server",), ("ssh",)),
+        Policy(("10.9.0.0/24",), ("server",), ("rdp",)),
+    )
+    assert [summary(rule) for rule in compiled] == [
+        (100, "Allow", "10.8.0.0/24", "22"),
+        (110, "Allow", "10.9.0.0/24", "3389"),
+    ]
+
+
+def test_service_tags_keep_their_own_rule():
+    compiled = rules(
+        Policy(("vpn", "AzureLoadBalancer", "VirtualNetwork"), ("server",), ("rdp",))
+    )
+    assert [summary(rule) for rule in compiled] == [
+        (100, "Allow", "10.10.10.0/24", "3389"),
+        (110, "Allow", "AzureLoadBalancer", "3389"),
+        (120, "Allow", "VirtualNetwork", "3389"),
+    ]
+    assert all(not rule["source_address_prefixes"] for rule in compiled)
+
+
+def test_any_port_absorbs_single_ports():
+    compiled = rules(Policy(("client",), ("server",), ("ssh", "https", "Tcp/*")))
+    assert [summary(rule) for rule in compiled] == [(100, "Allow", "10.0.1.0/24", "*")]
+    # "any" is every protocol, so it does not merge with a Tcp rule
+    assert len(rules(Policy(("client",), ("server",), ("ssh", "any")))) == 2
+
+
+def test_explicit_priorities_are_kept_and_skipped():
+    tiers = (
+        TIERS[0],
+        SubnetTier(
+            "server",
+            "10.0.2.0/24",
+            rules=(NsgRule("AllowLb", 100, source_address_prefix="AzureLoadBalancer"),),
+        ),
+    )
+    compiled = rules(
+        Policy(("client",), ("server",), ("rdp",), priority=4000, name="AllowRdpLast"),
+        Policy(("vpn",), ("server",), ("ssh",)),
+        tiers=tiers,
+    )
+    assert [(rule["name"], rule["priority"]) for rule in compiled] == [
+        ("AllowLb", 100),
+        ("AllowInbound", 110),
+        ("AllowRdpLast", 4000),
+    ]
+
+
+def test_priority_collisions_are_rejected():
+    tiers = (TIERS[0], SubnetTier("server", "10.0.2.0/24", rules=(NsgRule("a", 200),)))
+    with pytest.raises(PriorityCollisionError):
+        rules(Policy(("client",), ("server",), priority=200), tiers=tiers)
+    with pytest.raises(ValueError):
+        rules(Policy(("client",), ("server",), priority=5000))
+    with pytest.raises(ValueError):
+        rules(Policy(("client",), ("nowhere",)))
+
+
+def test_every_rule_carries_every_attribute():
+    compiled = rules(
+        Policy(("client", "vpn"), ("server",), ("rdp", "ssh")),
+        Policy(("10.9.0.0/24",), ("server",), ("https",)),
+    )
+    for rule in compiled:
+        assert set(rule) == set(RULE_ATTRIBUTES)
+        assert None not in rule.values()
+
+
+def test_synthesized_security_rules_carry_every_attribute(jsii_kernel):
+    from its_cdktf_base.network import ItsNetworkingStackBase
+
+    config = json.loads(
+        jsii_kernel.synth(ItsNetworkingStackBase(jsii_kernel.app(), "network"))
+    )
+    # One for_each NSG resource; each tier's rules are in its for_each value
+    nsgs = config["resource"]["azurerm_network_security_group"]["its-nsgs"]
+    security_rules = [
+        rule for nsg in nsgs["for_each"].values() for rule in nsg["security_rules"]
+    ]
+    # AllowVngwInbound merges two ports and so only uses the plural field
+    assert any(rule["destination_port_ranges"] for rule in security_rules)
+    for rule in security_rules:
+        assert set(rule) == set(RULE_ATTRIBUTES), rule["name"]
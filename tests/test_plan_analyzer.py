@@ -0,0 +1,161 @@
+import io
+import json
+import os
+import tracemalloc
+
+import pytest
+
+from its_cdktf_base.deploy.plan_analyzer import (
+    PlanStream,
+    PlanSummary,
+    classify,
+    resource_changes,
+    stack_name,
+)
+
+# Size of the generated fixture plans, override for a quicker local run
+FIXTURE_MB = int(os.environ.get("ITS_PLAN_FIXTURE_MB", "300"))
+
+# (type, name, actions) cycled through the generated resource_changes
+CHANGES = [
+    ("azurerm_subnet", "its-subnets", ["update"]),
+    ("azurerm_network_security_group", "its-nsgs", ["update"]),
+    ("azurerm_network_interface", "avd-vm-nic-id", ["create"]),
+    ("azurerm_windows_virtual_machine", "windows-vm", ["no-op"]),
+    ("azurerm_nat_gateway", "its-natgw", ["delete", "create"]),
+    ("azurerm_virtual_network_gateway", "its-vngw", ["create", "delete"]),
+    ("azurerm_public_ip", "its-natgw-public-ip", ["no-op"]),
+]
+
+
+def attributes(i: int) -> dict:
+    return {
+        "id": f"/subscriptions/0000/resourceGroups/its-networking-stack/r/{i}",
+        "name": f"resource-{i}",
+        "tags": {f"tag{j}": "x" * 40 for j in range(8)},
+        "security_rule": [
+            {"name": f"rule-{j}", "priority": 100 + j, "access": "Allow"}
+            for j in range(6)
+        ],
+    }
+
+
+def resource_change(i: int) -> dict:
+    type, name, actions = CHANGES[i % len(CHANGES)]
+    return {
+        "address": f'{type}.{name}["key-{i}"]',
+        "mode": "managed",
+        "type": type,
+        "name": name,
+        "index": f"key-{i}",
+        "change": {
+            "actions": actions,
+            "before": attributes(i),
+            "after": attributes(i + 1),
+            "replace_paths": [["name"]] if "delete" in actions else [],
+        },
+    }
+
+
+def write_plan(path, megabytes: int) -> int:
+    # Streams a plan in terraform show -json layout, with planned_values and
+    # prior_state as large as resource_changes so the analyzer has to skip them
+    # without loading them. Returns the number of resource changes written.
+    target = megabytes * 1024 * 1024 // 3
+    with open(path, "w") as f:
+        f.write('{"format_version": "1.2", "terraform_version": "1.5.2",')
+        f.write('"planned_values": {"root_module": {"resources": [')
+        written, i = 0, 0
+        while written < target:
+            chunk = json.dumps({"address": f"r.{i}", "values": attributes(i)})
+            f.write(("," if i else "") + chunk)
+            written += len(chunk)
+            i += 1
+        f.write("]}},")
+        f.write('"resource_changes": [')
+        written, count = 0, 0
+        while written < target:
+            chunk = json.dumps(resource_change(count), indent=2)
+            f.write(("," if count else "") + chunk)
+            written += len(chunk)
+            count += 1
+        f.write("],")
+        f.write('"prior_state": {"values": {"root_module": {"resources": [')
+        f.write(",".join(json.dumps(attributes(i)) for i in range(1000)))
+        f.write(']}}}, "output_changes": {}}')
+    return count
+
+
+@pytest.fixture(scope="module")
+def large_plans(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("plans")
+    plans = {}
+    for stack in ("customer-a-network", "customer-b-network"):
+        path = directory / stack / "plan.json"
+        path.parent.mkdir()
+        plans[str(path)] = write_plan(path, FIXTURE_MB // 2)
+    return plans
+
+
+def test_classify():
+    assert classify(["create"]) == "create"
+    assert classify(["update"]) == "update"
+    assert classify(["delete", "create"]) == "replace"
+    assert classify(["create", "delete"]) == "replace"
+    assert classify(["no-op"]) == "no-op"
+
+
+def test_stream_matches_json_load():
+    plan = {
+        "format_version": "1.2",
+        "planned_values": {"root_module": {"resources": [{"a": [1, 2.5e3, None]}]}},
+        "resource_changes": [resource_change(i) for i in range(3)],
+        "configuration": {"nested": {"deep": ["x" * 100] * 10}},
+    }
+    text = json.dumps(plan, indent=1)
+    # A tiny chunk size puts value boundaries at every possible position
+    for chunk_size in (1, 7, 4096):
+        stream = PlanStream(io.StringIO(text), chunk_size=chunk_size)
+        assert dict((key, stream.value()[1]) for key in stream.members()) == plan
+    assert list(resource_changes(io.StringIO(text))) == plan["resource_changes"]
+
+
+def test_summary_of_large_plans_in_constant_memory(large_plans):
+    summary = PlanSummary()
+    tracemalloc.start()
+    try:
+        for path in large_plans:
+            summary.add_plan(stack_name(path), path)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # Well under the size of either plan file
+    assert peak < 64 * 1024 * 1024
+    assert summary.resources == sum(large_plans.values())
+
+    stacks = {stack for stack, _, _ in summary.changes}
+    assert stacks == {"customer-a-network", "customer-b-network"}
+    counts = summary.changes[
+        ("customer-a-network", "azurerm_virtual_network_gateway", "its-vngw")
+    ]
+    assert set(counts) == {"replace"}
+    assert "azurerm_windows_virtual_machine" not in {
+        type for _, type, _ in summary.changes
+    }
+
+    flagged = {(type, construct) for _, type, construct, _ in summary.destructive}
+    assert flagged == {
+        ("azurerm_nat_gateway", "its-natgw"),
+        ("azurerm_virtual_network_gateway", "its-vngw"),
+    }
+    vngw = summary.destructive[
+        ("customer-b-network", "azurerm_virtual_network_gateway", "its-vngw", "replace")
+    ]
+    # Both fixture plans are generated the same way
+    assert vngw["count"] == counts["replace"]
+    assert len(vngw["addresses"]) <= summary.samples
+    assert vngw["replace_paths"] == [["name"]]
+    assert "DESTRUCTIVE replace of azurerm_virtual_network_gateway.its-vngw" in (
+        summary.report()
+    )
@@ -0,0 +1,236 @@
+import json
+import time
+
+from its_cdktf_base.synth.policy import (
+    Finding,
+    PolicyEngine,
+    Rule,
+    RULES,
+    unused_bindings,
+)
+
+VNET = "azurerm_virtual_network.its-vnet"
+
+
+def network(tiers: dict, nsgs: dict = None, **extra) -> dict:
+    # A config shaped like the networking stack's synthesized output, with the
+    # tiers and NSG rules in literal for_each maps
+    resource = {
+        "azurerm_virtual_network": {
+            "its-vnet": {"name": "its-vnet", "address_space": ["10.0.0.0/16"]}
+        },
+        "azurerm_subnet": {
+            "its-subnets": {
+                "for_each": {
+                    name: {"name": f"its-{name}-subnet", "address_prefixes": [cidr]}
+                    for name, cidr in tiers.items()
+                },
+                "name": "${each.value.name}",
+                "virtual_network_name": f"${{{VNET}.name}}",
+                "address_prefixes": "${each.value.address_prefixes}",
+            }
+        },
+        "azurerm_network_security_group": {
+            "its-nsgs": {
+                "for_each": {
+                    name: {"name": f"its-{name}-nsg", "security_rules": rules}
+                    for name, rules in (nsgs or {}).items()
+                },
+                "name": "${each.value.name}",
+                "security_rule": "${each.value.security_rules}",
+            }
+        },
+    }
+    for resource_type, bodies in extra.items():
+        resource.setdefault(resource_type, {}).update(bodies)
+    return {"resource": resource}
+
+
+def rule(name: str, priority: int, direction: str = "Inbound") -> dict:
+    return {"name": name, "priority": priority, "direction": direction}
+
+
+def check(config: dict, **kwargs) -> list:
+    return PolicyEngine(**kwargs).check(config, "abc-network")
+
+
+def by_rule(findings: list, name: str) -> list:
+    return [finding for finding in findings if finding.rule == name]
+
+
+def test_clean_network_has_no_findings():
+    config = network(
+        {"client": "10.0.1.0/24", "server": "10.0.2.0/24"},
+        {"client": [rule("rdp", 100), rule("out", 100, "Outbound")]},
+    )
+    assert check(config) == []
+
+
+def test_overlapping_subnets_are_reported_per_instance():
+    config = network(
+        {"client": "10.0.1.0/24", "server": "10.0.1.128/25", "dmz": "10.0.3.0/24"}
+    )
+    findings = by_rule(check(config), "cidr-overlap")
+    assert [f.address for f in findings] == ['azurerm_subnet.its-subnets["server"]']
+    assert "10.0.1.0/24" in findings[0].message
+
+
+def test_subnets_outside_the_vnet_are_reported():
+    findings = by_rule(check(network({"client": "10.1.0.0/24"})), "cidr-overlap")
+    assert [f.address for f in findings] == ['azurerm_subnet.its-subnets["client"]']
+    assert "outside" in findings[0].message
+
+
+def test_nsg_priority_collisions():
+    config = network(
+        {"client": "10.0.1.0/24"},
+        {"client": [rule("rdp", 100), rule("ssh", 100), rule("https", 110)]},
+    )
+    findings = by_rule(check(config), "nsg-priority")
+    assert len(findings) == 1
+    assert findings[0].address == 'azurerm_network_security_group.its-nsgs["client"]'
+    assert "'ssh' reuses priority 100 of 'rdp'" in findings[0].message
+
+
+def test_standalone_nsg_rule_collisions():
+    standalone = {
+        name: {
+            "network_security_group_name": "its-client-nsg",
+            "resource_group_name": "its-networking-stack",
+            **rule(name, 200),
+        }
+        for name in ("allow-a", "allow-b")
+    }
+    config = network({}, azurerm_network_security_rule=standalone)
+    findings = by_rule(check(config), "nsg-priority")
+    assert [f.address for f in findings] == ["azurerm_network_security_rule.allow-b"]
+
+
+def test_plaintext_secrets():
+    vm = {
+        "windows-vm": {
+            "admin_username": "Tom",
+            "admin_password": "Bombadil!",
+            "os_profile": {"custom_password": "${var.password}"},
+        },
+        "other-vm": {"admin_password": "${random_password.vm.result}"},
+    }
+    config = network({}, azurerm_windows_virtual_machine=vm)
+    findings = by_rule(check(config), "plaintext-secret")
+    assert [f.address for f in findings] == [
+        "azurerm_windows_virtual_machine.windows-vm"
+    ]
+    assert "Bombadil" not in findings[0].message
+
+
+def test_duplicated_and_implied_depends_on():
+    vngw = {
+        "its-vngw": {
+            "ip_configuration": [{"subnet_id": "${azurerm_subnet.its-vngw-subnet.id}"}],
+            "depends_on": [
+                "azurerm_subnet_network_security_group_association.its_server_nsg_association",
+                "azurerm_subnet_network_security_group_association.its_server_nsg_association",
+                "azurerm_subnet.its-vngw-subnet",
+            ],
+        }
+    }
+    config = network(
+        {},
+        azurerm_virtual_network_gateway=vngw,
+        azurerm_subnet={"its-vngw-subnet": {"name": "GatewaySubnet"}},
+        azurerm_subnet_network_security_group_association={
+            "its_server_nsg_association": {}
+        },
+    )
+    findings = by_rule(check(config), "redundant-depends-on")
+    messages = sorted(f.message for f in findings)
+    assert messages == [
+        "depends_on azurerm_subnet.its-vngw-subnet is already implied",
+        "depends_on lists azurerm_subnet_network_security_group_association."
+        "its_server_nsg_association twice",
+    ]
+    assert {f.severity for f in findings} == {"warning"}
+
+
+def test_unused_declarations():
+    config = network({})
+    config["data"] = {
+        "azurerm_client_config": {"used": {}, "unused": {}},
+    }
+    config["locals"] = {"tenant": "${data.azurerm_client_config.used.tenant_id}"}
+    config["output"] = {"tenant": {"value": "${local.tenant}"}}
+    config["variable"] = {"password": {"type": "string"}}
+    config["provider"] = {"azurerm": [{"features": {}}, {"alias": "east"}]}
+    findings = by_rule(check(config), "unused-declaration")
+    assert sorted(f.address for f in findings) == [
+        "data.azurerm_client_config.unused",
+        "provider.azurerm.east",
+        "var.password",
+    ]
+
+
+def test_rules_are_pluggable_and_can_be_disabled():
+    class PublicIpRule(Rule):
+        name = "no-public-ip"
+        types = ("azurerm_public_ip",)
+
+        def visit(self, address, body):
+            yield self.finding(address, "public ips need an exception")
+
+    visited = []
+
+    class CountingRule(Rule):
+        name = "counting"
+
+        def visit(self, address, body):
+            visited.append(address)
+            return ()
+
+    config = network({}, azurerm_public_ip={"its-vngw-public-ip": {}})
+    findings = check(
+        config,
+        rules=RULES + (PublicIpRule, CountingRule),
+        disabled=("unused-declaration",),
+    )
+    assert findings == [
+        Finding(
+            "no-public-ip",
+            "error",
+            "abc-network",
+            "azurerm_public_ip.its-vngw-public-ip",
+            "public ips need an exception",
+        )
+    ]
+    # Every resource is visited exactly once
+    assert sorted(visited) == sorted(set(visited))
+    assert len(visited) == 4
+
+
+def test_hundreds_of_stacks_in_seconds():
+    tiers = {f"tier{i}": f"10.0.{i}.0/24" for i in range(100)}
+    nsgs = {name: [rule(f"r{j}", 100 + j * 10) for j in range(20)] for name in tiers}
+    config = json.loads(json.dumps(network(tiers, nsgs)))
+    engine = PolicyEngine()
+    start = time.perf_counter()
+    for i in range(300):
+        assert engine.check(config, f"stack{i}") == []
+    assert time.perf_counter() - start < 10
+
+
+def test_unused_bindings(tmp_path):
+    source = tmp_path / "stack.py"
+    source.write_text(
+        "import os\n"
+        "from cdktf import App, TerraformStack\n"
+        "from its_cdktf_base.lazy_imports import lazy_import\n"
+        'subnet = lazy_import("imports.azurerm.subnet")\n'
+        'virtual_machine_extension = lazy_import("imports.azurerm.virtual_machine_extension")\n'
+        "class Stack(TerraformStack):\n"
+        "    def build(self):\n"
+        "        return subnet.Subnet(self, 'x'), os.sep\n"
+    )
+    findings = unused_bindings(str(source))
+    assert sorted(f.message for f in findings) == [
+        "App is imported but never used",
+        "virtual_machine_extension is imported but never used",
+    ]
@@ -0,0 +1,84 @@
+import io
+import json
+import sys
+import time
+import types
+
+import pytest
+
+from its_cdktf_base.lazy_imports import lazy_import
+from its_cdktf_base.synth import profiling
+
+
+@pytest.fixture
+def provider_module(monkeypatch):
+    # A provider module with one construct whose constructor makes one JSII
+    # call, without starting the kernel
+    jsii = pytest.importorskip("jsii")
+    from constructs import Construct
+
+    calls = []
+
+    def create(*args, **kwargs):
+        calls.append(args)
+        time.sleep(0.002)
+        return types.SimpleNamespace(ref=f"fake@{len(calls)}")
+
+    class FakeResource(Construct):
+        def __init__(self, scope, id):
+            # As JSII-generated constructors do
+            self.__jsii_ref__ = jsii.create(type(self), self, [scope, id])
+
+    module = types.ModuleType("fake_provider")
+    FakeResource.__module__ = module.__name__
+    module.FakeResource = FakeResource
+    monkeypatch.setitem(sys.modules, module.__name__, module)
+    monkeypatch.setattr(jsii, "create", create)
+    monkeypatch.setenv(profiling.ENV_VAR, "1")
+    yield module, create, calls
+    profiling.reset()
+
+
+def test_profiler_records_calls_and_restores_the_patches(provider_module, tmp_path):
+    import jsii
+
+    module, create, calls = provider_module
+    init = module.FakeResource.__init__
+    scope = types.SimpleNamespace(node=types.SimpleNamespace(path="stack"))
+
+    # First use of the lazy module installs the profiler and instruments it
+    assert lazy_import(module.__name__).FakeResource is module.FakeResource
+    assert jsii.create is not create
+    assert module.FakeResource.__init__ is not init
+    module.FakeResource(scope, "vm")
+    jsii.create(None, None, [])
+    assert len(calls) == 2
+
+    stack_dir = tmp_path / "stacks" / "stack"
+    stack_dir.mkdir(parents=True)
+    block = {"name": "vm", "//": {"metadata": {"path": "stack/vm"}}}
+    (stack_dir / "cdk.tf.json").write_text(
+        json.dumps({"resource": {"fake": {"vm": block}}})
+    )
+    stream = io.StringIO()
+    folded = profiling.profiler().finish(outdir=str(tmp_path), stream=stream)
+
+    (line,) = open(folded).read().splitlines()
+    stack, micros = line.split(" ")
+    assert stack == "stack;vm"
+    assert int(micros) >= 2000
+    with open(tmp_path / "profile.json") as f:
+        records = json.load(f)
+    assert records["stack/vm"]["jsii_calls"] == 1
+    assert records["stack/vm"]["json_bytes"] == len(
+        json.dumps(block, separators=(",", ":"))
+    )
+    assert records[profiling.UNATTRIBUTED]["jsii_calls"] == 1
+    assert "stack/vm" in stream.getvalue()
+
+    profiling.reset()
+    assert jsii.create is create
+    assert module.FakeResource.__init__ is init
+    module.FakeResource(scope, "vm")
+    assert len(calls) == 3
+    assert profiling._profiler is None
@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from its_cdktf_base.compute.session_hosts import SessionHostPool
+
+SUBNET_ID = (
+    "/subscriptions/00000000-0000-0000-0000-000000000000/resourceGroups/"
+    "its-networking-stack/providers/Microsoft.Network/virtualNetworks/its-vnet/"
+    "subnets/its-client-subnet"
+)
+HOSTS = 7
+NIC = "azurerm_network_interface"
+VM = "azurerm_windows_virtual_machine"
+EXTENSION = "azurerm_virtual_machine_extension"
+
+
+def test_pool_rejects_names_windows_cannot_take():
+    assert SessionHostPool.from_dict({"count": 3}).count == 3
+    with pytest.raises(ValueError, match="15 characters"):
+        SessionHostPool(count=100, name_prefix="avd-host-pool")
+
+
+def test_session_hosts_synthesize_as_one_counted_resource_each(jsii_kernel):
+    from its_cdktf_base.compute import ItsVirtualDesktopStack
+
+    stack = ItsVirtualDesktopStack(
+        jsii_kernel.app(),
+        "avd",
+        subnet_id=SUBNET_ID,
+        session_hosts={"count": HOSTS},
+    )
+    config = json.loads(jsii_kernel.synth(stack))
+    resources = config["resource"]
+    for resource_type in (NIC, VM, EXTENSION):
+        (body,) = resources[resource_type].values()
+        assert body["count"] == HOSTS
+    (vm,) = resources[VM].values()
+    assert vm["network_interface_ids"] == [
+        "${azurerm_network_interface.avd-vm-nic-id[count.index].id}"
+    ]
+    # The single host of earlier deployments becomes host 0 instead of being
+    # replaced
+    assert config["moved"] == [
+        {
+            "from": "azurerm_network_interface.avd-vm-nic-id",
+            "to": "azurerm_network_interface.avd-vm-nic-id[0]",
+        },
+        {
+            "from": "azurerm_windows_virtual_machine.windows-vm",
+            "to": "azurerm_windows_virtual_machine.windows-vm[0]",
+        },
+    ]
+
+
+def test_legacy_first_host_keeps_its_names(jsii_kernel):
+    from its_cdktf_base.compute import ItsVirtualDesktopStack
+
+    pool = SessionHostPool.from_dict({"count": 3, "legacy_first_host": True})
+    stack = ItsVirtualDesktopStack(
+        jsii_kernel.app(), "avd", subnet_id=SUBNET_ID, session_hosts=pool
+    )
+    resources = json.loads(jsii_kernel.synth(stack))["resource"]
+    (vm,) = resources[VM].values()
+    (nic,) = resources[NIC].values()
+    # Each of these forces a new resource, so host 0 keeps the names it was
+    # deployed with
+    assert vm["name"] == (
+        '${count.index == 0 ? "azure-virtual-desktop-vm" : '
+        'format("avd-host-%d", count.index)}'
+    )
+    assert vm["computer_name"] == (
+        '${count.index == 0 ? "mason-avd" : format("avd-host-%d", count.index)}'
+    )
+    assert nic["name"] == (
+        '${count.index == 0 ? "avd-nic" : format("avd-host-nic-%d", count.index)}'
+    )
+
+
+def test_registration_token_expiry_is_stable_between_plans(jsii_kernel):
+    from its_cdktf_base.compute import ItsVirtualDesktopStack
+
+    stack = ItsVirtualDesktopStack(jsii_kernel.app(), "avd", subnet_id=SUBNET_ID)
+    config = json.loads(jsii_kernel.synth(stack))
+    (info,) = config["resource"][
+        "azurerm_virtual_desktop_host_pool_registration_info"
+    ].values()
+    assert info["expiration_date"] == (
+        "${time_rotating.avd-registration-rotation.rotation_rfc3339}"
+    )
+    assert "timestamp()" not in json.dumps(config)
+    assert "time" in config["provider"]
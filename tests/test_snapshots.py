@@ -0,0 +1,252 @@
+import json
+
+import pytest
+
+from its_cdktf_base.synth.driver import stack_class
+from its_cdktf_base.synth.policy import PolicyEngine
+from its_cdktf_base.synth.snapshots import (
+    MISSING,
+    SnapshotStore,
+    format_diff,
+    normalize,
+    structural_diff,
+)
+
+SUBNET_ID = (
+    "/subscriptions/00000000-0000-0000-0000-000000000000/resourceGroups/"
+    "its-networking-stack/providers/Microsoft.Network/virtualNetworks/its-vnet/"
+    "subnets/its-client-subnet"
+)
+HUB = {"subscription_id": "00000000-0000-0000-0000-000000000001"}
+TENANT_ID = "00000000-0000-0000-0000-00000000000a"
+
+
+def spoke_topology(index: int) -> dict:
+    # The default layout moved to 10.<index>.0.0/16, as the synth driver
+    # allocates it
+    return {
+        "address_space": [f"10.{index}.0.0/16"],
+        "gateway_subnet_cidr": f"10.{index}.254.0/24",
+        "vpn_client_address_space": "10.10.10.0/24",
+        "tiers": [
+            {"name": "client", "cidr": f"10.{index}.2.0/24", "nat": True},
+            {"name": "server", "cidr": f"10.{index}.1.0/24", "nat": True},
+        ],
+        "policies": [
+            {
+                "name": "AllowVngwInbound",
+                "sources": ["vpn"],
+                "destinations": ["client", "server"],
+                "services": ["rdp", "ssh"],
+            }
+        ],
+    }
+
+
+# The construct test matrix: snapshot name -> (driver stack key, plain-data
+# keyword arguments, as a customer inventory would pass them)
+CASES = {
+    "network-default": ("network", {}),
+    "network-customer": ("network", {"customer": "abc", "tenant_id": TENANT_ID}),
+    "network-policies": (
+        "network",
+        {
+            "topology": {
+                "address_space": ["10.1.0.0/16"],
+                "gateway_subnet_cidr": "10.1.254.0/24",
+                "vpn_client_address_space": "192.168.0.0/24",
+                "tiers": [
+                    {"name": "client", "cidr": "10.1.1.0/24", "nat": True},
+                    {"name": "server", "cidr": "10.1.2.0/24", "nat": True},
+                ],
+                "policies": [
+                    {
+                        "name": "AllowRdp",
+                        "sources": ["vpn", "client"],
+                        "destinations": ["server"],
+                        "services": ["Tcp/3389"],
+                    }
+                ],
+            }
+        },
+    ),
+    "avd-default": ("avd", {"subnet_id": SUBNET_ID}),
+    "avd-pool": (
+        "avd",
+        {
+            "subnet_id": SUBNET_ID,
+            "session_hosts": {"count": 4, "size": "Standard_D4s_v3"},
+            "customer": "abc",
+        },
+    ),
+    "hub": ("hub", {"hub": HUB, "tenant_id": TENANT_ID}),
+    "spoke": ("spoke", {"hub": HUB, "topology": spoke_topology(1)}),
+    "spoke-egress": (
+        "spoke",
+        {"hub": HUB, "topology": spoke_topology(2), "egress": True},
+    ),
+}
+
+
+# ItsNetworkingStacks and an AVD stack on its client subnet, in one app.
+# Cross-stack outputs and remote states only appear when the whole app
+# synthesizes, so these snapshots come from one full synth.
+SPLIT = ["split-core", "split-security", "split-egress", "split-gateway", "split-avd"]
+
+
+def build(app, name):
+    key, kwargs = CASES[name]
+    return stack_class(key)(app, name, **kwargs)
+
+
+def matrix(test):
+    # One test per case, grouped so that under pytest-xdist --dist loadgroup
+    # every test of a case runs on the worker that already synthesized it
+    return pytest.mark.parametrize(
+        "case",
+        [pytest.param(name, marks=pytest.mark.xdist_group(name)) for name in CASES],
+    )(test)
+
+
+@matrix
+def test_synth_matches_snapshot(case, synthesized, snapshots):
+    differences = snapshots.check(case, synthesized(case, build))
+    if differences is None:
+        pytest.skip(f"wrote snapshot {snapshots.path(case)}")
+    assert not differences, format_diff(case, differences)
+
+
+@matrix
+def test_synth_passes_policy(case, synthesized):
+    findings = PolicyEngine().check(synthesized(case, build), case)
+    assert not [f for f in findings if f.severity == "error"], findings
+
+
+@pytest.fixture(scope="session")
+def split_app(jsii_kernel, tmp_path_factory):
+    from cdktf import App
+
+    from its_cdktf_base.compute import ItsVirtualDesktopStack
+    from its_cdktf_base.network import ItsNetworkingStacks
+
+    outdir = tmp_path_factory.mktemp("split")
+    app = App(outdir=str(outdir))
+    network = ItsNetworkingStacks(app, "split", customer="abc")
+    ItsVirtualDesktopStack(
+        app, "split-avd", subnet_id=network.subnet_id("client"), customer="abc"
+    )
+    app.synth()
+    return {
+        name: json.loads((outdir / "stacks" / name / "cdk.tf.json").read_text())
+        for name in SPLIT
+    }
+
+
+def split(test):
+    return pytest.mark.parametrize(
+        "stack",
+        [pytest.param(name, marks=pytest.mark.xdist_group("split")) for name in SPLIT],
+    )(test)
+
+
+@split
+def test_split_stacks_match_snapshot(stack, split_app, snapshots):
+    differences = snapshots.check(stack, split_app[stack])
+    if differences is None:
+        pytest.skip(f"wrote snapshot {snapshots.path(stack)}")
+    assert not differences, format_diff(stack, differences)
+
+
+@split
+def test_split_stacks_pass_policy(stack, split_app):
+    findings = PolicyEngine().check(split_app[stack], stack)
+    assert not [f for f in findings if f.severity == "error"], findings
+
+
+def test_avd_reads_its_subnet_from_the_core_stack(split_app):
+    (nic,) = split_app["split-avd"]["resource"]["azurerm_network_interface"].values()
+    (ip_configuration,) = nic["ip_configuration"]
+    assert "data.terraform_remote_state.cross-stack-reference-input-split-core" in (
+        ip_configuration["subnet_id"]
+    )
+    assert "its-subnet-ids" in split_app["split-core"]["locals"]
+
+
+def test_structural_diff_reports_paths():
+    expected = {"resource": {"a": {"x": 1, "y": [1, 2]}, "b": {}}, "same": [1]}
+    actual = {"resource": {"a": {"x": 2, "y": [1]}, "c": {}}, "same": [1]}
+    assert structural_diff(expected, expected) == []
+    assert structural_diff(expected, actual) == [
+        ("$.resource.a.x", 1, 2),
+        ("$.resource.a.y[1]", 2, MISSING),
+        ("$.resource.b", {}, MISSING),
+        ("$.resource.c", MISSING, {}),
+    ]
+    assert len(structural_diff(expected, actual, limit=2)) == 2
+    assert structural_diff([{"a": 1}], {"a": 1}) == [("$", [{"a": 1}], {"a": 1})]
+
+    message = format_diff("network", structural_diff(expected, actual), limit=1)
+    assert "$.resource.a.x: expected 1, got 2" in message
+    assert "and 3 more" in message
+
+
+def test_cdktf_version_is_not_part_of_a_snapshot():
+    config = {"//": {"metadata": {"version": "0.17.3", "stackName": "network"}}}
+    assert normalize(config) == {"//": {"metadata": {"stackName": "network"}}}
+    assert config["//"]["metadata"]["version"] == "0.17.3"
+    assert normalize({"resource": {}}) == {"resource": {}}
+
+
+def test_snapshots_are_written_once_then_compared(tmp_path):
+    store = SnapshotStore(str(tmp_path), update=False)
+    config = {"resource": {"azurerm_subnet": {"a": {"name": "a"}}}}
+    assert store.check("network", config) is None
+    assert json.loads((tmp_path / "network.json").read_text()) == config
+    assert store.check("network", config) == []
+
+    changed = {"resource": {"azurerm_subnet": {"a": {"name": "b"}}}}
+    assert store.check("network", changed) == [
+        ("$.resource.azurerm_subnet.a.name", "a", "b")
+    ]
+    assert SnapshotStore(str(tmp_path), update=True).check("network", changed) is None
+    assert store.check("network", changed) == []
+
+
+def test_unknown_subnet_tiers_are_rejected(jsii_kernel):
+    from its_cdktf_base.network import ItsNetworkingStacks
+
+    network = ItsNetworkingStacks(jsii_kernel.app(), "split")
+    with pytest.raises(ValueError, match="nowhere"):
+        network.subnet_id("nowhere")
+
+
+@pytest.mark.xdist_group("network-default")
+def test_per_tier_resources_move_to_their_tier(synthesized):
+    config = synthesized("network-default", build)
+    moves = {block["from"]: block["to"] for block in config["moved"]}
+    assert moves["azurerm_subnet.its-client-subnet"] == (
+        'azurerm_subnet.its-subnets["client"]'
+    )
+    assert moves["azurerm_network_security_group.its-dmz-nsg"] == (
+        'azurerm_network_security_group.its-nsgs["dmz"]'
+    )
+    assert moves[
+        "azurerm_subnet_network_security_group_association.its-server-nsg-association"
+    ] == (
+        'azurerm_subnet_network_security_group_association.its-nsg-associations["server"]'
+    )
+    # Only the tiers routed through the nat gateway had an association
+    natgw_moves = [
+        source
+        for source in moves
+        if source.startswith("azurerm_subnet_nat_gateway_association.")
+    ]
+    assert sorted(natgw_moves) == [
+        "azurerm_subnet_nat_gateway_association.its-client-natgw-association",
+        "azurerm_subnet_nat_gateway_association.its-server-natgw-association",
+    ]
+    # Every move lands on an instance the stack declares
+    for target in moves.values():
+        resource_type, rest = target.split(".", 1)
+        name, key = rest.split("[")
+        assert key.strip('"]') in config["resource"][resource_type][name]["for_each"]
@@ -0,0 +1,81 @@
+import json
+import os
+
+from its_cdktf_base.synth.cache import SynthCache, app_context, cache_key
+
+NETWORK = "its_cdktf_base.network:ItsNetworkingStackBase"
+AVD = "its_cdktf_base.compute:ItsVirtualDesktopStack"
+
+
+def app(avd_kwargs: dict = None) -> list:
+    # The members of one customer's app, as the synth driver passes them
+    return [
+        ("abc-network", NETWORK, {"customer": "abc"}),
+        ("abc-avd", AVD, {"customer": "abc", **(avd_kwargs or {})}),
+    ]
+
+
+def network_key(members: list, cdktf_json: str = "cdktf.json") -> str:
+    return cache_key(NETWORK, "abc-network", {"customer": "abc"}, cdktf_json, members)
+
+
+def stack_dir(tmp_path, name: str, size: int = 10) -> str:
+    path = tmp_path / "out" / name
+    path.mkdir(parents=True)
+    (path / "cdk.tf.json").write_text("x" * size)
+    return str(path)
+
+
+def test_key_changes_with_the_stack_and_its_app(tmp_path):
+    key = network_key(app())
+    assert network_key(app()) == key
+    assert cache_key(NETWORK, "abc-network", {"customer": "def"}, app=app()) != key
+    assert cache_key(NETWORK, "def-network", {"customer": "abc"}, app=app()) != key
+    # A sibling stack's change can change this stack's outputs and data sources
+    assert network_key(app({"session_hosts": {"count": 4}})) != key
+    assert network_key(app()[:1]) != key
+    assert network_key(list(reversed(app()))) != key
+
+    # So does a context value such as an injected tenant id
+    cdktf_json = tmp_path / "cdktf.json"
+    cdktf_json.write_text(json.dumps({"context": {"tenantId": "t"}}))
+    assert app_context(str(cdktf_json)) == {"tenantId": "t"}
+    assert network_key(app(), str(cdktf_json)) != key
+
+
+def test_get_counts_hits_and_misses(tmp_path):
+    cache = SynthCache(str(tmp_path / "cache"))
+    key = network_key(app())
+    assert cache.get(key) is None
+
+    cache.put(key, stack_dir(tmp_path, "abc-network"), {"version": "v"})
+    path = cache.get(key)
+    assert path == cache.entry_path(key)
+    restored = str(tmp_path / "restored")
+    assert cache.restore(path, restored) == {"version": "v"}
+    assert (tmp_path / "restored" / "cdk.tf.json").read_text() == "x" * 10
+
+    # A changed sibling misses
+    assert cache.get(network_key(app({"session_hosts": {"count": 4}}))) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert cache.record() == {"hits": 1, "misses": 2}
+    assert SynthCache(str(tmp_path / "cache")).record(misses=1) == {
+        "hits": 1,
+        "misses": 3,
+    }
+
+
+def test_evict_removes_the_least_recently_used_entries(tmp_path):
+    cache = SynthCache(str(tmp_path / "cache"), max_bytes=250)
+    for age, name in enumerate("abc"):
+        cache.put(name, stack_dir(tmp_path, name, size=100), {"stack": name})
+        # Entries used earlier have older mtimes
+        os.utime(cache.entry_path(name), (1000 + age, 1000 + age))
+    # Using a refreshes it, so b is now the least recently used
+    assert cache.get("a")
+    assert cache.size() > 250
+
+    assert cache.evict() == 1
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    assert cache.evict() == 0
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from its_cdktf_base.synth.driver import synth_all, synth_customer
+
+SUBNET_ID = (
+    "/subscriptions/00000000-0000-0000-0000-000000000000/resourceGroups/"
+    "its-networking-stack/providers/Microsoft.Network/virtualNetworks/its-vnet/"
+    "subnets/its-client-subnet"
+)
+ENTRY = {
+    "customer": "abc",
+    "stacks": {"network": {}, "avd": {"subnet_id": SUBNET_ID}},
+}
+
+
+@pytest.fixture
+def cdktf():
+    pytest.importorskip("cdktf")
+    pytest.importorskip("imports.azurerm")
+
+
+def stack_names(app_outdir) -> list:
+    with open(app_outdir / "manifest.json") as f:
+        return sorted(json.load(f)["stacks"])
+
+
+def test_synth_customer_into_a_fresh_outdir(cdktf, tmp_path):
+    result = synth_customer(ENTRY, str(tmp_path / "build"))
+    assert "error" not in result, result.get("error")
+    app_outdir = tmp_path / "build" / "abc" / "cdktf.out"
+    assert stack_names(app_outdir) == ["abc-avd", "abc-network"]
+    assert (app_outdir / "stacks" / "abc-network" / "cdk.tf.json").is_file()
+    assert sorted(result["changed"]) == ["abc-avd", "abc-network"]
+    assert not (tmp_path / "build" / "abc" / "cdktf.out.staging").exists()
+
+
+def test_synth_all_then_restore_from_the_cache(cdktf, tmp_path):
+    outdir, cache_dir = str(tmp_path / "build"), str(tmp_path / "cache")
+    reports = []
+
+    (first,) = synth_all(
+        [ENTRY], outdir, max_workers=1, cache_dir=cache_dir, report=reports.append
+    )
+    assert "error" not in first, first.get("error")
+    assert not first["cached"]
+    assert sorted(first["changed"]) == ["abc-avd", "abc-network"]
+
+    # Nothing changed, so the second run restores every stack from the cache
+    # into a fresh outdir without starting JSII
+    fresh = str(tmp_path / "fresh")
+    (second,) = synth_all(
+        [ENTRY], fresh, max_workers=1, cache_dir=cache_dir, report=reports.append
+    )
+    assert "error" not in second, second.get("error")
+    assert second["cached"]
+    assert stack_names(tmp_path / "fresh" / "abc" / "cdktf.out") == [
+        "abc-avd",
+        "abc-network",
+    ]
+    assert (
+        tmp_path / "fresh" / "abc" / "cdktf.out" / "stacks" / "abc-avd" / "cdk.tf.json"
+    ).read_text() == (
+        tmp_path / "build" / "abc" / "cdktf.out" / "stacks" / "abc-avd" / "cdk.tf.json"
+    ).read_text()
+    assert any("2 hits" in line for line in reports)